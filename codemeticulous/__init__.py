@@ -1,3 +1,28 @@
-from .convert import convert, to_canonical, from_canonical
+import sys
+from importlib import import_module
+from types import ModuleType
 
-__all__ = ["convert", "to_canonical", "from_canonical"]
+# the public API is imported on first use rather than up front, so that light entry points
+# like the daemon client (codemeticulous.daemon) can start without loading every model
+_EXPORTS = {
+    "convert": "codemeticulous.convert",
+    "to_canonical": "codemeticulous.convert",
+    "from_canonical": "codemeticulous.convert",
+    "convert_to_many": "codemeticulous.convert",
+    "iter_convert": "codemeticulous.convert",
+    "convert_many": "codemeticulous.batch",
+}
+
+__all__ = list(_EXPORTS)
+
+
+class _Package(ModuleType):
+    # importing the codemeticulous.convert submodule sets it as the "convert" attribute of
+    # this package, so exports take precedence over attributes to keep `convert` a function
+    def __getattribute__(self, name):
+        if name in _EXPORTS:
+            return getattr(import_module(_EXPORTS[name]), name)
+        return super().__getattribute__(name)
+
+
+sys.modules[__name__].__class__ = _Package
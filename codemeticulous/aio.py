@@ -0,0 +1,114 @@
+"""
+asyncio entry points that run conversion on an executor so the event loop is never blocked
+"""
+
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import Executor
+from functools import partial
+from typing import AsyncIterable, AsyncIterator, Iterable, Optional
+
+from codemeticulous.batch import RecordResult, _convert_chunk
+from codemeticulous.convert import convert
+
+
+async def aconvert(
+    source_format: str,
+    target_format: str,
+    source_data,
+    executor: Optional[Executor] = None,
+    **custom_fields,
+):
+    """
+    Coroutine version of convert, see convert for the arguments.
+
+    Validation and conversion run on executor, or the event loop's default executor if None.
+    Use a ProcessPoolExecutor (e.g. with batch.init_worker as initializer) for large
+    records, since threads still share the GIL with the event loop. Cancelling the
+    coroutine cancels the work if it hasn't started yet, otherwise the result is discarded
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor,
+        partial(convert, source_format, target_format, source_data, **custom_fields),
+    )
+
+
+async def aconvert_many(
+    source_format: str,
+    target_formats: str | list[str],
+    records: Iterable | AsyncIterable,
+    executor: Optional[Executor] = None,
+    limit: Optional[int] = None,
+    ordered: bool = True,
+    **custom_fields,
+) -> AsyncIterator[RecordResult]:
+    """
+    Asynchronous version of batch.convert_many, yielding a RecordResult for each record.
+
+    Args:
+    - source_format, target_formats, ordered, custom_fields: see batch.convert_many
+    - records: iterable or async iterable of records, consumed lazily
+    - executor: executor to run conversions on, defaults to the event loop's default
+    - limit: maximum number of records converted concurrently, defaults to the number of
+      cpus. This also bounds how far ahead of the consumer records are read
+
+    Closing the iterator or cancelling the task consuming it cancels all pending conversions
+    """
+    if isinstance(target_formats, str):
+        target_formats = [target_formats]
+    limit = limit or os.cpu_count() or 1
+    if limit < 1:
+        raise ValueError(f"limit must be at least 1, got {limit}")
+    loop = asyncio.get_running_loop()
+    convert_chunk = partial(
+        _convert_chunk, source_format, list(target_formats), custom_fields
+    )
+
+    def submit(index, record):
+        return loop.run_in_executor(executor, convert_chunk, [(index, record)])
+
+    pending = deque() if ordered else set()
+    try:
+        index = 0
+        async for record in _aiter(records):
+            if len(pending) >= limit:
+                for result in await _next_done(pending, ordered):
+                    yield result
+            future = submit(index, record)
+            if ordered:
+                pending.append(future)
+            else:
+                pending.add(future)
+            index += 1
+        while pending:
+            for result in await _next_done(pending, ordered):
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def _next_done(pending, ordered: bool) -> list[RecordResult]:
+    """wait for the next pending conversion (the oldest if ordered) and remove it"""
+    if ordered:
+        # only remove the future once it is done, so it is still cancelled on the way out
+        results = await pending[0]
+        pending.popleft()
+        return results
+    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    results = []
+    for future in done:
+        pending.remove(future)
+        results.extend(future.result())
+    return results
+
+
+async def _aiter(records: Iterable | AsyncIterable):
+    if hasattr(records, "__aiter__"):
+        async for record in records:
+            yield record
+    else:
+        for record in records:
+            yield record
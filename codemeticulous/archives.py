@@ -0,0 +1,144 @@
+"""
+Reading metadata files straight out of tar and zip archives (e.g. release tarballs)
+without extracting them
+
+A file in an archive is referred to as ARCHIVE!MEMBER, e.g.
+"releases/pkg-1.0.tar.gz!pkg-1.0/CITATION.cff", which files.read_input and
+files.load_file_autodetect accept wherever a path is expected. Only the members that are
+asked for are read, the rest of the archive is skipped.
+"""
+
+import os
+import posixpath
+import tarfile
+import zipfile
+from pathlib import PurePosixPath
+from typing import Iterator, Optional
+
+from codemeticulous.limits import LimitExceeded, RecordLimits
+
+# separates the path of an archive from the name of a member in it
+MEMBER_SEPARATOR = "!"
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ZIP_SUFFIXES = (".zip",)
+ARCHIVE_SUFFIXES = TAR_SUFFIXES + ZIP_SUFFIXES
+
+
+def archive_suffix(path: str) -> Optional[str]:
+    """the archive suffix path ends with, e.g. ".tar.gz", or None"""
+    lower = path.lower()
+    for suffix in ARCHIVE_SUFFIXES:
+        if lower.endswith(suffix):
+            return suffix
+    return None
+
+
+def is_archive(path: str) -> bool:
+    return archive_suffix(path) is not None
+
+
+def member_path(archive: str, name: str) -> str:
+    return f"{archive}{MEMBER_SEPARATOR}{name}"
+
+
+def split_member_path(path: str) -> tuple[str, Optional[str]]:
+    """split ARCHIVE!MEMBER into (ARCHIVE, MEMBER), or (path, None) if path doesn't
+    refer to a member of an archive. A file that exists at path is never a member
+    """
+    if MEMBER_SEPARATOR not in path or os.path.exists(path):
+        return path, None
+    start = 0
+    while (index := path.find(MEMBER_SEPARATOR, start)) != -1:
+        if is_archive(path[:index]):
+            return path[:index], path[index + 1 :]
+        start = index + 1
+    return path, None
+
+
+def safe_member_name(name: str) -> Optional[str]:
+    """name of a member as a relative posix path, or None for absolute names or ones
+    pointing outside of the archive, which are never used to name outputs
+    """
+    name = posixpath.normpath(name.replace("\\", "/"))
+    if name.startswith("/") or name == ".." or name.startswith("../"):
+        return None
+    return name
+
+
+def iter_members(archive: str, pattern: str = "*") -> Iterator[str]:
+    """names of the regular files in an archive whose path matches pattern, in the order
+    they are stored. Patterns match from the right like Path.rglob, e.g. "codemeta.json"
+    matches "pkg-1.0/codemeta.json"
+    """
+    if archive_suffix(archive) in ZIP_SUFFIXES:
+        with zipfile.ZipFile(archive) as zip_file:
+            for info in zip_file.infolist():
+                if not info.is_dir() and _matches(info.filename, pattern):
+                    yield info.filename
+        return
+    # stream mode reads the headers in one pass, skipping over the data of each member
+    with tarfile.open(archive, "r|*") as tar:
+        for info in tar:
+            if info.isfile() and _matches(info.name, pattern):
+                yield info.name
+
+
+def read_members(
+    archive: str, pattern: str = "*", limits: Optional[RecordLimits] = None
+) -> Iterator[tuple[str, Optional[bytes]]]:
+    """(name, data) of the regular files in an archive whose path matches pattern, like
+    iter_members but reading each member in the same pass that finds it, so that a
+    compressed tar is only decompressed once. The data of a member over the max_bytes of
+    limits is None, it is left for read_member to refuse
+    """
+    limits = limits or RecordLimits()
+    if archive_suffix(archive) in ZIP_SUFFIXES:
+        with zipfile.ZipFile(archive) as zip_file:
+            for info in zip_file.infolist():
+                if not info.is_dir() and _matches(info.filename, pattern):
+                    if _within(limits, info.file_size):
+                        yield info.filename, zip_file.read(info)
+                    else:
+                        yield info.filename, None
+        return
+    with tarfile.open(archive, "r|*") as tar:
+        for info in tar:
+            if info.isfile() and _matches(info.name, pattern):
+                if _within(limits, info.size):
+                    yield info.name, tar.extractfile(info).read()
+                else:
+                    yield info.name, None
+
+
+def _within(limits: RecordLimits, size: int) -> bool:
+    try:
+        limits.check_size(size)
+    except LimitExceeded:
+        return False
+    return True
+
+
+def _matches(name: str, pattern: str) -> bool:
+    name = safe_member_name(name)
+    return name is not None and PurePosixPath(name).match(pattern)
+
+
+def read_member(
+    archive: str, name: str, limits: Optional[RecordLimits] = None
+) -> bytes:
+    """read a member of an archive. The size of the member is checked against the
+    max_bytes of limits before it is read
+    """
+    limits = limits or RecordLimits()
+    if archive_suffix(archive) in ZIP_SUFFIXES:
+        with zipfile.ZipFile(archive) as zip_file:
+            info = zip_file.getinfo(name)
+            limits.check_size(info.file_size)
+            return zip_file.read(info)
+    with tarfile.open(archive, "r|*") as tar:
+        for info in tar:
+            if info.name == name and info.isfile():
+                limits.check_size(info.size)
+                return tar.extractfile(info).read()
+    raise FileNotFoundError(f"No such member in {archive}: {name}")
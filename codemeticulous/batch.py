@@ -0,0 +1,547 @@
+"""
+Conversion of many records at once, spread over a pool of worker processes or threads
+"""
+
+import contextlib
+import os
+import time
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from codemeticulous.bundle import Bundle
+from codemeticulous.codemeta.models import schemaorg_class
+from codemeticulous.convert import STANDARDS, convert_to_many
+from codemeticulous.failures import (
+    error_class,
+    error_fields,
+    error_stage,
+    failure_stage,
+)
+from codemeticulous.files import (
+    dump_data,
+    load_file_autodetect,
+    open_file,
+    read_ahead as read_files_ahead,
+    read_input,
+    write_data,
+)
+from codemeticulous.limits import RecordLimits
+
+# schema.org types that commonly show up in records, including the "@type" of nested values
+# resolved dynamically by CodeMeta.validate_sub_type. pydantic2_schemaorg imports the classes
+# a model refers to the first time it is instantiated, so doing this once when a worker
+# starts keeps the first records each worker sees from paying for it
+WARM_SCHEMAORG_TYPES = [
+    "Person",
+    "Organization",
+    "Role",
+    "PropertyValue",
+    "PostalAddress",
+    "ComputerLanguage",
+    "CreativeWork",
+    "MediaObject",
+    "SoftwareApplication",
+    "SoftwareSourceCode",
+    "WebApplication",
+    "MobileApplication",
+    "ScholarlyArticle",
+    "Article",
+    "Book",
+    "Dataset",
+    "WebPage",
+    "WebSite",
+    "Blog",
+    "Thesis",
+    "Report",
+]
+
+DEFAULT_CHUNKSIZE = 16
+EXECUTORS = ("process", "thread")
+
+
+@dataclass
+class RecordError:
+    """picklable description of an exception raised while converting a record
+
+    stage is the step of the conversion that failed, and error_class and fields describe
+    validation errors (see codemeticulous.failures)
+    """
+
+    error_type: str
+    message: str
+    stage: Optional[str] = None
+    error_class: Optional[str] = None
+    fields: list[dict] = field(default_factory=list)
+
+    @classmethod
+    def from_exception(cls, exc: Exception) -> "RecordError":
+        fields = error_fields(exc)
+        return cls(
+            error_type=type(exc).__name__,
+            message=str(exc),
+            stage=error_stage(exc),
+            error_class=error_class(exc, fields),
+            fields=fields,
+        )
+
+    def __str__(self):
+        return f"{self.error_type}: {self.message}"
+
+
+@dataclass
+class RecordResult:
+    """outcome of converting a single record in a batch
+
+    index is the position of the record in the input, outputs maps each target format
+    to the converted instance and is None if conversion failed, in which case error is set.
+    seconds is the time spent converting the record
+    """
+
+    index: int
+    outputs: Optional[dict[str, Any]] = None
+    error: Optional[RecordError] = None
+    seconds: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def init_worker():
+    """warm up a worker process by loading the models and common schema.org classes"""
+    for type_ in WARM_SCHEMAORG_TYPES:
+        model_class = schemaorg_class(type_)
+        if model_class is not None:
+            model_class()
+
+
+def _convert_chunk(source_format, target_formats, custom_fields, chunk, limits=None):
+    limits = limits or RecordLimits()
+    results = []
+    for index, record in chunk:
+        start = time.perf_counter()
+        try:
+            with limits.deadline():
+                limits.check_record(record)
+                outputs = convert_to_many(
+                    source_format, target_formats, record, **custom_fields
+                )
+        except Exception as e:
+            result = RecordResult(index, error=RecordError.from_exception(e))
+        else:
+            result = RecordResult(index, outputs=outputs)
+        result.seconds = time.perf_counter() - start
+        results.append(result)
+    return results
+
+
+def load_input(
+    input_path: str,
+    limits: Optional[RecordLimits] = None,
+    content: Optional[bytes | Exception] = None,
+):
+    """load an input file, checking its size and structure against limits. content is
+    the contents of the file if it was already read, or the exception reading it raised
+    (see files.load_file_autodetect)
+    """
+    limits = limits or RecordLimits()
+    if content is None:
+        try:
+            content = read_input(input_path, limits)
+        except OSError as e:
+            # reported by load_file_autodetect, like other failures to load
+            content = e
+    elif isinstance(content, bytes):
+        limits.check_payload(content)
+    input_data = load_file_autodetect(input_path, content)
+    limits.check_record(input_data)
+    return input_data
+
+
+def _load_and_convert(
+    source_format, input_path, target_formats, limits, content, **custom_fields
+):
+    limits = limits or RecordLimits()
+    with limits.deadline():
+        input_data = load_input(input_path, limits, content)
+        return convert_to_many(
+            source_format, list(target_formats), input_data, **custom_fields
+        )
+
+
+def serialize_file(
+    source_format: str,
+    input_path: str,
+    formats: dict[str, str],
+    limits: Optional[RecordLimits] = None,
+    content: Optional[bytes] = None,
+    **custom_fields,
+) -> dict[str, str]:
+    """load a file and convert it to each target format, returns the serialized
+    outputs. formats maps each target format to the format ("json" or "yaml") it is
+    serialized as. content is the contents of the input file if it was already read
+    """
+    outputs = _load_and_convert(
+        source_format, input_path, formats, limits, content, **custom_fields
+    )
+    return {
+        target_format: dump_data(outputs[target_format], format)
+        for target_format, format in formats.items()
+    }
+
+
+def convert_file(
+    source_format: str,
+    input_path: str,
+    output_paths: dict[str, str],
+    limits: Optional[RecordLimits] = None,
+    content: Optional[bytes] = None,
+    **custom_fields,
+):
+    """load a file, convert it to each target format and write the results to the
+    corresponding output paths as they are serialized. content is the contents of the
+    input file if it was already read
+    """
+    outputs = _load_and_convert(
+        source_format, input_path, output_paths, limits, content, **custom_fields
+    )
+    for target_format, output_path in output_paths.items():
+        with failure_stage("write"):
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            output_file = open_file(output_path, "w")
+        try:
+            with output_file:
+                write_data(
+                    outputs[target_format],
+                    STANDARDS[target_format]["format"],
+                    output_file,
+                )
+        except Exception:
+            # don't leave a partly written output behind
+            with contextlib.suppress(OSError):
+                os.remove(output_path)
+            raise
+
+
+def _convert_file_chunk(source_format, custom_fields, chunk, limits=None, formats=None):
+    # with formats, the outputs are serialized and sent back to be added to a bundle
+    # instead of being written by the worker
+    results = []
+    for index, (input_path, output_paths, *content) in chunk:
+        start = time.perf_counter()
+        try:
+            if formats is None:
+                convert_file(
+                    source_format,
+                    input_path,
+                    output_paths,
+                    limits,
+                    *content,
+                    **custom_fields,
+                )
+                outputs = output_paths
+            else:
+                texts = serialize_file(
+                    source_format,
+                    input_path,
+                    {
+                        target_format: formats[target_format]
+                        for target_format in output_paths
+                    },
+                    limits,
+                    *content,
+                    **custom_fields,
+                )
+                outputs = {
+                    target_format: (name, texts[target_format])
+                    for target_format, name in output_paths.items()
+                }
+        except Exception as e:
+            result = RecordResult(index, error=RecordError.from_exception(e))
+        else:
+            result = RecordResult(index, outputs=outputs)
+        result.seconds = time.perf_counter() - start
+        results.append(result)
+    return results
+
+
+def chunked(
+    items: Iterable, size: int, indexed: bool = False
+) -> Iterator[list[tuple[int, Any]]]:
+    """lazily group items into lists of (index, item) pairs of at most size elements.
+    If indexed, items already are (index, item) pairs
+    """
+    chunk = []
+    for index, item in items if indexed else enumerate(items):
+        chunk.append((index, item))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def resolve_workers(workers: Optional[int]) -> int:
+    if workers is None:
+        return os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+    return workers
+
+
+def make_executor(executor: str, workers: int):
+    """create a pool of warm workers, either processes or threads. Threads share the
+    models of the calling process, so those are warmed up once before starting the pool.
+    Conversion keeps no shared mutable state, so threads scale across cores on a
+    free-threaded build of python, but are serialized by the GIL otherwise
+    """
+    if executor == "process":
+        return ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+    elif executor == "thread":
+        init_worker()
+        return ThreadPoolExecutor(max_workers=workers)
+    raise ValueError(
+        f"Unknown executor: {executor}. Expected one of {', '.join(EXECUTORS)}"
+    )
+
+
+def timed_out(results: list[RecordResult]) -> bool:
+    return any(
+        result.error is not None and result.error.error_type == "RecordTimeout"
+        for result in results
+    )
+
+
+def run_chunks(
+    fn,
+    chunks: Iterable[list],
+    workers: int,
+    ordered: bool = True,
+    executor: str = "process",
+    recycle: Optional[Callable[[list], bool]] = None,
+    make_pool: Optional[Callable[[], Executor]] = None,
+    submit: Optional[Callable[[Executor, Callable, list], Future]] = None,
+    collect: Optional[Callable[[Future], list]] = None,
+) -> Iterator:
+    """apply fn to each chunk in a pool of worker processes or threads, yielding each of
+    the results that fn returns for a chunk. At most 2 chunks per worker are in flight at
+    a time, so the input is consumed lazily. With a single worker everything is run in
+    the calling thread
+
+    recycle is called with the results of each chunk. If it returns True (e.g. a worker
+    was interrupted by a timeout) the pool is replaced by a new one, and the old one is
+    shut down once the chunks it was given are done
+
+    make_pool creates the pools instead of make_executor. submit(pool, fn, chunk) and
+    collect(future) replace pool.submit(fn, chunk) and future.result(), for chunks that
+    are handed to the workers some other way (see shm.convert_payloads). collect is
+    called once for each chunk submitted, in the calling thread
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(
+            f"Unknown executor: {executor}. Expected one of {', '.join(EXECUTORS)}"
+        )
+    if workers == 1:
+        for chunk in chunks:
+            yield from fn(chunk)
+        return
+
+    chunks = iter(chunks)
+    make_pool = make_pool or partial(make_executor, executor, workers)
+    pool = make_pool()
+    retired = []
+
+    def results_of(future):
+        nonlocal pool
+        results = future.result() if collect is None else collect(future)
+        if recycle is not None and future.pool is pool and recycle(results):
+            retired.append(pool)
+            pool.shutdown(wait=False)
+            pool = make_pool()
+        return results
+
+    def submit_chunk(chunk):
+        if submit is None:
+            future = pool.submit(fn, chunk)
+        else:
+            future = submit(pool, fn, chunk)
+        future.pool = pool
+        return future
+
+    try:
+        max_pending = workers * 2
+        if ordered:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(submit_chunk(chunk))
+                if len(pending) >= max_pending:
+                    yield from results_of(pending.popleft())
+            while pending:
+                yield from results_of(pending.popleft())
+        else:
+            pending = set()
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                    else:
+                        pending.add(submit_chunk(chunk))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from results_of(future)
+    finally:
+        for old_pool in retired:
+            old_pool.shutdown(wait=True, cancel_futures=True)
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def convert_many(
+    source_format: str,
+    target_formats: str | list[str],
+    records: Iterable,
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    executor: str = "process",
+    limits: Optional[RecordLimits] = None,
+    **custom_fields,
+) -> Iterator[RecordResult]:
+    """
+    Convert many records from one metadata standard to one or more others, using a pool
+    of worker processes or threads.
+
+    Records are read lazily and sent to the workers in chunks. A record that fails to
+    convert does not stop the batch, its RecordResult has the error set instead.
+
+    Args:
+    - source_format: string representation of the source metadata standard
+    - target_formats: target metadata standard, or a list of them. Every record is
+      converted to each target
+    - records: iterable of dicts or pydantic.BaseModel instances of the source standard
+    - workers: number of worker processes, defaults to the number of cpus. With 1 worker
+      records are converted in the calling process
+    - ordered: yield results in input order, or as soon as they are ready if False
+    - chunksize: number of records sent to a worker at a time
+    - executor: "process" (the default) or "thread". Threads avoid pickling records and
+      results, and run in parallel on a free-threaded (3.13t) build of python. Input
+      records are never modified, so the same dicts can be shared between threads
+    - limits: RecordLimits on each record (see codemeticulous.limits). Timeouts only
+      apply to worker processes, or with 1 worker when called from the main thread. The
+      pool of workers is replaced after a timeout
+    - custom_fields: additional fields to add to each target metadata instance
+    """
+    if isinstance(target_formats, str):
+        target_formats = [target_formats]
+    fn = partial(
+        _convert_chunk,
+        source_format,
+        list(target_formats),
+        custom_fields,
+        limits=limits,
+    )
+    return run_chunks(
+        fn,
+        chunked(records, chunksize),
+        resolve_workers(workers),
+        ordered=ordered,
+        executor=executor,
+        recycle=timed_out if limits and limits.timeout else None,
+    )
+
+
+def convert_files(
+    source_format: str,
+    jobs: Iterable[tuple[str, dict[str, str]]],
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    chunksize: int = 1,
+    executor: str = "process",
+    limits: Optional[RecordLimits] = None,
+    read_ahead: Optional[int] = None,
+    bundle: Optional[Bundle] = None,
+    **custom_fields,
+) -> Iterator[RecordResult]:
+    """
+    Convert many files, reading the input and writing the outputs in the worker processes
+    so that only paths are sent between processes.
+
+    Args:
+    - source_format: string representation of the source metadata standard
+    - jobs: iterable of (input_path, output_paths) where output_paths maps each target
+      format to the path the converted metadata is written to, or of (input_path,
+      output_paths, content) where content is the input already read (see
+      files.InputFile.content)
+    - read_ahead: read the input files in the calling process instead, keeping this many
+      reads in flight (see files.read_ahead). Worth it when each read has a high latency,
+      e.g. many small files on network storage. Unless ordered, files are converted in
+      the order their reads complete
+    - bundle: add the outputs to this bundle (see codemeticulous.bundle) instead of
+      writing them to files, output_paths then are the names of the outputs in the
+      bundle. The workers send the serialized outputs back and they are added to the
+      bundle as results come in, so the bundle is the only file written to
+    - workers, ordered, chunksize, executor, limits, custom_fields: see convert_many
+
+    The outputs of each RecordResult are the output_paths of the job
+    """
+    fn = partial(
+        _convert_file_chunk,
+        source_format,
+        custom_fields,
+        limits=limits,
+        formats=None if bundle is None else bundle.formats(list(STANDARDS)),
+    )
+    if read_ahead:
+        chunks = chunked(
+            (
+                (index, (job[0], job[1], content))
+                for index, job, content in read_files_ahead(
+                    jobs, read_ahead, ordered=ordered, read=_read_job
+                )
+            ),
+            chunksize,
+            indexed=True,
+        )
+    else:
+        chunks = chunked(jobs, chunksize)
+    results = run_chunks(
+        fn,
+        chunks,
+        resolve_workers(workers),
+        ordered=ordered,
+        executor=executor,
+        recycle=timed_out if limits and limits.timeout else None,
+    )
+    if bundle is None:
+        return results
+    return _add_to_bundle(bundle, results)
+
+
+def _read_job(job) -> bytes:
+    # jobs may carry the contents of their input already, e.g. members of an archive
+    return job[2] if len(job) > 2 else read_input(job[0])
+
+
+def _add_to_bundle(bundle, results: Iterable[RecordResult]) -> Iterator[RecordResult]:
+    for result in results:
+        if result.ok:
+            for target_format, (name, text) in result.outputs.items():
+                bundle.add(name, target_format, text)
+            result.outputs = {
+                target_format: name
+                for target_format, (name, _) in result.outputs.items()
+            }
+        yield result
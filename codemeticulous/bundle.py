@@ -0,0 +1,179 @@
+"""
+Bundles: single files that batch conversion writes all of its outputs into, instead of one
+file per output, for storage where creating millions of small files costs more than the
+conversion itself
+
+A bundle is a tar archive (.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz), a zip archive (.zip),
+or an NDJSON file (.ndjson or .jsonl, optionally compressed like files.open_file) with one
+{"id": ..., "format": ..., "record": ...} line per output. Archive members carry no
+timestamps or owners, so converting the same inputs twice gives identical bundles.
+Bundles are written through one buffered file handle, to a temporary file that replaces
+the bundle once it is complete.
+"""
+
+import gzip
+import io
+import json
+import os
+import tarfile
+import zipfile
+from abc import ABC, abstractmethod
+
+from codemeticulous.archives import TAR_SUFFIXES, archive_suffix
+from codemeticulous.convert import STANDARDS
+from codemeticulous.files import CODECS, compression_of, format_extension
+
+# size of the write buffer of a bundle
+BUFFER_SIZE = 1024 * 1024
+
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+
+# date of zip members, the earliest a zip file can hold
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def _compressor(file, compression: str):
+    """a binary stream compressing into file"""
+    if compression == "gzip":
+        # no file name or timestamp in the gzip header
+        return gzip.GzipFile(filename="", mode="wb", fileobj=file, mtime=0)
+    return CODECS[compression].open(file, "wb")
+
+
+class Bundle(ABC):
+    """a file that outputs are added to one at a time, see open_bundle"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(self.temp_path, "wb", buffering=BUFFER_SIZE)
+
+    def formats(self, target_formats: list[str]) -> dict[str, str]:
+        """the serialization format of the outputs of each target"""
+        return {
+            target_format: STANDARDS[target_format]["format"]
+            for target_format in target_formats
+        }
+
+    @abstractmethod
+    def add(self, name: str, target_format: str, text: str):
+        """add the serialized output of a target under name"""
+
+    def _finish(self):
+        pass
+
+    def close(self):
+        """finish the bundle and move it into place"""
+        self._finish()
+        self._file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        """discard the bundle"""
+        try:
+            # so that the writers don't try to finish it once the file is closed
+            self._finish()
+        except Exception:
+            pass
+        self._file.close()
+        os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class TarBundle(Bundle):
+    """outputs are members of a tar archive, compressed according to its suffix"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        suffix = archive_suffix(path)
+        if suffix in (".tar.gz", ".tgz"):
+            self._stream = _compressor(self._file, "gzip")
+        elif suffix in (".tar.bz2", ".tbz2"):
+            self._stream = _compressor(self._file, "bz2")
+        elif suffix in (".tar.xz", ".txz"):
+            self._stream = _compressor(self._file, "xz")
+        else:
+            self._stream = None
+        self._tar = tarfile.open(
+            fileobj=self._stream or self._file, mode="w|", format=tarfile.PAX_FORMAT
+        )
+
+    def add(self, name: str, target_format: str, text: str):
+        data = text.encode("utf-8")
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mode = 0o644
+        info.mtime = 0
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def _finish(self):
+        self._tar.close()
+        if self._stream is not None:
+            self._stream.close()
+
+
+class ZipBundle(Bundle):
+    """outputs are deflated members of a zip archive"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._zip = zipfile.ZipFile(self._file, "w", zipfile.ZIP_DEFLATED)
+
+    def add(self, name: str, target_format: str, text: str):
+        info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        self._zip.writestr(info, text.encode("utf-8"))
+
+    def _finish(self):
+        self._zip.close()
+
+
+class NDJSONBundle(Bundle):
+    """one JSON line per output, holding the name of the output as its id, the target
+    format and the output as a JSON object. Compressed according to its extension
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        compression = compression_of(path)
+        self._text = io.TextIOWrapper(
+            self._file if compression is None else _compressor(self._file, compression),
+            encoding="utf-8",
+        )
+
+    def formats(self, target_formats: list[str]) -> dict[str, str]:
+        return {target_format: "json" for target_format in target_formats}
+
+    def add(self, name: str, target_format: str, text: str):
+        # the output is already JSON, so it is spliced in rather than parsed again
+        self._text.write(
+            f'{{"id": {json.dumps(name)}, "format": {json.dumps(target_format)}, '
+            f'"record": {text}}}\n'
+        )
+
+    def _finish(self):
+        self._text.close()
+
+
+def open_bundle(path: str) -> Bundle:
+    """open a bundle for writing, its kind is chosen from the suffix of path"""
+    if archive_suffix(path) in TAR_SUFFIXES:
+        return TarBundle(path)
+    if archive_suffix(path) == ".zip":
+        return ZipBundle(path)
+    if format_extension(path) in NDJSON_EXTENSIONS:
+        return NDJSONBundle(path)
+    raise ValueError(
+        f"Unsupported bundle: {path}. Expected a .tar, .tar.gz, .tgz, .tar.bz2, "
+        ".tar.xz, .zip, .ndjson or .jsonl file"
+    )
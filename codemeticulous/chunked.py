@@ -0,0 +1,153 @@
+"""
+Validation of a single record with very large list fields (e.g. tens of thousands of
+authors) spread over several workers
+
+Each item of a list field is validated on its own, so long lists can be cut into chunks
+that are validated in parallel and put back together in order. The rest of the record is
+validated as usual. The result is the same instance that validating the whole record at
+once would give: if anything fails, the record is validated again serially so that the
+error raised is the usual one too.
+
+Only pydantic v1 models (i.e. CodeMeta) are split, other models are validated serially.
+"""
+
+import os
+from concurrent.futures import Executor
+from functools import lru_cache, partial
+from typing import Iterable, Optional
+
+from pydantic.v1 import BaseModel
+from pydantic.v1.main import validate_model
+
+from codemeticulous.batch import make_executor
+
+ACTOR_FIELDS = (
+    "author",
+    "contributor",
+    "copyrightHolder",
+    "creator",
+    "editor",
+    "funder",
+    "maintainer",
+    "producer",
+    "provider",
+    "sponsor",
+)
+CHUNKED_FIELDS = ACTOR_FIELDS + ("citation", "softwareRequirements", "hasPart")
+DEFAULT_CHUNK_SIZE = 1000
+# lists shorter than this are validated along with the rest of the record
+DEFAULT_MIN_LENGTH = 2000
+
+
+@lru_cache(maxsize=None)
+def _without_pre_root_validators(model: type[BaseModel]) -> type[BaseModel]:
+    # validates what is left of a record after the pre root validators have been applied
+    # once, as they aren't all safe to apply twice
+    subclass = type(model)(model.__name__, (model,), {"__module__": model.__module__})
+    subclass.__pre_root_validators__ = []
+    return subclass
+
+
+def _validate_chunk(model: type[BaseModel], name: str, chunk: list) -> Optional[list]:
+    """validate part of a list field, None if it is invalid"""
+    field = model.__fields__[name]
+    value, errors = field.validate(chunk, {}, loc=field.alias, cls=model)
+    if errors:
+        return None
+    return value
+
+
+def _large_lists(model, values: dict, fields: Iterable[str], min_length: int) -> dict:
+    """the fields of values holding lists of at least min_length items, as a dict of
+    field names to the key they were given with
+    """
+    large = {}
+    for name in fields:
+        field = model.__fields__.get(name)
+        if field is None:
+            continue
+        for key in (field.alias, name):
+            value = values.get(key)
+            if isinstance(value, list) and len(value) >= min_length:
+                large[name] = key
+                break
+    return large
+
+
+def validate_chunked(
+    model: type[BaseModel],
+    data: dict,
+    executor: str | Executor = "process",
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    min_length: int = DEFAULT_MIN_LENGTH,
+    fields: Iterable[str] = CHUNKED_FIELDS,
+) -> BaseModel:
+    """validate data as an instance of model, splitting list fields of at least
+    min_length items into chunks of chunk_size that are validated in parallel
+
+    executor is "process" or "thread" for a new pool of workers (see
+    batch.make_executor), or an existing Executor, which is more efficient when
+    validating several records as starting a pool of processes takes a while. Models with
+    post root validators are validated serially, as those need to see the whole record
+    """
+    if (
+        not isinstance(model, type)
+        or not issubclass(model, BaseModel)
+        or not isinstance(data, dict)
+        or model.__post_root_validators__
+    ):
+        return model(**data)
+    try:
+        values = data
+        for validator in model.__pre_root_validators__:
+            values = validator(model, values)
+    except Exception:
+        return model(**data)
+    large = _large_lists(model, values, fields, min_length)
+    if not large:
+        return model(**data)
+
+    jobs = []
+    for name, key in large.items():
+        items = values[key]
+        jobs += [
+            (name, items[i : i + chunk_size]) for i in range(0, len(items), chunk_size)
+        ]
+    rest = {key: value for key, value in values.items() if key not in large.values()}
+    # empty lists keep the fields in __fields_set__, they are replaced once validated
+    rest.update((key, []) for key in large.values())
+
+    pool = executor
+    if isinstance(executor, str):
+        pool = make_executor(executor, min(workers or os.cpu_count() or 1, len(jobs)))
+    try:
+        chunks = list(
+            pool.map(
+                partial(_validate_chunk, model),
+                [name for name, _ in jobs],
+                [chunk for _, chunk in jobs],
+            )
+        )
+        validated, fields_set, error = validate_model(
+            _without_pre_root_validators(model), rest
+        )
+    except Exception:
+        # e.g. a worker process died, validate serially instead
+        return model(**data)
+    finally:
+        if pool is not executor:
+            pool.shutdown()
+    if error is not None or any(chunk is None for chunk in chunks):
+        return model(**data)
+
+    for name in large:
+        validated[name] = []
+    for (name, _), chunk in zip(jobs, chunks):
+        validated[name].extend(chunk)
+    # the same as BaseModel.__init__ does with what validate_model returns
+    instance = model.__new__(model)
+    object.__setattr__(instance, "__dict__", validated)
+    object.__setattr__(instance, "__fields_set__", fields_set)
+    instance._init_private_attributes()
+    return instance
@@ -1,10 +1,71 @@
+import json
 import os
+import sys
+import time
 import traceback
+from operator import attrgetter
 import click
-import json
-import yaml
 
-from codemeticulous.convert import STANDARDS, convert as _convert
+from codemeticulous.archives import is_archive
+from codemeticulous.batch import convert_files, load_input
+from codemeticulous.bundle import open_bundle
+from codemeticulous.chunked import validate_chunked
+from codemeticulous.convert import STANDARDS, convert_to_many
+from codemeticulous.daemon import (
+    default_idle_timeout,
+    default_socket_path,
+    run_daemon,
+    stop_daemon,
+)
+from codemeticulous.files import (
+    CODECS,
+    COMPRESSION_EXTENSIONS,
+    DEFAULT_NAME_TEMPLATE,
+    DEFAULT_READ_AHEAD,
+    InputFile,
+    RecordLoadError,
+    compression_of,
+    expand_inputs,
+    load_file_autodetect,
+    open_file,
+    read_ahead as read_files_ahead,
+    read_input,
+    write_data,
+)
+from codemeticulous.failures import DeadLetterWriter, failure_stage
+from codemeticulous.index import build_index, index_path_for
+from codemeticulous.journal import Journal
+from codemeticulous.limits import LimitExceeded, RecordLimits
+from codemeticulous.pipeline import (
+    CONVERSION_STAGES,
+    ByteRangeSource,
+    ExecutorSpec,
+    FilterStage,
+    IndexedSource,
+    NDJSONSink,
+    NDJSONSource,
+    build_conversion_pipeline,
+    parse_payload,
+)
+from codemeticulous.report import BatchReport, merge_reports, start_report
+from codemeticulous.server import DEFAULT_MAX_REQUEST_SIZE, serve as _serve
+from codemeticulous.shard import Shard, record_key
+from codemeticulous.spool import (
+    DEFAULT_LEASE,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_SPOOL_NAME_TEMPLATE,
+    SpoolWorker,
+)
+from codemeticulous.sync import (
+    DEFAULT_CONFIG,
+    SyncConfigError,
+    load_config as load_sync_config,
+    sync,
+)
+from codemeticulous.watch import DEFAULT_DEBOUNCE, SourceWatcher, sources_for
+
+# extension added to the outputs of --output-dir by --compress
+CODEC_EXTENSIONS = {codec: ext for ext, codec in COMPRESSION_EXTENSIONS.items()}
 
 
 @click.group()
@@ -12,6 +73,184 @@ def cli():
     pass
 
 
+def parse_shard(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return Shard.parse(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+shard_option = click.option(
+    "--shard",
+    default=None,
+    callback=parse_shard,
+    help="Only process shard i/N of the inputs (counting from 0), e.g. 0/4. Files are "
+    "assigned to shards by their path and records by their identifier, so every "
+    "shard is disjoint and stable across runs",
+)
+report_option = click.option(
+    "--report",
+    "report_path",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write a JSON summary of the run (counts, failures and timings) to this file, "
+    "see merge-reports",
+)
+
+journal_option = click.option(
+    "--journal",
+    "journal_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Append-only journal of completed inputs. Running again with the same "
+    "journal skips the inputs that were completed and haven't changed since, to resume "
+    "an interrupted batch",
+)
+
+
+def open_journal(journal_path, scope, before_sync=None):
+    """open the journal of a batch, scope holds the settings that make its outputs"""
+    if journal_path is None:
+        return None
+    try:
+        return Journal(journal_path, scope=json.dumps(scope), before_sync=before_sync)
+    except (OSError, ValueError) as e:
+        raise click.BadParameter(str(e), param_hint="--journal")
+
+
+def parse_stage_executors(ctx, param, values):
+    executors = {}
+    for value in values:
+        stage, _, spec = value.partition("=")
+        if stage not in CONVERSION_STAGES:
+            raise click.BadParameter(
+                f"Unknown stage: {stage}. Expected one of {', '.join(CONVERSION_STAGES)}"
+            )
+        try:
+            executors[stage] = ExecutorSpec.parse(spec)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    return executors
+
+
+dead_letter_option = click.option(
+    "--dead-letter",
+    "dead_letter_file",
+    type=click.File("w"),
+    default=None,
+    help="Write each failed input as a JSON line to this file, with the stage that "
+    "failed, a normalized error class, the invalid fields and the original payload",
+)
+
+
+def parse_limits(ctx, param, values):
+    try:
+        return RecordLimits.parse(values)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+limit_option = click.option(
+    "--limit",
+    "limits",
+    multiple=True,
+    metavar="NAME=VALUE",
+    callback=parse_limits,
+    help="Reject records over a limit, one of max-bytes, max-depth, max-list-length or "
+    "timeout (in seconds). Can be repeated, e.g. --limit max-depth=64 --limit timeout=10",
+)
+archives_option = click.option(
+    "--archives",
+    is_flag=True,
+    default=False,
+    help="Also search directories for tar and zip archives (.tar, .tar.gz, .tgz, "
+    ".tar.bz2, .tar.xz, .zip), and read the files matching --pattern out of them "
+    "without extracting them. Archives given as INPUTS are always searched",
+)
+read_ahead_option = click.option(
+    "--read-ahead",
+    type=click.IntRange(min=1),
+    default=None,
+    help="When processing multiple files, read this many files at a time ahead of the "
+    "ones being processed. Speeds up corpora of many small files on storage with a "
+    f"high latency per read, e.g. network file systems (try {DEFAULT_READ_AHEAD})",
+)
+
+
+def parse_ids(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        with open(value, "r") as file:
+            return [line.strip() for line in file if line.strip()]
+    except OSError as e:
+        raise click.BadParameter(str(e))
+
+
+ids_option = click.option(
+    "--ids",
+    type=click.Path(dir_okay=False),
+    default=None,
+    callback=parse_ids,
+    help="With --ndjson, only process the records identified by the ids listed in this "
+    "file (one per line: @id, id, identifier, doi, or #N for the record at position N), "
+    "fetched through the index of each input built by 'codemeticulous index'",
+)
+byte_range_option = click.option(
+    "--byte-range",
+    "byte_range",
+    default=None,
+    callback=parse_shard,
+    help="With --ndjson, only read the records in part i/N of the bytes of each input "
+    "(counting from 0), e.g. 0/4. Splits uncompressed NDJSON corpora between workers "
+    "without reading the rest of them",
+)
+
+
+def open_output(ctx, path, compression=None):
+    """open an output for writing ("-" is stdout), compressed with compression or
+    according to its extension. It is closed when the command ends
+    """
+    if path == "-":
+        if compression is None:
+            return sys.stdout
+        output = open_file(sys.stdout.buffer, "w", compression)
+    else:
+        output = open_file(path, "w", compression)
+    ctx.call_on_close(output.close)
+    return output
+
+
+def open_dead_letter(dead_letter_file):
+    return DeadLetterWriter(dead_letter_file) if dead_letter_file else None
+
+
+def file_payload(path, stage):
+    """the payload of a failed file for a dead-letter entry: the parsed data, or the raw
+    text if it could not be parsed
+    """
+    try:
+        if stage == "load":
+            return read_input(path).decode("utf-8")
+        return load_file_autodetect(path)
+    except Exception:
+        return None
+
+
+def record_payload(record):
+    if isinstance(record, Exception):
+        return getattr(record, "payload", None)
+    return record
+
+
+def write_report(report, report_path):
+    if report_path is not None:
+        report.finish()
+        report.write(report_path)
+
+
 @cli.command()
 @click.option(
     "-f",
@@ -24,19 +263,101 @@ def cli():
 @click.option(
     "-t",
     "--to",
-    "target_format",
+    "target_formats",
     type=click.Choice(STANDARDS.keys()),
     required=True,
-    help="Target format",
+    multiple=True,
+    help="Target format, can be repeated to convert to several formats at once",
 )
 @click.option(
     "-o",
     "--output",
-    "output_file",
-    type=click.File("w"),
+    "output_files",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    multiple=True,
+    help="Output file name (by default prints to stdout). When converting to several "
+    "formats, give one --output per --to, in the same order. Outputs ending in .gz, "
+    ".bz2 or .xz are compressed",
+)
+@click.option(
+    "-d",
+    "--output-dir",
+    type=click.Path(file_okay=False),
     default=None,
-    help="Output file name (by default prints to stdout)",
+    help="Directory to write outputs to when converting multiple files",
+)
+@click.option(
+    "--bundle",
+    "bundle_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the outputs of converting multiple files into this single tar (.tar, "
+    ".tar.gz, .tgz, .tar.bz2, .tar.xz) or zip (.zip) archive, as members named by "
+    "--name-template, or NDJSON (.ndjson, .jsonl, optionally compressed) file, with "
+    "one output per line, instead of --output-dir",
+)
+@click.option(
+    "--name-template",
+    default=DEFAULT_NAME_TEMPLATE,
+    show_default=True,
+    help="Output file name template used with --output-dir. Available fields: "
+    "{path} (input path relative to the directory it was found in, or as given "
+    "without a leading / or .., without extension), {name}, {stem}, {target}, {ext} (extension of the target format), "
+    "{filename} (conventional file name of the target format)",
+)
+@click.option(
+    "--pattern",
+    default=None,
+    help="File name pattern to search directories for "
+    "(defaults to the conventional file name of the source format, e.g. codemeta.json)",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of worker processes to use when converting multiple files",
+)
+@click.option(
+    "--ndjson",
+    is_flag=True,
+    default=False,
+    help="Read INPUTS (or stdin with -) as a stream of records, JSON lines, a JSON "
+    "array or ---separated YAML documents, and write one JSON record per line",
+)
+@click.option(
+    "--stage-executor",
+    "stage_executors",
+    multiple=True,
+    callback=parse_stage_executors,
+    help="With --ndjson, how a stage of the conversion runs, as STAGE=KIND[:WORKERS] "
+    "where STAGE is one of " + ", ".join(CONVERSION_STAGES) + " and KIND is inline "
+    "(the default), thread or process. e.g. --stage-executor validate=process:4",
+)
+@click.option(
+    "--compress",
+    type=click.Choice(list(CODECS)),
+    default=None,
+    help="Compress the outputs of --output-dir (adding the extension of the codec to "
+    "their names) or --ndjson (including standard output) as they are written",
+)
+@click.option(
+    "--split-lists",
+    "split_list_workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="When converting a single file, validate very long list fields (e.g. tens of "
+    "thousands of authors) in chunks on this many worker processes",
 )
+@shard_option
+@report_option
+@journal_option
+@dead_letter_option
+@limit_option
+@archives_option
+@read_ahead_option
+@ids_option
+@byte_range_option
 @click.option(
     "-v",
     "--verbose",
@@ -44,37 +365,405 @@ def cli():
     default=False,
     help="Print verbose output",
 )
-@click.argument("input_file", type=click.Path(exists=True))
-def convert(source_format: str, target_format: str, input_file, output_file, verbose):
+@click.argument("inputs", nargs=-1, required=True)
+def convert(
+    source_format: str,
+    target_formats,
+    inputs,
+    output_files,
+    output_dir,
+    bundle_path,
+    name_template,
+    pattern,
+    jobs,
+    ndjson,
+    shard,
+    report_path,
+    stage_executors,
+    compress,
+    split_list_workers,
+    journal_path,
+    dead_letter_file,
+    limits,
+    archives,
+    read_ahead,
+    ids,
+    byte_range,
+    verbose,
+):
+    """Convert INPUTS from one metadata standard to another.
+
+    INPUTS can be files, tar or zip archives (searched for --pattern), directories
+    (searched recursively for --pattern), globs or @filelist files listing one input per
+    line. Converting more than one file requires --output-dir or --bundle.
+    """
+    if output_files and output_dir is not None:
+        raise click.UsageError("--output and --output-dir are mutually exclusive")
+    if bundle_path is not None:
+        if output_files or output_dir is not None or ndjson:
+            raise click.UsageError(
+                "--bundle can't be used with --output, --output-dir or --ndjson"
+            )
+        if journal_path is not None or compress is not None:
+            raise click.UsageError(
+                "--journal and --compress can't be used with --bundle, which is "
+                "written from scratch and compressed according to its extension"
+            )
+    if output_files and len(output_files) != len(target_formats):
+        raise click.UsageError("Give one --output per --to, in the same order")
+    if (
+        len(target_formats) > 1
+        and not output_files
+        and output_dir is None
+        and bundle_path is None
+    ):
+        raise click.UsageError(
+            "Converting to several formats requires an --output for each --to, "
+            "--output-dir or --bundle"
+        )
+
+    if ndjson:
+        if output_dir is not None:
+            raise click.UsageError("--output-dir can't be used with --ndjson")
+        if read_ahead is not None:
+            raise click.UsageError("--read-ahead can't be used with --ndjson")
+        ctx = click.get_current_context()
+        convert_stream(
+            source_format,
+            target_formats,
+            inputs,
+            [
+                open_output(ctx, path, compress)
+                for path in output_files or (["-"] if compress else [])
+            ],
+            verbose,
+            shard=shard,
+            report_path=report_path,
+            journal_path=journal_path,
+            dead_letter_file=dead_letter_file,
+            stage_executors=stage_executors,
+            limits=limits,
+            ids=ids,
+            byte_range=byte_range,
+        )
+        return
+    if stage_executors:
+        raise click.UsageError("--stage-executor requires --ndjson")
+    if ids is not None or byte_range is not None:
+        raise click.UsageError("--ids and --byte-range require --ndjson")
+
+    pattern = pattern or STANDARDS[source_format]["filename"]
+    try:
+        input_files = list(expand_inputs(inputs, pattern, archives, limits))
+    except OSError as e:
+        raise click.BadParameter(str(e), param_hint="INPUTS")
+
+    if output_dir is None and bundle_path is None:
+        if len(inputs) != 1 or not os.path.isfile(inputs[0]) or is_archive(inputs[0]):
+            raise click.UsageError(
+                "--output-dir or --bundle is required when converting directories, "
+                "archives, globs, file lists or multiple files"
+            )
+        if limits or any(
+            option is not None
+            for option in (shard, report_path, journal_path, dead_letter_file)
+        ):
+            raise click.UsageError(
+                "--shard, --report, --journal, --dead-letter and --limit require "
+                "--output-dir, --bundle or --ndjson"
+            )
+        if read_ahead is not None or compress is not None:
+            raise click.UsageError(
+                "--read-ahead and --compress require --output-dir or --bundle"
+            )
+        convert_single(
+            source_format,
+            target_formats,
+            inputs[0],
+            output_files,
+            verbose,
+            split_list_workers=split_list_workers,
+        )
+        return
+    if split_list_workers is not None:
+        raise click.UsageError("--split-lists only applies to converting a single file")
+
+    if shard is not None:
+        input_files = [f for f in input_files if shard.contains(f.shard_key)]
+
+    journal = open_journal(
+        journal_path,
+        [
+            "convert",
+            source_format,
+            list(target_formats),
+            os.path.abspath(output_dir or ""),
+            name_template,
+        ],
+    )
+    jobs_list = []
+    journal_keys = []
+    skipped = 0
+    seen = {}
+    for input_file in input_files:
+        output_paths = {}
+        for target_format in target_formats:
+            # with a bundle, the output path is the name of the output in the bundle
+            output_path = input_file.output_path(
+                output_dir or "",
+                name_template,
+                target_format,
+                STANDARDS[target_format]["extension"],
+                STANDARDS[target_format]["filename"],
+            )
+            if compress is not None:
+                output_path += CODEC_EXTENSIONS[compress]
+            if output_path in seen:
+                raise click.UsageError(
+                    f"{input_file.path} ({target_format}) and {seen[output_path]} "
+                    f"would both be written to {output_path}, use a --name-template "
+                    "that includes {path} and {target}"
+                )
+            if bundle_path is None and os.path.abspath(output_path) == os.path.abspath(
+                input_file.path
+            ):
+                raise click.UsageError(f"{output_path} would overwrite its own input")
+            seen[output_path] = f"{input_file.path} ({target_format})"
+            output_paths[target_format] = output_path
+        if journal is not None:
+            key = journal.key_for_file(input_file.path)
+            if key in journal:
+                skipped += 1
+                continue
+            journal_keys.append(key)
+        if input_file.content is None:
+            jobs_list.append((input_file.path, output_paths))
+        else:
+            # a member of an archive, read when the archive was searched
+            jobs_list.append((input_file.path, output_paths, input_file.content))
+
+    failed = 0
+    report = start_report("convert", shard)
+    dead_letter = open_dead_letter(dead_letter_file)
+    bundle = None
+    if bundle_path is not None:
+        try:
+            bundle = open_bundle(bundle_path)
+        except (OSError, ValueError) as e:
+            raise click.BadParameter(str(e), param_hint="--bundle")
+    try:
+        for result in convert_files(
+            source_format,
+            jobs_list,
+            workers=jobs,
+            limits=limits,
+            read_ahead=read_ahead,
+            bundle=bundle,
+        ):
+            input_path = jobs_list[result.index][0]
+            report.add(input_path, result.seconds, result.error)
+            if not result.ok:
+                failed += 1
+                click.echo(f"Failed to convert {input_path}: {result.error}", err=True)
+                if dead_letter is not None:
+                    dead_letter.write_error(
+                        input_path,
+                        file_payload(input_path, result.error.stage),
+                        result.error,
+                    )
+            else:
+                if journal is not None:
+                    journal.add(journal_keys[result.index])
+                if verbose:
+                    click.echo(f"{input_path} -> {', '.join(result.outputs.values())}")
+    except BaseException:
+        if bundle is not None:
+            bundle.abort()
+        raise
+    else:
+        if bundle is not None:
+            bundle.close()
+    finally:
+        if journal is not None:
+            journal.close()
+
+    write_report(report, report_path)
+    click.echo(
+        f"Converted {len(jobs_list) - failed} of {len(jobs_list)} files into "
+        f"{bundle_path or output_dir}"
+        + (f", skipped {skipped} completed in an earlier run" if skipped else "")
+    )
+    if failed:
+        raise SystemExit(1)
+
+
+def convert_stream(
+    source_format,
+    target_formats,
+    inputs,
+    output_files,
+    verbose,
+    shard=None,
+    report_path=None,
+    journal_path=None,
+    dead_letter_file=None,
+    stage_executors=None,
+    limits=None,
+    ids=None,
+    byte_range=None,
+):
+    source = open_stream_source(
+        inputs, STANDARDS[source_format]["format"], limits, ids, byte_range
+    )
+    failed = 0
+    report = start_report("convert", shard)
+    dead_letter = open_dead_letter(dead_letter_file)
+    sink = NDJSONSink(dict(zip(target_formats, output_files)))
+    journal = open_journal(
+        journal_path,
+        ["convert", source_format, list(target_formats)],
+        before_sync=sink.flush,
+    )
+
+    def select(item):
+        # records are keyed by their position in the corpus, not in the selection
+        key = record_key(item.record, item.meta.get("position", item.index))
+        if shard is not None and not shard.contains(key):
+            return False
+        if journal is not None and item.ok:
+            item.meta["journal_key"] = journal.key_for_record(key, item.record)
+            if item.meta["journal_key"] in journal:
+                return False
+        return True
+
+    if limits and limits.timeout:
+        if not any(spec.kind == "process" for spec in (stage_executors or {}).values()):
+            click.echo(
+                "Warning: with --ndjson, the timeout only applies to stages run by "
+                "--stage-executor STAGE=process",
+                err=True,
+            )
+    pipeline = build_conversion_pipeline(
+        source_format,
+        list(target_formats),
+        source,
+        sink,
+        executors=stage_executors,
+        filters=[FilterStage("select", select)],
+        limits=limits,
+    )
+    try:
+        for item in pipeline.run():
+            report.add(item.name, item.seconds, item.error)
+            if item.ok:
+                if journal is not None:
+                    journal.add(item.meta.get("journal_key"))
+                continue
+            failed += 1
+            click.echo(f"Failed to convert {item.name}: {item.error.message}", err=True)
+            if dead_letter is not None:
+                dead_letter.write_error(item.name, item.record, item.error)
+            if verbose:
+                click.echo(
+                    f"  stage: {item.error.stage}, error: {item.error.error_class}",
+                    err=True,
+                )
+    finally:
+        if journal is not None:
+            journal.close()
+    warn_missing_ids(source)
+    write_report(report, report_path)
+    if failed:
+        raise SystemExit(1)
+
+
+def open_stream_source(inputs, default_format, limits, ids, byte_range):
+    if ids is not None and byte_range is not None:
+        raise click.UsageError("--ids and --byte-range are mutually exclusive")
+    try:
+        if ids is not None:
+            return IndexedSource(inputs, ids)
+        if byte_range is not None:
+            return ByteRangeSource(inputs, byte_range)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="INPUTS")
+    return NDJSONSource(inputs, default_format, limits)
+
+
+def load_item(item, limits=None):
+    """the parsed record of an item from a stream source, or the error reading it"""
+    if item.error is not None:
+        return RecordLoadError(item.error.message, item.record)
+    try:
+        return parse_payload(item.value, limits)
+    except LimitExceeded as e:
+        e.payload = item.record
+        return e
+    except Exception as e:
+        return RecordLoadError(f"Invalid JSON in {item.name}: {e}", item.record)
+
+
+def warn_missing_ids(source):
+    missing = getattr(source, "missing", None)
+    if missing:
+        click.echo(
+            f"Warning: {len(missing)} of the --ids are not in any index, e.g. "
+            + ", ".join(missing[:5]),
+            err=True,
+        )
+
+
+def convert_single(
+    source_format,
+    target_formats,
+    input_file,
+    output_files,
+    verbose,
+    split_list_workers=None,
+):
     try:
         input_data = load_file_autodetect(input_file)
     except Exception as e:
         click.echo(f"Failed to load file: {input_file}. {str(e)}", err=True)
         if verbose:
             traceback.print_exc()
+        return
     try:
-        converted_data = _convert(source_format, target_format, input_data)
+        if split_list_workers is not None:
+            with failure_stage("validate"):
+                input_data = validate_chunked(
+                    STANDARDS[source_format]["model"],
+                    input_data,
+                    workers=split_list_workers,
+                )
+        converted_data = convert_to_many(source_format, target_formats, input_data)
     except Exception as e:
         click.echo(f"Error during conversion: {str(e)}", err=True)
         if verbose:
             traceback.print_exc()
         return
 
-    output_format = STANDARDS[target_format]["format"]
+    for target_format, output_file in zip(
+        target_formats, output_files or [None] * len(target_formats)
+    ):
+        output_format = STANDARDS[target_format]["format"]
 
-    try:
-        output_data = dump_data(converted_data, output_format)
-    except Exception as e:
-        click.echo(f"Error during serialization: {str(e)}", err=True)
-        if verbose:
-            traceback.print_exc()
-        return
-
-    if output_file:
-        output_file.write(output_data)
-        click.echo(f"Data written to {output_file.name}")
-    else:
-        click.echo(output_data)
+        # written as it is serialized, so huge outputs are never held in memory whole
+        try:
+            if output_file and output_file != "-":
+                with open_file(output_file, "w") as file:
+                    write_data(converted_data[target_format], output_format, file)
+            else:
+                write_data(converted_data[target_format], output_format, sys.stdout)
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+        except Exception as e:
+            click.echo(f"Error during serialization: {str(e)}", err=True)
+            if verbose:
+                traceback.print_exc()
+            return
+        if output_file and output_file != "-":
+            click.echo(f"Data written to {output_file}")
 
 
 @cli.command()
@@ -93,8 +782,148 @@ def convert(source_format: str, target_format: str, input_file, output_file, ver
     default=False,
     help="Print verbose output",
 )
-@click.argument("input_file", type=click.Path(exists=True))
-def validate(format_name, input_file, verbose):
+@click.option(
+    "--ndjson",
+    is_flag=True,
+    default=False,
+    help="Validate every record in a stream of JSON lines, a JSON array or ---separated "
+    "YAML documents (- reads from stdin)",
+)
+@click.option(
+    "--pattern",
+    default=None,
+    help="File name pattern to search directories for "
+    "(defaults to the conventional file name of the format, e.g. codemeta.json)",
+)
+@shard_option
+@report_option
+@journal_option
+@dead_letter_option
+@archives_option
+@read_ahead_option
+@limit_option
+@ids_option
+@byte_range_option
+@click.argument("inputs", nargs=-1, required=True)
+def validate(
+    format_name,
+    inputs,
+    ndjson,
+    pattern,
+    shard,
+    report_path,
+    journal_path,
+    dead_letter_file,
+    archives,
+    read_ahead,
+    limits,
+    ids,
+    byte_range,
+    verbose,
+):
+    """Validate INPUTS against a metadata standard.
+
+    INPUTS can be files, tar or zip archives (searched for --pattern), directories
+    (searched recursively for --pattern), globs or @filelist files listing one input per
+    line.
+    """
+    if ndjson:
+        if read_ahead is not None:
+            raise click.UsageError("--read-ahead can't be used with --ndjson")
+        validate_stream(
+            format_name,
+            inputs,
+            verbose,
+            shard,
+            report_path,
+            journal_path,
+            dead_letter_file,
+            limits=limits,
+            ids=ids,
+            byte_range=byte_range,
+        )
+        return
+    if ids is not None or byte_range is not None:
+        raise click.UsageError("--ids and --byte-range require --ndjson")
+    if (
+        len(inputs) == 1
+        and os.path.isfile(inputs[0])
+        and not is_archive(inputs[0])
+        and not limits
+        and shard is None
+        and report_path is None
+        and journal_path is None
+        and dead_letter_file is None
+    ):
+        validate_single(format_name, inputs[0], verbose)
+        return
+
+    pattern = pattern or STANDARDS[format_name]["filename"]
+    try:
+        input_files = list(expand_inputs(inputs, pattern, archives, limits))
+    except OSError as e:
+        raise click.BadParameter(str(e), param_hint="INPUTS")
+    if shard is not None:
+        input_files = [f for f in input_files if shard.contains(f.shard_key)]
+
+    model = STANDARDS[format_name]["model"]
+    report = start_report("validate", shard)
+    journal = open_journal(journal_path, ["validate", format_name])
+    dead_letter = open_dead_letter(dead_letter_file)
+    total = invalid = skipped = 0
+    if read_ahead:
+        contents = read_files_ahead(
+            input_files, read_ahead, path=attrgetter("path"), read=InputFile.read
+        )
+    else:
+        contents = (
+            (index, input_file, input_file.content)
+            for index, input_file in enumerate(input_files)
+        )
+    try:
+        for _, input_file, content in contents:
+            key = None
+            if journal is not None:
+                key = journal.key_for_file(input_file.path)
+                if key in journal:
+                    skipped += 1
+                    continue
+            total += 1
+            start = time.perf_counter()
+            try:
+                with limits.deadline():
+                    data = load_input(input_file.path, limits, content)
+                    with failure_stage("validate"):
+                        model(**data)
+            except Exception as e:
+                invalid += 1
+                report.add(input_file.path, time.perf_counter() - start, e)
+                click.echo(f"{input_file.path} is invalid: {str(e)}", err=True)
+                if dead_letter is not None:
+                    dead_letter.write_exception(
+                        input_file.path,
+                        file_payload(input_file.path, getattr(e, "stage", None)),
+                        e,
+                    )
+                if verbose:
+                    traceback.print_exc()
+            else:
+                report.add(input_file.path, time.perf_counter() - start)
+                if journal is not None:
+                    journal.add(key)
+    finally:
+        if journal is not None:
+            journal.close()
+    write_report(report, report_path)
+    click.echo(
+        f"{total - invalid} of {total} files are valid {format_name} files."
+        + (f" Skipped {skipped} validated in an earlier run." if skipped else "")
+    )
+    if invalid:
+        raise SystemExit(1)
+
+
+def validate_single(format_name, input_file, verbose):
     try:
         load_and_create_model(input_file, STANDARDS[format_name]["model"])
         click.echo(f"{input_file} is a valid {format_name} file.")
@@ -104,13 +933,74 @@ def validate(format_name, input_file, verbose):
             traceback.print_exc()
 
 
-def dump_data(data, format):
-    if format == "json":
-        return data.json()
-    elif format == "yaml":
-        return data.yaml()
-    else:
-        raise ValueError(f"Unsupported format: {format}. Expected json or yaml")
+def validate_stream(
+    format_name,
+    inputs,
+    verbose,
+    shard=None,
+    report_path=None,
+    journal_path=None,
+    dead_letter_file=None,
+    limits=None,
+    ids=None,
+    byte_range=None,
+):
+    limits = limits or RecordLimits()
+    source = open_stream_source(
+        inputs, STANDARDS[format_name]["format"], limits, ids, byte_range
+    )
+    model = STANDARDS[format_name]["model"]
+    report = start_report("validate", shard)
+    journal = open_journal(journal_path, ["validate", format_name])
+    dead_letter = open_dead_letter(dead_letter_file)
+    total = invalid = skipped = 0
+    records = (
+        (item.meta.get("position", item.index), item.name, load_item(item, limits))
+        for item in source
+    )
+    try:
+        for index, name, record in records:
+            key = record_key(record, index)
+            if shard is not None and not shard.contains(key):
+                continue
+            journal_key = None
+            if journal is not None:
+                journal_key = journal.key_for_record(key, record)
+                if journal_key in journal:
+                    skipped += 1
+                    continue
+            total += 1
+            start = time.perf_counter()
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                with limits.deadline(), failure_stage("validate"):
+                    model(**record)
+            except Exception as e:
+                invalid += 1
+                report.add(name, time.perf_counter() - start, e)
+                click.echo(
+                    f"{name[0].upper()}{name[1:]} is invalid: {str(e)}", err=True
+                )
+                if dead_letter is not None:
+                    dead_letter.write_exception(name, record_payload(record), e)
+                if verbose:
+                    traceback.print_exception(e)
+            else:
+                report.add(name, time.perf_counter() - start)
+                if journal is not None:
+                    journal.add(journal_key)
+    finally:
+        if journal is not None:
+            journal.close()
+    warn_missing_ids(source)
+    write_report(report, report_path)
+    click.echo(
+        f"{total - invalid} of {total} records are valid {format_name} records."
+        + (f" Skipped {skipped} validated in an earlier run." if skipped else "")
+    )
+    if invalid:
+        raise SystemExit(1)
 
 
 def load_and_create_model(file_path, model):
@@ -124,16 +1014,366 @@ def load_and_create_model(file_path, model):
         raise ValueError(f"Failed to validate: {str(e)}")
 
 
-def load_file_autodetect(file_path):
-    _, ext = os.path.splitext(file_path)
-    ext = ext.lower()
+@cli.command()
+@click.option("--host", default="127.0.0.1", show_default=True, help="Address to bind")
+@click.option("--port", default=8080, show_default=True, help="Port to listen on")
+@click.option(
+    "-j",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes (defaults to the number of cpus)",
+)
+@click.option(
+    "--max-request-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_REQUEST_SIZE,
+    show_default=True,
+    help="Maximum request body size in bytes",
+)
+@limit_option
+@click.option("-q", "--quiet", is_flag=True, default=False, help="Don't log requests")
+def serve(host, port, workers, max_request_size, limits, quiet):
+    """Run a local HTTP conversion service with warm models.
+
+    Endpoints: POST /convert/{from}/{to}, POST /validate/{format},
+    POST /batch/{from}/{to} (JSON lines), GET /health and GET /metrics
+    """
+    click.echo(f"Serving on http://{host}:{port}", err=True)
+    _serve(host, port, workers, max_request_size, quiet=quiet, limits=limits)
+
+
+@cli.command()
+@click.option(
+    "-f",
+    "--from",
+    "source_format",
+    type=click.Choice(STANDARDS.keys()),
+    required=True,
+    help="Source format",
+)
+@click.option(
+    "-t",
+    "--to",
+    "target_formats",
+    type=click.Choice(STANDARDS.keys()),
+    required=True,
+    multiple=True,
+    help="Target format, can be repeated",
+)
+@click.option(
+    "--spool",
+    "spool_dir",
+    type=click.Path(file_okay=False),
+    required=True,
+    help="Spool directory shared by the workers",
+)
+@click.option(
+    "--worker-id",
+    default=None,
+    help="Name of this worker, unique among the workers sharing the spool "
+    "(defaults to HOSTNAME-PID)",
+)
+@click.option(
+    "--lease",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_LEASE,
+    show_default=True,
+    help="Seconds without a heartbeat after which a worker's claims are recovered",
+)
+@click.option(
+    "--poll-interval",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_POLL_INTERVAL,
+    show_default=True,
+    help="Seconds to wait between checks for new files",
+)
+@click.option(
+    "--exit-when-empty",
+    is_flag=True,
+    default=False,
+    help="Exit once there are no files left to convert instead of waiting for more",
+)
+@click.option(
+    "--name-template",
+    default=DEFAULT_SPOOL_NAME_TEMPLATE,
+    show_default=True,
+    help="Output file name template, see convert --name-template",
+)
+@click.option(
+    "-v",
+    "--verbose",
+    is_flag=True,
+    default=False,
+    help="Print verbose output",
+)
+def worker(
+    source_format,
+    target_formats,
+    spool_dir,
+    worker_id,
+    lease,
+    poll_interval,
+    exit_when_empty,
+    name_template,
+    verbose,
+):
+    """Convert files from a spool directory shared with other workers.
+
+    Files dropped into SPOOL/incoming/ are claimed by one worker, converted into
+    SPOOL/output/ and then moved into SPOOL/done/, or SPOOL/failed/ along with a .error
+    file. Workers can run on several hosts sharing the spool over a network filesystem.
+    """
+
+    def on_result(name, error):
+        if error is not None:
+            click.echo(f"Failed to convert {name}: {error}", err=True)
+        elif verbose:
+            click.echo(f"Converted {name}")
+
     try:
-        with open(file_path, "r") as file:
-            if ext in [".json"]:
-                return json.load(file)
-            elif ext in [".yaml", ".yml", ".cff"]:
-                return yaml.safe_load(file)
-            else:
-                raise ValueError(f"Unsupported file extension: {ext}.")
-    except Exception as e:
-        raise ValueError(f"Failed to load file: {file_path}. {str(e)}")
+        spool_worker = SpoolWorker(
+            spool_dir,
+            source_format,
+            target_formats,
+            worker_id=worker_id,
+            lease=lease,
+            name_template=name_template,
+            on_result=on_result,
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--worker-id")
+    try:
+        stats = spool_worker.run(
+            poll_interval=poll_interval, exit_when_empty=exit_when_empty
+        )
+    except KeyboardInterrupt:
+        stats = spool_worker.stats
+    click.echo(
+        f"Converted {stats.converted} of {stats.converted + stats.failed} files, "
+        f"recovered {stats.recovered} abandoned claims"
+    )
+    if stats.failed:
+        raise SystemExit(1)
+
+
+@cli.command("merge-reports")
+@click.option(
+    "-o",
+    "--output",
+    "output_file",
+    type=click.File("w"),
+    default="-",
+    help="Output file name (by default prints to stdout)",
+)
+@click.argument("reports", nargs=-1, required=True, type=click.Path(exists=True))
+def merge_reports_command(reports, output_file):
+    """Combine the --report summaries of several shards into one.
+
+    The merged report lists the shards it covers, any missing_shards of the same i/N
+    partitioning and the failed_shards that had failures, which can be rerun alone.
+    """
+    try:
+        merged = merge_reports(BatchReport.read(path) for path in reports)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="REPORTS")
+    data = merged.to_dict()
+    output_file.write(json.dumps(data, indent=2) + "\n")
+    if data["missing_shards"]:
+        click.echo(f"Missing shards: {', '.join(data['missing_shards'])}", err=True)
+
+
+@cli.command("index")
+@click.argument(
+    "corpora", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False)
+)
+def index_command(corpora):
+    """Index the records of NDJSON CORPORA by identifier and byte offset.
+
+    Each index is written next to its corpus as CORPUS.idx, and lets --ids fetch records
+    without reading the rest of the corpus. Rebuild it when the corpus changes.
+    """
+    for corpus in corpora:
+        if compression_of(corpus) is not None:
+            raise click.BadParameter(
+                f"{corpus} is compressed, only uncompressed NDJSON can be indexed",
+                param_hint="CORPORA",
+            )
+        count = build_index(corpus)
+        click.echo(f"Indexed {count} records of {corpus} into {index_path_for(corpus)}")
+
+
+@cli.command("sync")
+@click.argument("configs", nargs=-1, type=click.Path(dir_okay=False))
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Convert every source, including those unchanged since the last sync",
+)
+@click.option(
+    "-v",
+    "--verbose",
+    is_flag=True,
+    default=False,
+    help="Print verbose output",
+)
+def sync_command(configs, force, verbose):
+    """Regenerate the metadata files listed in sync CONFIGS from their sources.
+
+    Each config (.codemeticulous.yml by default) maps source files to the targets
+    generated from them. Targets are only rewritten when their content changes, and
+    sources unchanged since the last sync are skipped.
+    """
+    failed = 0
+    for config_path in configs or [DEFAULT_CONFIG]:
+        try:
+            config = load_sync_config(config_path)
+        except SyncConfigError as e:
+            raise click.BadParameter(str(e), param_hint="CONFIGS")
+        failed += report_sync(sync(config, force), verbose)
+    if failed:
+        raise SystemExit(1)
+
+
+def report_sync(results, verbose) -> int:
+    """print the outcome of a sync, returns the number of sources that failed"""
+    failed = 0
+    for result in results:
+        if not result.ok:
+            failed += 1
+            click.echo(f"Failed to sync {result.source.path}: {result.error}", err=True)
+            continue
+        for path in result.written:
+            click.echo(f"Updated {path}")
+        if verbose:
+            if result.skipped:
+                click.echo(f"Skipped {result.source.path}, unchanged since last sync")
+            for path in result.unchanged:
+                click.echo(f"{path} is up to date")
+    return failed
+
+
+@cli.command("watch")
+@click.argument("sources", nargs=-1, type=click.Path(dir_okay=False))
+@click.option(
+    "-f",
+    "--from",
+    "source_format",
+    type=click.Choice(STANDARDS.keys()),
+    default=None,
+    help="Standard of the SOURCES, by default the one whose conventional file name "
+    "they have (e.g. codemeta.json)",
+)
+@click.option(
+    "-t",
+    "--to",
+    "target_formats",
+    type=click.Choice(STANDARDS.keys()),
+    multiple=True,
+    help="Target format, written next to each source under its conventional file "
+    "name (e.g. CITATION.cff). Can be repeated",
+)
+@click.option(
+    "--config",
+    "config_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Watch the sources of a sync config instead of SOURCES",
+)
+@click.option(
+    "--debounce",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_DEBOUNCE,
+    show_default=True,
+    help="Seconds without further changes to wait for before converting a source",
+)
+@click.option(
+    "--poll",
+    "poll_interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Poll the sources every this many seconds instead of using inotify "
+    "(the default on Linux)",
+)
+@click.option(
+    "-v",
+    "--verbose",
+    is_flag=True,
+    default=False,
+    help="Print verbose output",
+)
+def watch_command(
+    sources,
+    source_format,
+    target_formats,
+    config_path,
+    debounce,
+    poll_interval,
+    verbose,
+):
+    """Regenerate the targets of SOURCES each time one of them changes.
+
+    Sources are converted once on start, then again as soon as they are saved, in the
+    same process. Targets are only rewritten when their content changes. Stop with
+    Ctrl+C.
+    """
+    if config_path is not None:
+        if sources or target_formats or source_format:
+            raise click.UsageError(
+                "--config can't be used with SOURCES, --from or --to"
+            )
+        try:
+            watched = load_sync_config(config_path).sources
+        except SyncConfigError as e:
+            raise click.BadParameter(str(e), param_hint="--config")
+    else:
+        if not sources or not target_formats:
+            raise click.UsageError("Give SOURCES and at least one --to, or --config")
+        try:
+            watched = sources_for(sources, target_formats, source_format)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="SOURCES")
+
+    source_watcher = SourceWatcher(
+        watched,
+        debounce=debounce,
+        poll_interval=poll_interval,
+        on_sync=lambda result: report_sync([result], verbose),
+    )
+    click.echo(f"Watching {len(watched)} sources, press Ctrl+C to stop", err=True)
+    try:
+        source_watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.group()
+def daemon():
+    """Manage the background process used when CODEMETICULOUS_DAEMON=1 is set."""
+    pass
+
+
+@daemon.command("run")
+@click.option("--socket", "socket_path", default=None, help="Socket path")
+@click.option(
+    "--idle-timeout",
+    type=float,
+    default=None,
+    help="Seconds without requests after which the daemon exits",
+)
+def daemon_run(socket_path, idle_timeout):
+    """Run the daemon in the foreground."""
+    run_daemon(
+        socket_path or default_socket_path(), idle_timeout or default_idle_timeout()
+    )
+
+
+@daemon.command("stop")
+@click.option("--socket", "socket_path", default=None, help="Socket path")
+def daemon_stop(socket_path):
+    """Stop a running daemon."""
+    if stop_daemon(socket_path):
+        click.echo("Daemon stopped")
+    else:
+        click.echo("No daemon is running")
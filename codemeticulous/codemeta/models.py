@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from typing import Optional, Any
 from datetime import date, datetime
+from functools import lru_cache
+from importlib import import_module
 
 from pydantic.v1 import Field, AnyUrl, BaseModel, validator, root_validator
 from pydantic2_schemaorg.SoftwareSourceCode import SoftwareSourceCode
@@ -21,6 +23,19 @@ from codemeticulous.utils import map_dict_keys
 from codemeticulous.mixins import ByAliasExcludeNoneMixin
 
 
+@lru_cache(maxsize=2048)
+def schemaorg_class(type_: str):
+    """resolve a schema.org type name to its pydantic2_schemaorg class, or None if there
+    is no such type. Lookups are cached so that validating nested values doesn't go
+    through the import system (and its global lock) for every item
+    """
+    try:
+        module = import_module(f"pydantic2_schemaorg.{type_}")
+    except ImportError:
+        return None
+    return getattr(module, type_)
+
+
 class VersionedLanguage(ComputerLanguage):
     """extends ComputerLanguage to allow for additional fields"""
 
@@ -188,6 +203,10 @@ class CodeMetaV3(ByAliasExcludeNoneMixin, BaseModel):
     def collapse_jsonld_context(cls, values):
         # everything should be within the codemeta context, so we flatten the @context
         # and remove jsonld prefixes
+        # root validators copy rather than modify what they are given, so that they don't
+        # depend on an earlier validator having made a copy. Input dicts are never
+        # modified, which makes it safe to validate the same input from several threads
+        values = dict(values)
         context = values.get("@context")
         if isinstance(context, dict):
             prefixes = list(context.keys())
@@ -210,11 +229,13 @@ class CodeMetaV3(ByAliasExcludeNoneMixin, BaseModel):
         see https://github.com/codemeta/codemeta/issues/240
         """
         KEYS = ["author", "contributor", "schema:author", "schema:contributor"]
+        values = dict(values)
 
         def transform_role(role_item):
             if isinstance(role_item, dict) and (
                 role_item.get("type") == "Role" or role_item.get("@type") == "Role"
             ):
+                role_item = dict(role_item)
                 for key in KEYS:
                     if key in role_item:
                         role_item["@id"] = role_item.pop(key)
@@ -233,6 +254,7 @@ class CodeMetaV3(ByAliasExcludeNoneMixin, BaseModel):
 
     @root_validator(pre=True)
     def coalesce_embargo_end_date(cls, values):
+        values = dict(values)
         embargo_date = values.get("embargoDate")
         embargo_end_date = values.get("embargoEndDate")
         if embargo_date and embargo_end_date:
@@ -247,6 +269,7 @@ class CodeMetaV3(ByAliasExcludeNoneMixin, BaseModel):
 
     @root_validator(pre=True)
     def coalesce_continuous_integration(cls, values):
+        values = dict(values)
         cont_integration = values.get("contIntegration")
         continuous_integration = values.get("continuousIntegration")
         if cont_integration and continuous_integration:
@@ -261,6 +284,7 @@ class CodeMetaV3(ByAliasExcludeNoneMixin, BaseModel):
 
     @root_validator(pre=True)
     def coalesce_creator_author(cls, values):
+        values = dict(values)
         author = values.get("author")
         creator = values.get("creator")
         if author and creator:
@@ -284,18 +308,16 @@ class CodeMetaV3(ByAliasExcludeNoneMixin, BaseModel):
         This is necessary because pydantic does not support 'automatic' polymorphism
         like this, and creating massive union types for every possible sub-type is
         extremely innefficient as opposed to the dynamic importing done here
+        (see schemaorg_class)
         """
         if isinstance(value, dict):
             type_ = value.get("@type") or value.get("type") or base_class.__name__
-            try:
-                module_name = f"pydantic2_schemaorg.{type_}"
-                module = __import__(module_name, fromlist=[type_])
-                ModelClass = getattr(module, type_)
-                if not issubclass(ModelClass, base_class):
-                    raise TypeError(f"{type_} is not a sub-type of {base_class}")
-                return ModelClass(**value)
-            except ImportError:
+            ModelClass = schemaorg_class(type_)
+            if ModelClass is None:
                 return base_class(**value)
+            if not issubclass(ModelClass, base_class):
+                raise TypeError(f"{type_} is not a sub-type of {base_class}")
+            return ModelClass(**value)
         elif isinstance(value, (str, AnyUrl)):
             return value
         else:
@@ -1,10 +1,12 @@
+from typing import Callable, Iterable, Iterator, Optional
+
 from codemeticulous.codemeta.models import CodeMeta
 from codemeticulous.datacite.models import DataCite
 from codemeticulous.cff.models import CitationFileFormat
 from codemeticulous.codemeta.convert import canonical_to_codemeta, codemeta_to_canonical
 from codemeticulous.datacite.convert import canonical_to_datacite, datacite_to_canonical
 from codemeticulous.cff.convert import canonical_to_cff, cff_to_canonical
-
+from codemeticulous.failures import failure_stage
 
 STANDARDS = {
     "codemeta": {
@@ -12,38 +14,47 @@ STANDARDS = {
         "format": "json",
         "to_canonical": codemeta_to_canonical,
         "from_canonical": canonical_to_codemeta,
+        "filename": "codemeta.json",
+        "extension": ".json",
     },
     "datacite": {
         "model": DataCite,
         "format": "json",
         "to_canonical": datacite_to_canonical,
         "from_canonical": canonical_to_datacite,
+        "filename": "datacite.json",
+        "extension": ".json",
     },
     "cff": {
         "model": CitationFileFormat,
         "format": "yaml",
         "to_canonical": cff_to_canonical,
         "from_canonical": canonical_to_cff,
+        "filename": "CITATION.cff",
+        "extension": ".cff",
     },
 }
 
 
 def to_canonical(source_format: str, source_data):
     source_model = STANDARDS[source_format]["model"]
-    if isinstance(source_data, dict):
-        source_instance = source_model(**source_data)
-    elif isinstance(source_data, source_model):
-        source_instance = source_data
+    with failure_stage("validate"):
+        if isinstance(source_data, dict):
+            source_instance = source_model(**source_data)
+        elif isinstance(source_data, source_model):
+            source_instance = source_data
 
     source_to_canonical = STANDARDS[source_format]["to_canonical"]
-    canonical_instance = source_to_canonical(source_instance)
+    with failure_stage("to_canonical"):
+        canonical_instance = source_to_canonical(source_instance)
 
     return canonical_instance
 
 
 def from_canonical(target_format: str, canonical_instance, **custom_fields):
     canonical_to_target = STANDARDS[target_format]["from_canonical"]
-    target_instance = canonical_to_target(canonical_instance, **custom_fields)
+    with failure_stage("from_canonical"):
+        target_instance = canonical_to_target(canonical_instance, **custom_fields)
 
     return target_instance
 
@@ -60,3 +71,65 @@ def convert(source_format: str, target_format: str, source_data, **custom_fields
     """
     canonical_instance = to_canonical(source_format, source_data)
     return from_canonical(target_format, canonical_instance, **custom_fields)
+
+
+def convert_to_many(
+    source_format: str, target_formats: list[str], source_data, **custom_fields
+) -> dict:
+    """
+    Convert from one metadata standard to several others. The source is validated and
+    converted to the canonical representation once, and shared by every target.
+
+    Args:
+    - source_format, source_data, custom_fields: see convert
+    - target_formats: list of target metadata standards
+
+    Returns a dict mapping each target format to the converted instance
+    """
+    canonical_instance = to_canonical(source_format, source_data)
+    return {
+        target_format: from_canonical(
+            target_format, canonical_instance, **custom_fields
+        )
+        for target_format in target_formats
+    }
+
+
+def iter_convert(
+    source_format: str,
+    target_format: str | list[str],
+    records: Iterable,
+    on_error: Optional[Callable[[int, Exception], None]] = None,
+    **custom_fields,
+) -> Iterator:
+    """
+    Lazily convert a stream of records from one metadata standard to another, yielding
+    each converted record as soon as it is ready.
+
+    Args:
+    - source_format, target_format, custom_fields: see convert. If target_format is a list,
+      each record is converted to every target with convert_to_many and a dict is yielded
+    - records: iterable of dicts or pydantic.BaseModel instances. It may also contain
+      exceptions in place of records that could not be loaded (see files.iter_records),
+      these are handled like conversion errors
+    - on_error: called with the index of the record and the exception when a record fails
+      to convert, after which the record is skipped. By default the exception is raised
+    """
+    for index, record in enumerate(records):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            if isinstance(target_format, str):
+                target_instance = convert(
+                    source_format, target_format, record, **custom_fields
+                )
+            else:
+                target_instance = convert_to_many(
+                    source_format, target_format, record, **custom_fields
+                )
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(index, e)
+            continue
+        yield target_instance
@@ -0,0 +1,413 @@
+"""
+Opt-in daemon mode that removes command line start-up latency
+
+Setting CODEMETICULOUS_DAEMON=1 makes the `codemeticulous` command a thin client: the first
+invocation starts a background process that has the command line and every model loaded,
+and each invocation forwards its arguments, working directory, environment and standard
+streams over a unix domain socket. The daemon forks a child per request which takes over
+the client's stdin, stdout and stderr, so output is exactly what running in-process would
+produce. The daemon exits after being idle for CODEMETICULOUS_DAEMON_TIMEOUT seconds.
+
+The environment sent with each request may hold secrets, so the client only talks to a
+daemon run by the same user: the socket must be in a directory no one else can write to
+(a private directory under /tmp unless XDG_RUNTIME_DIR is set) and the process listening
+on it must belong to the user. Each request also carries the version, location and
+python interpreter of the client's codemeticulous. A daemon started by another install
+refuses it and exits, and the client starts a new one, so the output is always that of
+the code the client would have run.
+
+This module only imports the standard library at the top level so that the client starts
+quickly. If the daemon can't be used for any reason, the command runs in-process instead.
+"""
+
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+import time
+
+DAEMON_ENV = "CODEMETICULOUS_DAEMON"
+SOCKET_ENV = "CODEMETICULOUS_SOCKET"
+TIMEOUT_ENV = "CODEMETICULOUS_DAEMON_TIMEOUT"
+DEFAULT_IDLE_TIMEOUT = 600
+# how long a client waits for a newly spawned daemon to start listening
+STARTUP_TIMEOUT = 30
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+
+def main():
+    """entry point of the `codemeticulous` command"""
+    if daemon_enabled() and sys.argv[1:2] != ["daemon"]:
+        exit_code = run_client(sys.argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+    from codemeticulous.cli import cli
+
+    cli()
+
+
+def daemon_enabled() -> bool:
+    enabled = os.environ.get(DAEMON_ENV, "").lower() in ("1", "true", "yes", "on")
+    return enabled and hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+
+
+def default_socket_path() -> str:
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "codemeticulous.sock")
+    return os.path.join("/tmp", f"codemeticulous-{os.getuid()}", "daemon.sock")
+
+
+def private_socket_dir(socket_path: str) -> bool:
+    """create the directory of the socket if needed, and check that no other user can
+    create or replace files in it
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.lstat(directory)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(info.st_mode)
+        and info.st_uid == os.getuid()
+        and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    )
+
+
+def owned_by_user(sock: socket.socket, socket_path: str) -> bool:
+    """whether the socket file and the process listening on it belong to this user"""
+    try:
+        if os.stat(socket_path).st_uid != os.getuid():
+            return False
+        if hasattr(socket, "SO_PEERCRED"):
+            credentials = sock.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+            )
+            _, uid, _ = struct.unpack("3i", credentials)
+            return uid == os.getuid()
+    except OSError:
+        return False
+    return True
+
+
+def identity() -> dict:
+    """what identifies the code a daemon runs: a daemon only serves clients that would
+    run the same code in-process
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        package_version = version("codemeticulous")
+    except PackageNotFoundError:
+        package_version = ""
+    return {
+        "version": package_version,
+        "package": os.path.dirname(os.path.abspath(__file__)),
+        "executable": sys.executable,
+    }
+
+
+def default_idle_timeout() -> float:
+    try:
+        return float(os.environ.get(TIMEOUT_ENV, DEFAULT_IDLE_TIMEOUT))
+    except ValueError:
+        return DEFAULT_IDLE_TIMEOUT
+
+
+# client
+
+
+def run_client(argv: list[str], socket_path: str = None):
+    """forward a command to the daemon, starting it if needed, and return its exit code.
+    Returns None if the daemon could not be reached
+    """
+    socket_path = socket_path or default_socket_path()
+    if not private_socket_dir(socket_path):
+        return None
+    request = {
+        "argv": argv[1:],
+        "prog_name": os.path.basename(argv[0]),
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+        "identity": identity(),
+    }
+    # a daemon of another install exits when it refuses the request, so the second
+    # attempt gets a daemon started by this one
+    for _ in range(2):
+        sock = connect(socket_path)
+        if sock is None:
+            spawn_daemon(socket_path)
+            sock = connect(socket_path, wait=STARTUP_TIMEOUT)
+            if sock is None:
+                return None
+        if not owned_by_user(sock, socket_path):
+            sock.close()
+            return None
+        response = send_request(sock, request)
+        if response is None or not response.get("mismatch"):
+            break
+    else:
+        return None
+    if response is None:
+        # the command may have already run, so it is not retried in-process
+        print("codemeticulous: lost connection to the daemon", file=sys.stderr)
+        return 1
+    if response.get("unavailable"):
+        return None
+    return response["exit_code"]
+
+
+def send_request(sock: socket.socket, request: dict):
+    """send a request along with the standard streams, returns the response or None if
+    the connection was lost
+    """
+    with sock:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            socket.send_fds(sock, [encode_message(request)], [0, 1, 2])
+        except OSError:
+            # nothing was run
+            return {"unavailable": True}
+        try:
+            return read_message(sock)
+        except (OSError, ValueError):
+            return None
+
+
+def connect(socket_path: str, wait: float = 0):
+    deadline = time.monotonic() + wait
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+            return sock
+        except OSError:
+            sock.close()
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+
+def spawn_daemon(socket_path: str, idle_timeout: float = None):
+    import subprocess
+
+    idle_timeout = idle_timeout or default_idle_timeout()
+    subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "codemeticulous.daemon",
+            "--socket",
+            socket_path,
+            "--idle-timeout",
+            str(idle_timeout),
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def stop_daemon(socket_path: str = None) -> bool:
+    """ask a running daemon to exit, returns False if none was running"""
+    sock = connect(socket_path or default_socket_path())
+    if sock is None:
+        return False
+    with sock:
+        sock.sendall(encode_message({"command": "stop"}))
+        read_message(sock)
+    return True
+
+
+# protocol: each message is a 4 byte big-endian length followed by that many bytes of JSON
+
+
+def encode_message(message: dict) -> bytes:
+    data = json.dumps(message).encode("utf-8")
+    return len(data).to_bytes(4, "big") + data
+
+
+def read_message(sock: socket.socket, maxfds: int = 0):
+    """read one message, along with any file descriptors sent with it if maxfds > 0.
+    Returns None if the connection is closed first
+    """
+    fds = []
+    buffer = b""
+    while len(buffer) < 4 or len(buffer) < 4 + int.from_bytes(buffer[:4], "big"):
+        if maxfds and not fds:
+            data, fds, _, _ = socket.recv_fds(sock, 65536, maxfds)
+        else:
+            data = sock.recv(65536)
+        if not data:
+            for fd in fds:
+                os.close(fd)
+            return (None, []) if maxfds else None
+        buffer += data
+        if len(buffer) >= 4 and int.from_bytes(buffer[:4], "big") > MAX_MESSAGE_SIZE:
+            raise ValueError("Message too large")
+    message = json.loads(buffer[4:].decode("utf-8"))
+    return (message, fds) if maxfds else message
+
+
+# daemon
+
+
+def run_daemon(socket_path: str, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+    """serve requests on socket_path until idle for idle_timeout seconds"""
+    # load everything up front, this is what requests get to skip
+    from codemeticulous.batch import init_worker
+    from codemeticulous.cli import cli
+
+    init_worker()
+    own_identity = identity()
+
+    server = bind(socket_path)
+    if server is None:
+        return
+    closed = False
+
+    def close():
+        # stop listening before answering a request to stop, so that a daemon the
+        # client starts next can bind the socket right away
+        nonlocal closed
+        if not closed:
+            closed = True
+            server.close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    # let the kernel reap finished request handlers
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    server.settimeout(idle_timeout)
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                break
+            with conn:
+                conn.settimeout(None)
+                if handle_connection(conn, cli, own_identity, close) == "stop":
+                    break
+    finally:
+        close()
+
+
+def bind(socket_path: str):
+    """bind the daemon's socket, returns None if another daemon is already listening or
+    the socket's directory isn't private
+    """
+    if not private_socket_dir(socket_path):
+        return None
+    existing = connect(socket_path)
+    if existing is not None:
+        existing.close()
+        return None
+    if os.path.exists(socket_path):
+        # left behind by a daemon that didn't exit cleanly
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    try:
+        server.bind(socket_path)
+    except OSError:
+        server.close()
+        return None
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    return server
+
+
+def handle_connection(conn: socket.socket, cli, own_identity=None, close=None):
+    """handle a request, returns "stop" if the daemon should exit. close is called
+    before answering a request that makes it exit
+    """
+    try:
+        request, fds = read_message(conn, maxfds=3)
+    except (OSError, ValueError):
+        return None
+    if request is None:
+        return None
+    if request.get("command") == "stop":
+        if close is not None:
+            close()
+        conn.sendall(encode_message({"stopped": True}))
+        return "stop"
+    if len(fds) != 3 or (
+        own_identity is not None and request.get("identity") != own_identity
+    ):
+        for fd in fds:
+            os.close(fd)
+        if len(fds) == 3:
+            # started by another install of codemeticulous, make way for a daemon
+            # running the client's code
+            if close is not None:
+                close()
+            conn.sendall(encode_message({"mismatch": True}))
+            return "stop"
+        return None
+    if os.fork() == 0:
+        exit_code = 1
+        try:
+            exit_code = run_request(request, fds, cli)
+        finally:
+            try:
+                conn.sendall(encode_message({"exit_code": exit_code}))
+            finally:
+                os._exit(0)
+    for fd in fds:
+        os.close(fd)
+    return None
+
+
+def run_request(request: dict, fds: list[int], cli) -> int:
+    """run the command line in a forked child that has taken over the client's
+    working directory, environment and standard streams
+    """
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    for target, fd in zip((0, 1, 2), fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.argv = [request["prog_name"], *request["argv"]]
+    try:
+        cli.main(args=request["argv"], prog_name=request["prog_name"])
+        exit_code = 0
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        import traceback
+
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return exit_code
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="codemeticulous daemon")
+    parser.add_argument("--socket", default=default_socket_path())
+    parser.add_argument("--idle-timeout", type=float, default=default_idle_timeout())
+    args = parser.parse_args()
+    run_daemon(args.socket, args.idle_timeout)
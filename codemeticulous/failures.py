@@ -0,0 +1,144 @@
+"""
+Classification of conversion failures, and dead-letter files that collect failed inputs
+so they can be triaged and re-driven in bulk
+
+Every exception raised while converting is tagged with the stage that failed:
+
+- load: reading or parsing the input
+- validate: validating the input against the source model
+- to_canonical: converting the source instance to the canonical model
+- from_canonical: converting the canonical model to a target (including validating the
+  target model)
+- serialize: dumping a target instance to JSON or YAML
+- write: writing an output file
+"""
+
+import json
+from contextlib import contextmanager
+from typing import Optional, TextIO
+
+STAGES = ("load", "validate", "to_canonical", "from_canonical", "serialize", "write")
+
+
+@contextmanager
+def failure_stage(stage: str):
+    """tag exceptions raised in the block with the stage that failed, unless an inner
+    block already did. The exception itself is re-raised unchanged
+    """
+    try:
+        yield
+    except Exception as e:
+        if getattr(e, "stage", None) is None:
+            try:
+                e.stage = stage
+            except AttributeError:
+                pass
+        raise
+
+
+def error_stage(exc: Exception) -> Optional[str]:
+    return getattr(exc, "stage", None)
+
+
+def error_fields(exc: Exception) -> list[dict]:
+    """the field paths and error types of a pydantic (v1 or v2) validation error, with
+    list indices kept in the path, e.g. {"path": "author.0.familyName", "type": "missing"}
+    """
+    errors = getattr(exc, "errors", None)
+    if not callable(errors):
+        return []
+    try:
+        details = errors()
+    except Exception:
+        return []
+    fields = []
+    for detail in details:
+        if not isinstance(detail, dict) or "loc" not in detail:
+            continue
+        fields.append(
+            {
+                "path": ".".join(str(part) for part in detail["loc"]),
+                "type": detail.get("type", ""),
+                "message": detail.get("msg", ""),
+            }
+        )
+    return fields
+
+
+def error_class(exc: Exception, fields: Optional[list[dict]] = None) -> str:
+    """a normalized description of an error that is the same for every record failing in
+    the same way, for grouping failures: the error type along with the sorted field
+    paths and error types of a validation error, with list indices replaced by *. e.g.
+    "ValidationError[author.*.familyName:missing,name:value_error.missing]"
+    """
+    if fields is None:
+        fields = error_fields(exc)
+    name = type(exc).__name__
+    if not fields:
+        return name
+    normalized = sorted(
+        {
+            ".".join("*" if part.isdigit() else part for part in f["path"].split("."))
+            + f":{f['type']}"
+            for f in fields
+        }
+    )
+    return f"{name}[{','.join(normalized)}]"
+
+
+class DeadLetterWriter:
+    """writes failed inputs as JSON lines, each holding the input, the stage that failed,
+    the error, and the original payload so that the file can be fed back in with
+    `jq -c .payload` once the cause is fixed
+    """
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.count = 0
+
+    def write(
+        self,
+        input: str,
+        payload,
+        stage: Optional[str],
+        error_type: str,
+        message: str,
+        error_class: str,
+        fields: Optional[list[dict]] = None,
+    ):
+        entry = {
+            "input": input,
+            "stage": stage,
+            "error_type": error_type,
+            "error_class": error_class,
+            "message": message,
+            "fields": fields or [],
+            "payload": payload,
+        }
+        self.stream.write(json.dumps(entry, default=str) + "\n")
+        self.stream.flush()
+        self.count += 1
+
+    def write_exception(self, input: str, payload, exc: Exception):
+        fields = error_fields(exc)
+        self.write(
+            input,
+            payload,
+            error_stage(exc),
+            type(exc).__name__,
+            str(exc),
+            error_class(exc, fields),
+            fields,
+        )
+
+    def write_error(self, input: str, payload, error):
+        """write a batch.RecordError"""
+        self.write(
+            input,
+            payload,
+            error.stage,
+            error.error_type,
+            error.message,
+            error.error_class or error.error_type,
+            error.fields,
+        )
@@ -0,0 +1,600 @@
+"""
+Loading and dumping metadata files, and expanding command line inputs into file lists
+"""
+
+import bz2
+import glob
+import gzip
+import io
+import itertools
+import json
+import lzma
+import os
+import re
+import sys
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path, PurePosixPath
+from typing import IO, Any, Callable, Iterable, Iterator, NamedTuple, Optional, TextIO
+
+import yaml
+
+from codemeticulous.archives import (
+    archive_suffix,
+    is_archive,
+    member_path,
+    read_member,
+    read_members,
+    safe_member_name,
+    split_member_path,
+)
+from codemeticulous.failures import failure_stage
+from codemeticulous.limits import LimitExceeded, RecordLimits
+
+# output path template used for batch conversion, see InputFile.output_path
+DEFAULT_NAME_TEMPLATE = "{path}{ext}"
+
+GLOB_CHARS = set("*?[")
+
+# number of files read_ahead keeps reading at a time
+DEFAULT_READ_AHEAD = 32
+
+# characters read at a time by iter_json_array
+JSON_ARRAY_CHUNK_SIZE = 64 * 1024
+
+# serialization format of record streams, by file extension
+STREAM_FORMATS = {
+    ".json": "json",
+    ".jsonl": "json",
+    ".ndjson": "json",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".cff": "yaml",
+}
+
+
+# streaming codecs of compressed files, by the extension that follows the file's own,
+# e.g. corpus.ndjson.gz
+COMPRESSION_EXTENSIONS = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+CODECS = {"gzip": gzip, "bz2": bz2, "xz": lzma}
+
+
+class RecordLoadError(ValueError):
+    """a record in a stream that could not be parsed, payload is the raw text"""
+
+    stage = "load"
+
+    def __init__(self, message: str, payload: Optional[str] = None):
+        super().__init__(message)
+        self.payload = payload
+
+
+class RecordLine(str):
+    """a JSON line that has been read but not parsed yet, see iter_records"""
+
+
+class InputFile(NamedTuple):
+    """a file to process, along with its path relative to the input it was found in
+    (e.g. the directory that was searched) which is used to name outputs
+    """
+
+    path: str
+    relpath: str
+    # contents of a member of an archive, read when the archive was searched, or the
+    # exception reading it raised. None if the file is to be read with read_input
+    content: Optional[bytes | Exception] = None
+
+    @property
+    def shard_key(self) -> str:
+        """the normalized path of the input (ARCHIVE!MEMBER for a member of an archive),
+        which unlike relpath tells apart inputs that share a name
+        """
+        archive, member = split_member_path(self.path)
+        path = Path(os.path.normpath(archive)).as_posix()
+        return path if member is None else member_path(path, member)
+
+    def read(self) -> bytes:
+        """the contents of the file, read with read_input unless they already were"""
+        if isinstance(self.content, Exception):
+            raise self.content
+        if self.content is not None:
+            return self.content
+        return read_input(self.path)
+
+    def output_path(
+        self,
+        output_dir: str,
+        template: str,
+        target_format: str,
+        ext: str,
+        filename: str = "",
+    ):
+        """build an output path from a template. Available fields are:
+
+        - {path}: relative path of the input without its extension
+        - {name}: file name of the input
+        - {stem}: file name of the input without its extension
+        - {target}: name of the target format
+        - {ext}: file extension of the target format, including the dot
+        - {filename}: conventional file name of the target format, e.g. CITATION.cff
+        """
+        relpath = Path(self.relpath)
+        name = template.format(
+            path=relpath.with_suffix("").as_posix(),
+            name=relpath.name,
+            stem=relpath.stem,
+            target=target_format,
+            ext=ext,
+            filename=filename,
+        )
+        return os.path.join(output_dir, name)
+
+
+def expand_inputs(
+    args: Iterable[str],
+    pattern: str,
+    archives: bool = False,
+    limits: Optional[RecordLimits] = None,
+) -> Iterator[InputFile]:
+    """expand command line arguments into the files they refer to
+
+    Each argument can be
+    - a file
+    - a tar or zip archive, which is searched for members matching pattern (see
+      codemeticulous.archives)
+    - a directory, which is searched recursively for files matching pattern, and if
+      archives is True for archives to search as well
+    - a glob, e.g. "projects/*/codemeta.json" (** matches any number of directories)
+    - @filelist, a file listing one of the above per line
+
+    The members of an archive are read while it is searched (see archives.read_members),
+    and carried as the content of their InputFile, except for those over the max_bytes of
+    limits
+    """
+    for arg in args:
+        if arg.startswith("@"):
+            yield from expand_inputs(
+                _read_file_list(arg[1:]), pattern, archives, limits
+            )
+        elif os.path.isdir(arg):
+            paths = {path for path in Path(arg).rglob(pattern) if path.is_file()}
+            if archives:
+                paths.update(
+                    path
+                    for path in Path(arg).rglob("*")
+                    if is_archive(path.name) and path.is_file()
+                )
+            for path in sorted(paths):
+                yield from _expand_file(
+                    str(path), path.relative_to(arg).as_posix(), pattern, limits
+                )
+        elif os.path.isfile(arg):
+            yield from _expand_file(arg, _relpath(arg), pattern, limits)
+        elif GLOB_CHARS & set(arg):
+            for path in sorted(glob.glob(arg, recursive=True)):
+                if os.path.isfile(path):
+                    yield from _expand_file(path, _relpath(path), pattern, limits)
+        else:
+            raise FileNotFoundError(f"No such file or directory: {arg}")
+
+
+def _expand_file(
+    path: str, relpath: str, pattern: str, limits: Optional[RecordLimits]
+) -> Iterator[InputFile]:
+    suffix = archive_suffix(path)
+    if suffix is None:
+        yield InputFile(path, relpath)
+        return
+    # members are named after the archive without its suffix, then their own path
+    prefix = relpath[: -len(suffix)]
+    try:
+        members = list(read_members(path, pattern, limits))
+    except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+        raise OSError(f"Failed to read archive {path}: {e}")
+    for name, data in members:
+        content = None
+        if data is not None:
+            try:
+                content = _decompress_member(path, name, data, limits or RecordLimits())
+            except LimitExceeded:
+                pass
+            except OSError as e:
+                content = e
+        yield InputFile(
+            member_path(path, name), f"{prefix}/{safe_member_name(name)}", content
+        )
+
+
+def _read_file_list(file_path: str) -> list[str]:
+    with open(file_path, "r") as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def _relpath(path: str) -> str:
+    # keep paths as they are so outputs mirror the input layout, but don't let absolute
+    # paths or ones pointing to a parent directory escape the output directory: their
+    # anchor and leading ".." are dropped, keeping the rest of their directories
+    parts = Path(os.path.normpath(path)).parts
+    if parts and Path(path).anchor:
+        parts = parts[1:]
+    while parts and parts[0] == os.pardir:
+        parts = parts[1:]
+    return PurePosixPath(*parts).as_posix()
+
+
+def dump_data(data, format):
+    with failure_stage("serialize"):
+        if format == "json":
+            return data.json()
+        elif format == "yaml":
+            return data.yaml()
+        else:
+            raise ValueError(f"Unsupported format: {format}. Expected json or yaml")
+
+
+def write_data(data, format, file):
+    """serialize data straight into a text file, without building the whole document
+    as a string like dump_data does. Errors writing to file are tagged "write"
+    """
+    with failure_stage("serialize"):
+        if format not in ("json", "yaml"):
+            raise ValueError(f"Unsupported format: {format}. Expected json or yaml")
+        try:
+            if format == "json":
+                data.write_json(file)
+            else:
+                data.write_yaml(file)
+        except OSError as e:
+            e.stage = "write"
+            raise
+
+
+def load_file_autodetect(file_path, content: Optional[bytes | Exception] = None):
+    """load a metadata file, or a member of an archive (see read_input). The format is
+    detected from the extension. content is the contents of the file if it was already
+    read (see read_ahead), or the exception reading it raised
+    """
+    ext = format_extension(file_path)
+    try:
+        if isinstance(content, Exception):
+            raise content
+        if content is None:
+            content = read_input(file_path)
+        if ext in [".json"]:
+            return json.loads(content)
+        elif ext in [".yaml", ".yml", ".cff"]:
+            return yaml.safe_load(content)
+        else:
+            raise ValueError(f"Unsupported file extension: {ext}.")
+    except Exception as e:
+        raise RecordLoadError(f"Failed to load file: {file_path}. {str(e)}")
+
+
+def compression_of(path: str) -> Optional[str]:
+    """the codec a file is compressed with according to its extension, or None"""
+    _, ext = os.path.splitext(path)
+    return COMPRESSION_EXTENSIONS.get(ext.lower())
+
+
+def format_extension(path: str) -> str:
+    """the lowercase extension of a file, ignoring a compression extension, e.g. ".json"
+    for "codemeta.json.gz"
+    """
+    if compression_of(path) is not None:
+        path, _ = os.path.splitext(path)
+    _, ext = os.path.splitext(path)
+    return ext.lower()
+
+
+def open_file(
+    file: str | IO[bytes], mode: str = "r", compression: Optional[str] = None
+):
+    """open a file, decompressing it as it is read or compressing it as it is written.
+    The codec (one of CODECS) defaults to the one of the file's extension, files without
+    one are opened as usual. file can also be a binary file object when compression is
+    given, it is left open when the returned file is closed. Text is utf-8 encoded
+    """
+    if compression is None and isinstance(file, str):
+        compression = compression_of(file)
+    if compression is None:
+        return open(file, mode)
+    if "b" in mode:
+        return CODECS[compression].open(file, mode)
+    return CODECS[compression].open(file, mode + "t", encoding="utf-8")
+
+
+def read_input(path: str, limits: Optional[RecordLimits] = None) -> bytes:
+    """read a file, or a member of an archive given as ARCHIVE!MEMBER (see
+    codemeticulous.archives) without extracting the rest of the archive. Compressed
+    files are decompressed (see open_file). Files larger than the max_bytes of limits
+    are not read, once decompressed for compressed ones
+    """
+    limits = limits or RecordLimits()
+    archive, member = split_member_path(path)
+    if member is not None:
+        try:
+            data = read_member(archive, member, limits)
+        except (tarfile.TarError, zipfile.BadZipFile, KeyError) as e:
+            raise OSError(f"Failed to read {member} from {archive}: {e}")
+        return _decompress_member(archive, member, data, limits)
+    if compression_of(path) is None:
+        limits.check_file(path)
+        with open(path, "rb") as file:
+            return file.read()
+    with open_file(path, "rb") as file:
+        try:
+            return _read_decompressed(file, limits)
+        except (EOFError, lzma.LZMAError) as e:
+            raise OSError(f"Failed to decompress {path}: {e}")
+
+
+def _decompress_member(
+    archive: str, member: str, data: bytes, limits: RecordLimits
+) -> bytes:
+    compression = compression_of(member)
+    if compression is None:
+        return data
+    with open_file(io.BytesIO(data), "rb", compression) as file:
+        try:
+            return _read_decompressed(file, limits)
+        except (EOFError, lzma.LZMAError) as e:
+            raise OSError(f"Failed to decompress {member_path(archive, member)}: {e}")
+
+
+def _read_decompressed(file, limits: RecordLimits) -> bytes:
+    # the compressed size says little about the decompressed one, so stop reading as
+    # soon as the limit is passed
+    if limits.max_bytes is None:
+        return file.read()
+    data = file.read(limits.max_bytes + 1)
+    if len(data) > limits.max_bytes:
+        raise LimitExceeded(
+            "max_bytes",
+            f"Record is over the limit of {limits.max_bytes} bytes once decompressed",
+        )
+    return data
+
+
+def read_ahead(
+    items: Iterable,
+    depth: int = DEFAULT_READ_AHEAD,
+    ordered: bool = True,
+    path: Callable[[Any], str] = os.fspath,
+    read: Optional[Callable[[Any], bytes]] = None,
+) -> Iterator[tuple[int, Any, bytes | Exception]]:
+    """read the files of items on a pool of threads, keeping up to depth reads in flight
+    so that the latency of each read (e.g. on network storage) overlaps with the others
+    and with whatever the caller does with the files already read
+
+    Yields (index, item, content) for each item, where content is the bytes of the
+    file or the exception reading it raised, in input order or, if ordered is False, as
+    soon as each read completes. path gets the path of the file from an item, and read
+    its contents if given instead of reading that path with read_input (e.g.
+    InputFile.read, for members already read from their archive)
+    """
+    if depth < 1:
+        raise ValueError(f"depth must be at least 1, got {depth}")
+    if read is None:
+
+        def read(item):
+            return read_input(path(item))
+
+    items = iter(enumerate(items))
+    with ThreadPoolExecutor(max_workers=depth, thread_name_prefix="read") as pool:
+        if ordered:
+            pending = deque()
+            for index, item in items:
+                pending.append((index, item, pool.submit(read, item)))
+                if len(pending) >= depth:
+                    yield _read_result(*pending.popleft())
+            while pending:
+                yield _read_result(*pending.popleft())
+            return
+
+        pending = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < depth:
+                next_item = next(items, None)
+                if next_item is None:
+                    exhausted = True
+                else:
+                    index, item = next_item
+                    pending[pool.submit(read, item)] = (index, item)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield _read_result(*pending.pop(future), future)
+
+
+def _read_result(index, item, future):
+    error = future.exception()
+    return index, item, error if error is not None else future.result()
+
+
+def iter_records(
+    stream: TextIO,
+    format: str,
+    limits: Optional[RecordLimits] = None,
+    parse_lines: bool = True,
+) -> Iterator:
+    """lazily load records from a text stream, one at a time
+
+    json streams are read as JSON lines (NDJSON), one record per line, unless they start
+    with "[" in which case they are read as one JSON array of records (see
+    iter_json_array). A line that can't be parsed is yielded as a RecordLoadError in
+    place of the record so the rest of the stream can still be read. Unless parse_lines
+    is set, lines are yielded as RecordLine for the caller to parse. yaml streams are
+    read as a sequence of ---separated documents. limits only apply to JSON arrays
+    """
+    if format == "json":
+        first, line_number = skip_whitespace(stream)
+        if first == "[":
+            yield from iter_json_array(stream, limits=limits, prefix=first)
+            return
+        lines = itertools.chain([first + stream.readline()] if first else [], stream)
+        for line_number, line in enumerate(lines, start=line_number + 1):
+            if not line.strip():
+                continue
+            if not parse_lines:
+                yield RecordLine(line)
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield RecordLoadError(f"Invalid JSON on line {line_number}: {e}", line)
+    elif format == "yaml":
+        for document in yaml.safe_load_all(stream):
+            if document is not None:
+                yield document
+    else:
+        raise ValueError(f"Unsupported format: {format}. Expected json or yaml")
+
+
+def skip_whitespace(stream: TextIO) -> tuple[str, int]:
+    """read up to the first character of a stream that isn't whitespace, return it ("" at
+    the end of the stream) and the number of lines skipped before it
+    """
+    lines = 0
+    while (char := stream.read(1)).isspace():
+        lines += char == "\n"
+    return char, lines
+
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_json_array(
+    stream: TextIO,
+    chunk_size: int = JSON_ARRAY_CHUNK_SIZE,
+    limits: Optional[RecordLimits] = None,
+    prefix: str = "",
+) -> Iterator:
+    """lazily load the elements of a JSON array from a text stream, one at a time. The
+    stream is read chunk_size characters at a time and only the element being parsed is
+    kept, so memory use is bounded by the largest element rather than the whole array.
+    prefix is text already read from the stream, e.g. the opening "["
+
+    Elements over the max_bytes of limits are yielded as a LimitExceeded. Unlike lines,
+    the elements after one that is invalid can't be told apart, so an invalid element
+    is yielded as a RecordLoadError and ends the stream, as does an element that is over
+    max_bytes before its end is even read
+    """
+    limits = limits or RecordLimits()
+    buffer, pos, eof = prefix, 0, False
+
+    def read_more(size):
+        # drop what was parsed already, and read at least size more characters
+        nonlocal buffer, pos, eof
+        chunk = stream.read(size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    def next_char():
+        nonlocal pos
+        while True:
+            pos = _JSON_WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                return buffer[pos : pos + 1]
+            read_more(chunk_size)
+
+    if next_char() != "[":
+        yield RecordLoadError("Invalid JSON array: expected [", buffer[pos:][:100])
+        return
+    pos += 1
+    if next_char() == "]":
+        return
+    index = 0
+    while True:
+        try:
+            record, end = _decode_element(buffer, pos, eof)
+        except _Incomplete:
+            if limits.max_bytes is not None and len(buffer) - pos > limits.max_bytes:
+                yield LimitExceeded(
+                    "max_bytes",
+                    f"Element {index} of the array is over the limit of "
+                    f"{limits.max_bytes} bytes",
+                )
+                return
+            # reading as much again as is buffered keeps parsing linear in its size
+            read_more(max(chunk_size, len(buffer) - pos))
+            continue
+        except ValueError as e:
+            yield RecordLoadError(f"Invalid JSON in element {index} of the array: {e}")
+            return
+        try:
+            limits.check_payload(buffer[pos:end])
+        except LimitExceeded as e:
+            record = e
+        pos = end
+        yield record
+        index += 1
+        char = next_char()
+        if char == "]":
+            return
+        if char != ",":
+            yield RecordLoadError(
+                f"Invalid JSON array: expected , or ] after element {index - 1}",
+                buffer[pos:][:100] or None,
+            )
+            return
+        pos += 1
+        next_char()
+
+
+class _Incomplete(Exception):
+    pass
+
+
+def _decode_element(buffer: str, pos: int, eof: bool):
+    # (element, end) of the element starting at pos, _Incomplete if the buffer may end
+    # before the element does
+    try:
+        record, end = _JSON_DECODER.raw_decode(buffer, pos)
+    except json.JSONDecodeError as e:
+        # truncated input fails at or just before its end (e.g. in the middle of a
+        # \uXXXX escape), or at the start of an unterminated string
+        if not eof and (
+            e.pos >= len(buffer) - 6 or e.msg.startswith("Unterminated string")
+        ):
+            raise _Incomplete()
+        raise
+    # a number near the end of the buffer may have more to come: digits, or the rest of
+    # its fraction or exponent, e.g. "1." and "1.5e+" decode as 1 and 1.5
+    if not eof and not isinstance(record, (dict, list)) and end >= len(buffer) - 2:
+        raise _Incomplete()
+    return record, end
+
+
+def iter_file_records(
+    file_path: str,
+    default_format: str = "json",
+    limits: Optional[RecordLimits] = None,
+    parse_lines: bool = True,
+) -> Iterator:
+    """lazily load records from a JSON lines, JSON array or multi-document YAML file, see
+    iter_records
+
+    The format is detected from the file extension, default_format is used for stdin ("-")
+    and unknown extensions. Compressed files are decompressed as they are read (see
+    open_file)
+    """
+    if file_path == "-":
+        yield from iter_records(sys.stdin, default_format, limits, parse_lines)
+        return
+    format = STREAM_FORMATS.get(format_extension(file_path), default_format)
+    with open_file(file_path, "r") as file:
+        yield from iter_records(file, format, limits, parse_lines)
+
+
+def write_record(stream: TextIO, data):
+    """write a record to a stream of JSON lines"""
+    with failure_stage("serialize"):
+        line = data.json()
+    stream.write(line)
+    stream.write("\n")
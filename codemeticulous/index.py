@@ -0,0 +1,199 @@
+"""
+Byte offset indexes of NDJSON corpora, for random access to records by identifier and
+for splitting a corpus between workers by byte ranges
+
+An index is a sidecar file (CORPUS.idx by default) starting with a JSON header that
+records the size and modification time of the corpus it was built from, followed by one
+JSON line per record: [key, position, offset, length]. key identifies the record like
+shard.record_key does (its "@id", "id", "identifier" or "doi", or "#N" for the record at
+position N of the stream), and offset and length locate its line in the corpus. Records
+are read back through mmap, so fetching a few records of a large corpus only touches the
+pages they are on.
+"""
+
+import json
+import mmap
+import os
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from codemeticulous.files import RecordLoadError
+from codemeticulous.shard import Shard, record_key
+
+INDEX_FORMAT = "codemeticulous-index"
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+
+class StaleIndexError(ValueError):
+    """an index that is missing, unreadable or older than its corpus"""
+
+
+class IndexEntry(NamedTuple):
+    key: str
+    position: int
+    offset: int
+    length: int
+
+
+def index_path_for(corpus_path: str) -> str:
+    return corpus_path + INDEX_SUFFIX
+
+
+def _corpus_stat(corpus_path: str) -> dict:
+    stat = os.stat(corpus_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def iter_lines(file, start: int = 0, end: Optional[int] = None) -> Iterator[tuple]:
+    """(offset, line) of the lines of a binary file that start in [start, end). A line
+    that straddles start belongs to the range before it, so consecutive ranges split the
+    lines of a file between them without overlap
+    """
+    if start > 0:
+        # the line starting right at start belongs to this range only if the previous
+        # byte ends a line
+        file.seek(start - 1)
+        if file.read(1) != b"\n":
+            file.readline()
+    else:
+        file.seek(0)
+    offset = file.tell()
+    while end is None or offset < end:
+        line = file.readline()
+        if not line:
+            break
+        yield offset, line
+        offset += len(line)
+
+
+def byte_range(size: int, part: Shard) -> tuple[int, int]:
+    """the [start, end) byte range of part i/N of a file of size bytes"""
+    return size * part.index // part.count, size * (part.index + 1) // part.count
+
+
+def build_index(corpus_path: str, index_path: Optional[str] = None) -> int:
+    """index the records of an NDJSON corpus, returns the number of records indexed.
+    Lines that are not valid JSON are indexed by position
+    """
+    index_path = index_path or index_path_for(corpus_path)
+    header = {
+        "format": INDEX_FORMAT,
+        "version": INDEX_VERSION,
+        "corpus": _corpus_stat(corpus_path),
+    }
+    count = 0
+    temp_path = f"{index_path}.tmp"
+    with open(corpus_path, "rb") as corpus, open(temp_path, "w") as index:
+        index.write(json.dumps(header) + "\n")
+        for offset, line in iter_lines(corpus):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            key = record_key(record, count)
+            entry = [key, count, offset, len(line.rstrip(b"\r\n"))]
+            index.write(json.dumps(entry) + "\n")
+            count += 1
+    os.replace(temp_path, index_path)
+    return count
+
+
+class CorpusIndex:
+    """the index of a corpus, mapping each key to the entries of the records it
+    identifies (several records may share an identifier)
+    """
+
+    def __init__(self, corpus_path: str, entries: Iterable[IndexEntry]):
+        self.corpus_path = corpus_path
+        self.entries: dict[str, list[IndexEntry]] = {}
+        for entry in entries:
+            self.entries.setdefault(entry.key, []).append(entry)
+
+    @classmethod
+    def load(cls, corpus_path: str, index_path: Optional[str] = None) -> "CorpusIndex":
+        """load the index of a corpus, StaleIndexError if it is missing or out of date"""
+        index_path = index_path or index_path_for(corpus_path)
+        try:
+            with open(index_path, "r") as index:
+                header = json.loads(index.readline())
+                if header.get("format") != INDEX_FORMAT:
+                    raise StaleIndexError(f"{index_path} is not an index")
+                if header.get("corpus") != _corpus_stat(corpus_path):
+                    raise StaleIndexError(
+                        f"{index_path} is out of date, {corpus_path} changed since it "
+                        "was built"
+                    )
+                return cls(
+                    corpus_path,
+                    (IndexEntry(*json.loads(line)) for line in index if line.strip()),
+                )
+        except StaleIndexError:
+            raise
+        except (OSError, ValueError, TypeError) as e:
+            raise StaleIndexError(f"Failed to read index {index_path}: {e}")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self.entries.values())
+
+    def lookup(self, keys: Iterable[str]) -> tuple[list[IndexEntry], list[str]]:
+        """the entries of the records identified by keys in corpus order, and the keys
+        that aren't in the index
+        """
+        found, missing = [], []
+        for key in dict.fromkeys(keys):
+            if key in self.entries:
+                found.extend(self.entries[key])
+            else:
+                missing.append(key)
+        found.sort(key=lambda entry: entry.offset)
+        return found, missing
+
+    def read_lines(self, entries: Iterable[IndexEntry]) -> Iterator[tuple]:
+        """(entry, line) for each entry, reading the lines through mmap"""
+        with open(self.corpus_path, "rb") as corpus:
+            if os.fstat(corpus.fileno()).st_size == 0:
+                return
+            with mmap.mmap(corpus.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for entry in entries:
+                    yield entry, view[entry.offset : entry.offset + entry.length]
+
+
+def _parse_line(line: bytes, position: int):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return RecordLoadError(
+            f"Invalid JSON in record {position}: {e}", line.decode("utf-8", "replace")
+        )
+
+
+def read_records(
+    corpus_path: str, keys: Iterable[str], index_path: Optional[str] = None
+) -> Iterator[tuple[IndexEntry, object]]:
+    """(entry, record) of the records of a corpus identified by keys, in corpus order,
+    without reading the rest of the corpus. Records that can't be parsed are
+    RecordLoadErrors, like with files.iter_records. Keys that aren't in the index are
+    skipped, see CorpusIndex.lookup to list them
+    """
+    index = CorpusIndex.load(corpus_path, index_path)
+    entries, _ = index.lookup(keys)
+    for entry, line in index.read_lines(entries):
+        yield entry, _parse_line(line, entry.position)
+
+
+def read_range(corpus_path: str, part: Shard) -> Iterator[tuple[int, object]]:
+    """(offset, record) of the records of part i/N of the bytes of a corpus, e.g. for
+    worker i of N to process its share of a corpus without an index or a coordinator.
+    Every record belongs to exactly one part
+    """
+    size = os.path.getsize(corpus_path)
+    start, end = byte_range(size, part)
+    with open(corpus_path, "rb") as corpus:
+        for offset, line in iter_lines(corpus, start, end):
+            if line.strip():
+                yield offset, _parse_line(line, offset)
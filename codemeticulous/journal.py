@@ -0,0 +1,165 @@
+"""
+An append-only journal of completed inputs, so that an interrupted batch can be resumed
+
+The journal is a binary file starting with a short header, followed by fixed size
+entries of 32 bytes: a 16 byte blake2b digest of the identity of an input (e.g. its path,
+or a record's identifier) and a 16 byte digest of its state: the size and modification
+time of a file, or the content of a record. An input is only skipped when both match, so
+inputs that changed since they were journaled are processed again. Files are keyed on
+their stat rather than their content so that checking a batch against the journal
+doesn't read every file before converting it.
+
+Entries are written as inputs complete and flushed to disk every sync_every entries or
+sync_interval seconds. A journal cut short by a crash is still usable: a partially
+written entry at the end is ignored and overwritten.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Callable, Optional
+
+from codemeticulous.archives import member_path, split_member_path
+
+MAGIC = b"CMJOURNAL1\n"
+DIGEST_SIZE = 16
+ENTRY_SIZE = 2 * DIGEST_SIZE
+DEFAULT_SYNC_EVERY = 1000
+DEFAULT_SYNC_INTERVAL = 5.0
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+def record_content(record) -> bytes:
+    """the bytes a record's content hash is computed from. Values JSON has no type for,
+    like the dates of YAML records, are hashed as their str
+    """
+    return json.dumps(record, sort_keys=True, ensure_ascii=False, default=str).encode(
+        "utf-8"
+    )
+
+
+class Journal:
+    """set of completed inputs backed by an append-only file
+
+    scope is mixed into every identity, so that one journal file can't be mistaken for
+    another's when reused with different settings (e.g. another target format).
+    before_sync is called before entries are flushed to disk, to flush the outputs the
+    entries vouch for first. Only inputs completed in earlier runs count as completed,
+    so repeated inputs within a run are all processed
+    """
+
+    def __init__(
+        self,
+        path: str,
+        scope: str = "",
+        sync_every: int = DEFAULT_SYNC_EVERY,
+        sync_interval: float = DEFAULT_SYNC_INTERVAL,
+        before_sync: Optional[Callable[[], None]] = None,
+    ):
+        self.path = path
+        self.scope = scope
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.before_sync = before_sync
+        # entries loaded from the file, and those added since
+        self.completed = set()
+        self.added = set()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._file = self._open()
+
+    def _open(self):
+        try:
+            file = open(self.path, "r+b")
+        except FileNotFoundError:
+            file = open(self.path, "w+b")
+        try:
+            header = file.read(len(MAGIC))
+            if not header:
+                file.write(MAGIC)
+                file.flush()
+                os.fsync(file.fileno())
+                return file
+            if header != MAGIC:
+                raise ValueError(f"{self.path} is not a codemeticulous journal")
+            data = file.read()
+            complete = len(data) - len(data) % ENTRY_SIZE
+            for offset in range(0, complete, ENTRY_SIZE):
+                self.completed.add(data[offset : offset + ENTRY_SIZE])
+            # drop a partially written entry so that new ones stay aligned
+            file.truncate(len(MAGIC) + complete)
+            file.seek(len(MAGIC) + complete)
+        except BaseException:
+            file.close()
+            raise
+        return file
+
+    def key(self, identity: str, content: bytes) -> bytes:
+        scoped = f"{self.scope}\0{identity}".encode("utf-8")
+        return _digest(scoped) + _digest(content)
+
+    def key_for_file(self, path: str) -> Optional[bytes]:
+        """key of a file, identified by its absolute path, from its size and modification
+        time. A member of an archive (ARCHIVE!MEMBER) has those of its archive. None if
+        the file doesn't exist
+        """
+        archive, member = split_member_path(path)
+        try:
+            stat = os.stat(archive)
+        except OSError:
+            return None
+        identity = os.path.abspath(archive)
+        if member is not None:
+            identity = member_path(identity, member)
+        return self.key(identity, f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    def key_for_record(self, identity: str, record) -> Optional[bytes]:
+        """key of a record in a stream, None for records that could not be loaded"""
+        if isinstance(record, Exception):
+            return None
+        return self.key(identity, record_content(record))
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self.completed
+
+    def __len__(self) -> int:
+        return len(self.completed) + len(self.added)
+
+    def add(self, key: Optional[bytes]):
+        """record an input as completed"""
+        if key is None or key in self.completed or key in self.added:
+            return
+        self.added.add(key)
+        self._file.write(key)
+        self._unsynced += 1
+        if (
+            self._unsynced >= self.sync_every
+            or time.monotonic() - self._last_sync >= self.sync_interval
+        ):
+            self.sync()
+
+    def sync(self):
+        if self.before_sync is not None:
+            self.before_sync()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            self.sync()
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
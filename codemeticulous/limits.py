@@ -0,0 +1,167 @@
+"""
+Per-record resource limits, so that one pathological record (a huge file, a deeply nested
+document, a list of millions of items, or a value that takes a regular expression ages to
+match) can't stall a batch worker or a server
+
+Records over a limit fail with LimitExceeded, or RecordTimeout when they take too long,
+rather than the usual errors, so they can be told apart in reports and dead-letter files.
+
+The time limit is enforced with SIGALRM, so it only applies in the main thread of a
+process (e.g. in worker processes, or converting in the calling process) on platforms
+that have it. Timeouts interrupt python code, including regular expression matching, but
+not a long call into native code that doesn't check for signals. A worker process that
+timed out may have been interrupted anywhere, so batches and the server replace their
+pool of workers when that happens.
+"""
+
+import os
+import signal
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from typing import Iterable, Optional
+
+
+class LimitExceeded(Exception):
+    """a record is larger than one of the RecordLimits allow. Not a ValueError, so that
+    validators raising it (e.g. on a timeout) don't turn it into a validation error
+    """
+
+    stage = "load"
+
+    def __init__(self, limit: str, message: str):
+        super().__init__(limit, message)
+        self.limit = limit
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class RecordTimeout(LimitExceeded):
+    """a record took longer to process than RecordLimits.timeout"""
+
+    # tagged with the stage that was interrupted, see failures.failure_stage
+    stage = None
+
+
+@dataclass(frozen=True)
+class RecordLimits:
+    """limits on each record, None for no limit
+
+    - max_bytes: size of the serialized record, for records read from files or streams
+    - max_depth: nesting depth of objects and lists, the record itself being 1 deep
+    - max_list_length: number of items in any list
+    - timeout: seconds spent processing the record
+    """
+
+    max_bytes: Optional[int] = None
+    max_depth: Optional[int] = None
+    max_list_length: Optional[int] = None
+    timeout: Optional[float] = None
+
+    @classmethod
+    def parse(cls, specs: Iterable[str]) -> "RecordLimits":
+        """parse limits given as NAME=VALUE, with - or _ in names, e.g. max-depth=64"""
+        names = [field.name for field in fields(cls)]
+        values = {}
+        for spec in specs:
+            name, _, value = spec.partition("=")
+            name = name.strip().replace("-", "_")
+            if name not in names:
+                raise ValueError(
+                    f"Unknown limit: {name}. Expected one of {', '.join(names)}"
+                )
+            try:
+                values[name] = float(value) if name == "timeout" else int(value)
+            except ValueError:
+                raise ValueError(f"Invalid value for {name}: {value!r}")
+            if values[name] <= 0:
+                raise ValueError(f"{name} must be greater than 0, got {value}")
+        return cls(**values)
+
+    def __bool__(self):
+        return any(getattr(self, field.name) is not None for field in fields(self))
+
+    def check_size(self, size: int):
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise LimitExceeded(
+                "max_bytes",
+                f"Record is {size} bytes, over the limit of {self.max_bytes} bytes",
+            )
+
+    def check_payload(self, payload: bytes | str):
+        if self.max_bytes is None:
+            return
+        if isinstance(payload, str):
+            # a str has at least as many bytes as characters, only count when it matters
+            if len(payload) <= self.max_bytes // 4:
+                return
+            payload = payload.encode("utf-8")
+        self.check_size(len(payload))
+
+    def check_file(self, path: str):
+        if self.max_bytes is not None:
+            self.check_size(os.path.getsize(path))
+
+    def check_record(self, record):
+        """check the nesting depth and list lengths of a parsed record"""
+        if self.max_depth is None and self.max_list_length is None:
+            return
+        stack = [(record, 1)]
+        while stack:
+            value, depth = stack.pop()
+            if isinstance(value, dict):
+                children = value.values()
+            elif isinstance(value, list):
+                if (
+                    self.max_list_length is not None
+                    and len(value) > self.max_list_length
+                ):
+                    raise LimitExceeded(
+                        "max_list_length",
+                        f"Record has a list of {len(value)} items, over the limit of "
+                        f"{self.max_list_length}",
+                    )
+                children = value
+            else:
+                continue
+            if self.max_depth is not None and depth > self.max_depth:
+                raise LimitExceeded(
+                    "max_depth",
+                    f"Record is nested more than {self.max_depth} levels deep",
+                )
+            stack.extend((child, depth + 1) for child in children)
+
+    def deadline(self):
+        """context manager raising RecordTimeout if its block runs over the timeout"""
+        return time_limit(self.timeout)
+
+
+def can_time_out() -> bool:
+    """whether time_limit can interrupt code running in the current thread"""
+    return (
+        hasattr(signal, "setitimer")
+        and threading.current_thread() is threading.main_thread()
+    )
+
+
+@contextmanager
+def time_limit(seconds: Optional[float]):
+    """raise RecordTimeout in the block if it runs for longer than seconds. Does nothing
+    if seconds is None or outside of the main thread (see can_time_out)
+    """
+    if not seconds or not can_time_out():
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise RecordTimeout("timeout", f"Record took longer than {seconds} seconds")
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
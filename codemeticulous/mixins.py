@@ -3,6 +3,31 @@ import json
 
 from .utils import parse_dict_dates
 
+# size of the chunks write_json writes to its file at a time
+WRITE_CHUNK_SIZE = 64 * 1024
+
+
+def _jsonable(value, default):
+    """convert a value to the plain dicts, lists and scalars json.dumps(value,
+    default=default) would encode it as
+    """
+    if isinstance(value, dict):
+        return {
+            key if isinstance(key, str) else json.dumps(key): _jsonable(item, default)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item, default) for item in value]
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return str.__str__(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return _jsonable(default(value), default)
+
 
 class ByAliasExcludeNoneMixin:
     def dict(self, serialize=False):
@@ -28,3 +53,36 @@ class ByAliasExcludeNoneMixin:
         """return a serialized yaml string representation of the object"""
         json_dict = json.loads(self.json())
         return yaml.dump(parse_dict_dates(json_dict), sort_keys=False)
+
+    def _jsonable(self):
+        """the object as the plain data json.loads(self.json()) would return"""
+        if hasattr(self, "model_dump"):
+            return self.model_dump(mode="json", by_alias=True, exclude_none=True)
+        return _jsonable(
+            super().dict(by_alias=True, exclude_none=True), self.__json_encoder__
+        )
+
+    def write_json(self, file):
+        """write the same json as self.json() to a text file, a chunk at a time rather
+        than building the whole string first
+        """
+        if hasattr(self, "model_dump_json"):
+            # pydantic-core serializes straight to a string, without the tree of python
+            # objects streaming it would take, so that is both faster and smaller
+            file.write(self.json())
+            return
+        # what pydantic v1 passes to json.dumps, encoded as it goes
+        encoder = json.JSONEncoder(default=self.__json_encoder__)
+        chunks = encoder.iterencode(super().dict(by_alias=True, exclude_none=True))
+        buffer, size = [], 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= WRITE_CHUNK_SIZE:
+                file.write("".join(buffer))
+                buffer, size = [], 0
+        file.write("".join(buffer))
+
+    def write_yaml(self, file):
+        """write the same yaml as self.yaml() to a text file as it is emitted"""
+        yaml.dump(parse_dict_dates(self._jsonable()), file, sort_keys=False)
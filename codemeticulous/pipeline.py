@@ -0,0 +1,675 @@
+"""
+A streaming conversion pipeline built from explicit stages connected by bounded queues
+
+    source -> load -> validate -> to_canonical -> from_canonical -> serialize -> sink
+
+Each stage runs in its own thread and hands its work to an executor of its own: inline
+(in the stage's thread), a pool of threads or a pool of processes. Queues between stages
+and the number of items each stage has in flight are bounded, so a slow stage holds back
+the ones before it instead of letting items pile up in memory, and loading, validation
+and serialization of different records overlap.
+
+Items keep their input order. An item that fails is marked with a RecordError (tagged
+with the stage that failed, see codemeticulous.failures) and passed through the
+remaining stages untouched, so the caller sees every item exactly once.
+
+Sources yield Items with the raw payload of each input, sinks write the serialized
+outputs of each item. See build_conversion_pipeline for the usual arrangement.
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from operator import attrgetter
+from typing import Any, Callable, Iterable, Iterator, Optional, TextIO
+
+import yaml
+
+from codemeticulous.batch import RecordError, init_worker
+from codemeticulous.convert import STANDARDS, from_canonical
+from codemeticulous.failures import failure_stage
+from codemeticulous.files import (
+    STREAM_FORMATS,
+    InputFile,
+    RecordLine,
+    compression_of,
+    dump_data,
+    format_extension,
+    iter_file_records,
+    open_file,
+    read_ahead,
+    read_input,
+)
+from codemeticulous.index import CorpusIndex, byte_range, iter_lines
+from codemeticulous.limits import RecordLimits, time_limit
+from codemeticulous.shard import Shard
+
+DEFAULT_QUEUE_SIZE = 64
+EXECUTOR_KINDS = ("inline", "thread", "process")
+CONVERSION_STAGES = ("load", "validate", "to_canonical", "from_canonical", "serialize")
+
+
+@dataclass
+class Item:
+    """an input travelling through a pipeline
+
+    index is the position of the input in the source and name describes it in messages.
+    value is what the next stage works on, record is the parsed input (the raw payload
+    until it has been parsed) for dead-letter files, and seconds is the time spent in
+    stages so far. meta holds anything sources want to pass on to sinks
+    """
+
+    index: int
+    name: str
+    value: Any
+    record: Any = None
+    error: Optional[RecordError] = None
+    seconds: float = 0.0
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class ExecutorSpec:
+    """how a stage runs its work: kind is inline, thread or process"""
+
+    kind: str = "inline"
+    workers: int = 1
+
+    def __post_init__(self):
+        if self.kind not in EXECUTOR_KINDS:
+            raise ValueError(
+                f"Unknown executor: {self.kind}. Expected one of "
+                f"{', '.join(EXECUTOR_KINDS)}"
+            )
+        if self.workers < 1:
+            raise ValueError(f"workers must be at least 1, got {self.workers}")
+
+    @classmethod
+    def parse(cls, spec: str) -> "ExecutorSpec":
+        """parse KIND[:WORKERS], e.g. "process:4" """
+        kind, _, workers = spec.partition(":")
+        try:
+            return cls(kind, int(workers) if workers else 1)
+        except ValueError as e:
+            raise ValueError(f"Invalid executor {spec}: {e}")
+
+    def create(self) -> Optional[Executor]:
+        if self.kind == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers)
+        if self.kind == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.workers, initializer=init_worker
+            )
+        return None
+
+
+def _apply(fn, stage_name, value, timeout=None):
+    # runs in the executor, only the value and the outcome cross process boundaries
+    start = time.perf_counter()
+    try:
+        with failure_stage(stage_name), time_limit(timeout):
+            result = fn(value)
+    except Exception as e:
+        return False, RecordError.from_exception(e), time.perf_counter() - start
+    return True, result, time.perf_counter() - start
+
+
+class Stage:
+    """a step of a pipeline that maps each item's value with fn
+
+    fn must be picklable (e.g. a module level function or a partial of one) for the
+    process executor. If keeps_record is set, its result is also kept as the item's
+    record. timeout limits the seconds fn may take for an item, but only applies to the
+    process executor (see codemeticulous.limits.time_limit)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Any],
+        executor: ExecutorSpec = None,
+        keeps_record: bool = False,
+        timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.executor = executor or ExecutorSpec()
+        self.keeps_record = keeps_record
+        self.timeout = timeout
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, {self.executor.kind}:{self.executor.workers})"
+
+
+class FilterStage(Stage):
+    """a stage that drops the items for which predicate(item) is false. Unlike other
+    stages, filters also see items that failed. Filters always run inline, as they
+    usually need state of the calling process (e.g. a journal)
+    """
+
+    def __init__(self, name: str, predicate: Callable[[Item], bool]):
+        super().__init__(name, predicate)
+
+
+# stage functions
+
+
+def parse_payload(value, limits: Optional[RecordLimits] = None):
+    """parse a (text, format) payload, values that are not payloads are already parsed.
+    The size and structure of the record are checked against limits
+    """
+    limits = limits or RecordLimits()
+    if isinstance(value, tuple):
+        text, format = value
+        limits.check_payload(text)
+        if format == "json":
+            value = json.loads(text)
+        elif format == "yaml":
+            value = yaml.safe_load(text)
+        else:
+            raise ValueError(f"Unsupported format: {format}. Expected json or yaml")
+    limits.check_record(value)
+    return value
+
+
+def validate_record(source_format: str, record):
+    if not isinstance(record, dict):
+        raise ValueError(f"Expected a mapping, got {type(record).__name__}")
+    return STANDARDS[source_format]["model"](**record)
+
+
+def canonicalize(source_format: str, instance):
+    return STANDARDS[source_format]["to_canonical"](instance)
+
+
+def convert_canonical(target_formats: list[str], custom_fields: dict, canonical):
+    return {
+        target_format: from_canonical(target_format, canonical, **custom_fields)
+        for target_format in target_formats
+    }
+
+
+def serialize_outputs(formats: dict[str, str], outputs: dict):
+    return {
+        target_format: dump_data(outputs[target_format], formats[target_format])
+        for target_format in formats
+    }
+
+
+def conversion_stages(
+    source_format: str,
+    target_formats: list[str],
+    formats: dict[str, str],
+    executors: Optional[dict[str, ExecutorSpec]] = None,
+    limits: Optional[RecordLimits] = None,
+    **custom_fields,
+) -> list[Stage]:
+    """the stages of a conversion, formats maps each target to the format it is
+    serialized to (see NDJSONSink.formats). executors maps stage names to
+    ExecutorSpecs, stages without one run inline. Records are checked against limits
+    when they are loaded, and the timeout applies to each stage
+    """
+    limits = limits or RecordLimits()
+    executors = executors or {}
+    unknown = set(executors) - set(CONVERSION_STAGES)
+    if unknown:
+        raise ValueError(
+            f"Unknown stage: {', '.join(sorted(unknown))}. Expected one of "
+            f"{', '.join(CONVERSION_STAGES)}"
+        )
+    fns = {
+        "load": partial(parse_payload, limits=limits),
+        "validate": partial(validate_record, source_format),
+        "to_canonical": partial(canonicalize, source_format),
+        "from_canonical": partial(
+            convert_canonical, list(target_formats), custom_fields
+        ),
+        "serialize": partial(serialize_outputs, formats),
+    }
+    return [
+        Stage(
+            name,
+            fns[name],
+            executors.get(name),
+            keeps_record=name == "load",
+            timeout=limits.timeout,
+        )
+        for name in CONVERSION_STAGES
+    ]
+
+
+# sources
+
+
+class FileSource:
+    """one item per file, read as text. The format is detected from the extension.
+    With read_ahead, up to that many files are read at a time on a pool of threads (see
+    files.read_ahead), so that later reads are in flight while earlier files are parsed
+    """
+
+    def __init__(
+        self, input_files: Iterable[InputFile], read_ahead: Optional[int] = None
+    ):
+        self.input_files = input_files
+        self.read_ahead = read_ahead
+
+    def __iter__(self) -> Iterator[Item]:
+        if self.read_ahead:
+            contents = read_ahead(
+                self.input_files,
+                self.read_ahead,
+                path=attrgetter("path"),
+                read=InputFile.read,
+            )
+        else:
+            contents = (
+                (index, input_file, input_file.content)
+                for index, input_file in enumerate(self.input_files)
+            )
+        for index, input_file, content in contents:
+            meta = {"input_file": input_file}
+            format = STREAM_FORMATS.get(format_extension(input_file.path), "json")
+            try:
+                if isinstance(content, Exception):
+                    raise content
+                if content is None:
+                    content = read_input(input_file.path)
+                text = content.decode("utf-8")
+            except (OSError, UnicodeDecodeError) as e:
+                item = Item(index, input_file.path, None, meta=meta)
+                e.stage = "load"
+                item.error = RecordError.from_exception(e)
+            else:
+                item = Item(index, input_file.path, (text, format), text, meta=meta)
+            yield item
+
+
+class NDJSONSource:
+    """one item per record in JSON lines or multi-document YAML streams ("-" is stdin),
+    or in JSON streams holding one array of records, read with files.iter_file_records
+    (which limits applies to). JSON lines are parsed by the load stage, YAML documents
+    and array elements are parsed as they are read. Compressed files (e.g.
+    corpus.ndjson.gz) are decompressed as they are read
+    """
+
+    def __init__(
+        self,
+        paths: Iterable[str],
+        default_format: str = "json",
+        limits: Optional[RecordLimits] = None,
+    ):
+        self.paths = paths
+        self.default_format = default_format
+        self.limits = limits
+
+    def __iter__(self) -> Iterator[Item]:
+        index = 0
+        for path in self.paths:
+            records = iter_file_records(
+                path, self.default_format, self.limits, parse_lines=False
+            )
+            for record in records:
+                name = f"record {index}"
+                if isinstance(record, Exception):
+                    item = Item(index, name, None, getattr(record, "payload", None))
+                    item.error = RecordError.from_exception(record)
+                elif isinstance(record, RecordLine):
+                    line = str(record)
+                    item = Item(index, name, (line, "json"), line)
+                else:
+                    item = Item(index, name, record, record)
+                yield item
+                index += 1
+
+
+class IndexedSource:
+    """one item per record of indexed NDJSON corpora (see codemeticulous.index) that is
+    identified by one of keys, read through mmap without reading the rest of the corpora.
+    Items are named after their position in their corpus, like NDJSONSource names them.
+    The keys that are in none of the indexes are in missing once the source is read
+    """
+
+    def __init__(self, paths: Iterable[str], keys: Iterable[str]):
+        # loaded up front, so that a missing or stale index fails before anything runs
+        self.indexes = [CorpusIndex.load(path) for path in paths]
+        self.keys = list(keys)
+        self.missing: list[str] = []
+
+    def __iter__(self) -> Iterator[Item]:
+        found = set()
+        index = 0
+        for corpus_index in self.indexes:
+            entries, _ = corpus_index.lookup(self.keys)
+            found.update(entry.key for entry in entries)
+            for entry, line in corpus_index.read_lines(entries):
+                text = line.decode("utf-8")
+                name = f"record {entry.position}"
+                meta = {"position": entry.position}
+                yield Item(index, name, (text, "json"), text, meta=meta)
+                index += 1
+        self.missing = [key for key in dict.fromkeys(self.keys) if key not in found]
+
+
+class ByteRangeSource:
+    """one item per line of part i/N of the bytes of each NDJSON file (see
+    index.read_range), so that N workers can each read their share of the same corpora
+    without an index or a coordinator. Items are named after the offset of their line.
+    A line that straddles the boundary of two parts belongs to the one it starts in
+    """
+
+    def __init__(self, paths: Iterable[str], part: Shard):
+        self.paths = list(paths)
+        self.part = part
+        for path in self.paths:
+            if path == "-" or compression_of(path) is not None:
+                raise ValueError(
+                    f"Can't read a byte range of {path}, only of uncompressed files"
+                )
+
+    def __iter__(self) -> Iterator[Item]:
+        index = 0
+        for path in self.paths:
+            start, end = byte_range(os.path.getsize(path), self.part)
+            with open(path, "rb") as corpus:
+                for offset, line in iter_lines(corpus, start, end):
+                    if line.strip():
+                        text = line.decode("utf-8")
+                        name = f"record at byte {offset} of {path}"
+                        yield Item(index, name, (text, "json"), text)
+                        index += 1
+
+
+# sinks
+
+
+class NDJSONSink:
+    """writes the outputs of each item as one JSON line per target, to the stream given
+    for each target or to stdout
+    """
+
+    def __init__(self, outputs: Optional[dict[str, TextIO]] = None):
+        self.outputs = outputs or {}
+
+    def formats(self, target_formats: list[str]) -> dict[str, str]:
+        return {target_format: "json" for target_format in target_formats}
+
+    def write(self, item: Item):
+        for target_format, text in item.value.items():
+            output = self.outputs.get(target_format, sys.stdout)
+            output.write(text)
+            output.write("\n")
+
+    def flush(self):
+        for output in set(self.outputs.values()) or [sys.stdout]:
+            output.flush()
+
+
+class FileSink:
+    """writes the outputs of items from a FileSource to files named with a template
+    (see InputFile.output_path)
+    """
+
+    def __init__(self, output_dir: str, name_template: str):
+        self.output_dir = output_dir
+        self.name_template = name_template
+
+    def formats(self, target_formats: list[str]) -> dict[str, str]:
+        return {
+            target_format: STANDARDS[target_format]["format"]
+            for target_format in target_formats
+        }
+
+    def output_paths(self, item: Item) -> dict[str, str]:
+        input_file = item.meta["input_file"]
+        return {
+            target_format: input_file.output_path(
+                self.output_dir,
+                self.name_template,
+                target_format,
+                STANDARDS[target_format]["extension"],
+                STANDARDS[target_format]["filename"],
+            )
+            for target_format in item.value
+        }
+
+    def write(self, item: Item):
+        paths = self.output_paths(item)
+        for target_format, text in item.value.items():
+            path = paths[target_format]
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open_file(path, "w") as output_file:
+                output_file.write(text)
+        item.meta["output_paths"] = paths
+
+    def flush(self):
+        pass
+
+
+# pipeline
+
+_END = object()
+
+
+class _Aborted(Exception):
+    pass
+
+
+class Pipeline:
+    """runs items from source through stages into sink, see the module docstring
+
+    queue_size bounds the queues between stages, and each stage has at most twice its
+    number of workers items in flight
+    """
+
+    def __init__(
+        self,
+        source: Iterable[Item],
+        stages: list[Stage],
+        sink=None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        self.source = source
+        self.stages = stages
+        self.sink = sink
+        self.queue_size = queue_size
+        self._abort = threading.Event()
+        self._error = None
+
+    def run(self) -> Iterator[Item]:
+        """run the pipeline, yielding each item in input order once it has been written
+        to the sink (or has failed)
+        """
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        executors = self._executors = []
+        threads = [
+            threading.Thread(
+                target=self._guard,
+                args=(self._feed, queues[0]),
+                name="pipeline-source",
+                daemon=True,
+            )
+        ]
+        try:
+            for stage, inq, outq in zip(self.stages, queues, queues[1:]):
+                executor = None
+                if not isinstance(stage, FilterStage):
+                    executor = stage.executor.create()
+                executors.append(executor)
+                threads.append(
+                    threading.Thread(
+                        target=self._guard,
+                        args=(self._run_stage, outq, stage, executor, inq),
+                        name=f"pipeline-{stage.name}",
+                        daemon=True,
+                    )
+                )
+            for thread in threads:
+                thread.start()
+
+            while True:
+                try:
+                    item = self._get(queues[-1])
+                except _Aborted:
+                    break
+                if item is _END:
+                    break
+                if item.ok and self.sink is not None:
+                    start = time.perf_counter()
+                    try:
+                        with failure_stage("write"):
+                            self.sink.write(item)
+                    except Exception as e:
+                        item.error = RecordError.from_exception(e)
+                    item.seconds += time.perf_counter() - start
+                yield item
+            if self.sink is not None and self._error is None:
+                self.sink.flush()
+        finally:
+            self._abort.set()
+            for thread in threads:
+                if thread.is_alive():
+                    thread.join()
+            # including the executors started to replace one after a timeout
+            for executor in self._executors:
+                if executor is not None:
+                    executor.shutdown(wait=True, cancel_futures=True)
+        if self._error is not None:
+            raise self._error
+
+    def _guard(self, fn, outq, *args):
+        # an unexpected error (e.g. in the source) stops the whole pipeline
+        try:
+            fn(outq, *args)
+        except _Aborted:
+            return
+        except BaseException as e:
+            self._error = self._error or e
+            self._abort.set()
+        try:
+            self._put(outq, _END)
+        except _Aborted:
+            pass
+
+    def _put(self, q: queue.Queue, item):
+        while True:
+            if self._abort.is_set() and item is not _END:
+                raise _Aborted()
+            try:
+                q.put(item, timeout=0.05)
+                return
+            except queue.Full:
+                if self._abort.is_set():
+                    raise _Aborted()
+
+    def _get(self, q: queue.Queue):
+        while True:
+            try:
+                return q.get(timeout=0.05)
+            except queue.Empty:
+                if self._abort.is_set():
+                    raise _Aborted()
+
+    def _feed(self, outq):
+        for item in self.source:
+            self._put(outq, item)
+
+    def _run_stage(self, outq, stage: Stage, executor: Optional[Executor], inq):
+        pending = deque()
+        max_pending = 2 * stage.executor.workers
+        while True:
+            item = self._get(inq)
+            if item is _END:
+                break
+            if isinstance(stage, FilterStage):
+                if not stage.fn(item):
+                    continue
+                pending.append((item, None))
+            elif not item.ok:
+                pending.append((item, None))
+            elif executor is None:
+                outcome = _apply(stage.fn, stage.name, item.value, stage.timeout)
+                pending.append((item, outcome))
+            else:
+                future = executor.submit(
+                    _apply, stage.fn, stage.name, item.value, stage.timeout
+                )
+                future.executor = executor
+                pending.append((item, future))
+            while pending and (len(pending) >= max_pending or _is_ready(pending[0][1])):
+                executor = self._emit(outq, stage, executor, *pending.popleft())
+        while pending:
+            executor = self._emit(outq, stage, executor, *pending.popleft())
+
+    def _recycle(self, stage: Stage, executor: Executor) -> Executor:
+        # a worker process that timed out may have been interrupted anywhere, so the
+        # pool is replaced, the old one finishes the items it was given
+        new_executor = stage.executor.create()
+        self._executors.append(new_executor)
+        executor.shutdown(wait=False)
+        return new_executor
+
+    def _emit(self, outq, stage: Stage, executor, item: Item, outcome):
+        """pass on an item once its outcome is ready, returning the executor to use for
+        the stage from then on
+        """
+        if outcome is not None:
+            outcome_source = outcome
+            if not isinstance(outcome, tuple):
+                outcome = outcome.result()
+            ok, result, seconds = outcome
+            item.seconds += seconds
+            if not ok:
+                item.error = result
+                if (
+                    result.error_type == "RecordTimeout"
+                    and stage.executor.kind == "process"
+                    and getattr(outcome_source, "executor", None) is executor
+                ):
+                    executor = self._recycle(stage, executor)
+            else:
+                item.value = result
+                if stage.keeps_record:
+                    item.record = result
+        self._put(outq, item)
+        return executor
+
+
+def _is_ready(outcome) -> bool:
+    return outcome is None or isinstance(outcome, tuple) or outcome.done()
+
+
+def build_conversion_pipeline(
+    source_format: str,
+    target_formats: list[str],
+    source: Iterable[Item],
+    sink,
+    executors: Optional[dict[str, ExecutorSpec]] = None,
+    filters: Iterable[FilterStage] = (),
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    limits: Optional[RecordLimits] = None,
+    **custom_fields,
+) -> Pipeline:
+    """a pipeline converting the items of source to each target format and writing them
+    to sink. filters run right after the load stage
+    """
+    stages = conversion_stages(
+        source_format,
+        target_formats,
+        sink.formats(target_formats),
+        executors,
+        limits,
+        **custom_fields,
+    )
+    stages[1:1] = list(filters)
+    return Pipeline(source, stages, sink, queue_size=queue_size)
@@ -0,0 +1,207 @@
+"""
+JSON summaries of batch runs, which can be merged across the shards of a job
+
+Timings are kept in a histogram with logarithmically spaced buckets (each about 19%
+wider than the previous) rather than as a list, so that reports stay small for large
+batches and percentiles of merged reports are as accurate as those of a single one.
+"""
+
+import json
+import math
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from codemeticulous.shard import Shard
+
+REPORT_VERSION = 1
+# smallest bucket upper bound in seconds, and the ratio between successive bounds
+HISTOGRAM_BASE = 1e-4
+HISTOGRAM_RATIO = 2**0.25
+PERCENTILES = (50, 90, 99)
+
+
+def bucket_index(seconds: float) -> int:
+    if seconds <= HISTOGRAM_BASE:
+        return 0
+    return math.ceil(math.log(seconds / HISTOGRAM_BASE, HISTOGRAM_RATIO))
+
+
+def bucket_bound(index: int) -> float:
+    """upper bound of a histogram bucket in seconds"""
+    return HISTOGRAM_BASE * HISTOGRAM_RATIO**index
+
+
+@dataclass
+class BatchReport:
+    """summary of a batch: counts, failures with their errors and timings of each item
+
+    shard is the "i/N" shard the batch was restricted to, if any, and shards lists those
+    of the reports a merged report was made from
+    """
+
+    command: str
+    shard: Optional[str] = None
+    argv: list[str] = field(default_factory=list)
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    failures: list[dict] = field(default_factory=list)
+    histogram: dict[int, int] = field(default_factory=dict)
+    seconds_total: float = 0.0
+    seconds_max: float = 0.0
+    wall_seconds: float = 0.0
+    shards: list[str] = field(default_factory=list)
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def add(self, item: str, seconds: Optional[float], error=None):
+        """record the outcome of an item, error is None if it succeeded"""
+        self.total += 1
+        if error is None:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+            self.failures.append({"input": item, "error": str(error)})
+        if seconds is not None:
+            index = bucket_index(seconds)
+            self.histogram[index] = self.histogram.get(index, 0) + 1
+            self.seconds_total += seconds
+            self.seconds_max = max(self.seconds_max, seconds)
+
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self._started
+
+    def percentile(self, q: float) -> float:
+        """estimate of the q-th percentile of item timings, the upper bound of the bucket
+        it falls in (but no more than the slowest item)
+        """
+        count = sum(self.histogram.values())
+        if not count:
+            return 0.0
+        rank = math.ceil(count * q / 100)
+        seen = 0
+        for index in sorted(self.histogram):
+            seen += self.histogram[index]
+            if seen >= rank:
+                return min(bucket_bound(index), self.seconds_max)
+        return self.seconds_max
+
+    def to_dict(self) -> dict:
+        timed = sum(self.histogram.values())
+        data = {
+            "version": REPORT_VERSION,
+            "command": self.command,
+            "shard": self.shard,
+            "argv": self.argv,
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "failures": self.failures,
+            "timing": {
+                "count": timed,
+                "wall_seconds": round(self.wall_seconds, 6),
+                "mean_seconds": round(self.seconds_total / timed, 6) if timed else 0,
+                "max_seconds": round(self.seconds_max, 6),
+                **{f"p{q}_seconds": round(self.percentile(q), 6) for q in PERCENTILES},
+                "seconds_total": self.seconds_total,
+                "histogram": {
+                    str(index): self.histogram[index]
+                    for index in sorted(self.histogram)
+                },
+            },
+        }
+        if self.shards:
+            data["shards"] = self.shards
+            data["missing_shards"] = missing_shards(self.shards)
+            data["failed_shards"] = sorted(
+                {failure["shard"] for failure in self.failures if "shard" in failure}
+            )
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BatchReport":
+        if data.get("version") != REPORT_VERSION:
+            raise ValueError(f"Unsupported report version: {data.get('version')}")
+        timing = data["timing"]
+        return cls(
+            command=data["command"],
+            shard=data.get("shard"),
+            argv=data.get("argv", []),
+            total=data["total"],
+            succeeded=data["succeeded"],
+            failed=data["failed"],
+            failures=data["failures"],
+            histogram={int(k): v for k, v in timing["histogram"].items()},
+            seconds_total=timing["seconds_total"],
+            seconds_max=timing["max_seconds"],
+            wall_seconds=timing["wall_seconds"],
+            shards=data.get("shards", []),
+        )
+
+    def write(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+            file.write("\n")
+
+    @classmethod
+    def read(cls, path: str) -> "BatchReport":
+        with open(path, "r") as file:
+            try:
+                return cls.from_dict(json.load(file))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Invalid report {path}: {e}")
+
+
+def start_report(command: str, shard=None) -> BatchReport:
+    return BatchReport(
+        command=command,
+        shard=str(shard) if shard is not None else None,
+        argv=sys.argv[1:],
+    )
+
+
+def merge_reports(reports: Iterable[BatchReport]) -> BatchReport:
+    """combine the reports of several shards (or runs) into one. wall_seconds of the
+    merged report is that of the slowest shard
+    """
+    reports = list(reports)
+    if not reports:
+        raise ValueError("No reports to merge")
+    commands = {report.command for report in reports}
+    merged = BatchReport(command=" ".join(sorted(commands)))
+    for report in reports:
+        merged.total += report.total
+        merged.succeeded += report.succeeded
+        merged.failed += report.failed
+        shard = report.shard or "all"
+        if report.shards:
+            # already a merged report, its failures are labelled with their shard
+            merged.failures.extend(report.failures)
+        else:
+            merged.failures.extend(
+                {**failure, "shard": shard} for failure in report.failures
+            )
+        for index, count in report.histogram.items():
+            merged.histogram[index] = merged.histogram.get(index, 0) + count
+        merged.seconds_total += report.seconds_total
+        merged.seconds_max = max(merged.seconds_max, report.seconds_max)
+        merged.wall_seconds = max(merged.wall_seconds, report.wall_seconds)
+        merged.shards.extend(report.shards or [shard])
+    return merged
+
+
+def missing_shards(shards: Iterable[str]) -> list[str]:
+    """shards of an i/N partitioning that none of the given shards cover. Empty if the
+    shards aren't all of the same partitioning
+    """
+    try:
+        parsed = {Shard.parse(shard) for shard in shards}
+    except ValueError:
+        return []
+    counts = {shard.count for shard in parsed}
+    if len(counts) != 1:
+        return []
+    (count,) = counts
+    seen = {shard.index for shard in parsed}
+    return [str(Shard(i, count)) for i in range(count) if i not in seen]
@@ -0,0 +1,435 @@
+"""
+A long-lived local HTTP conversion service that keeps the models warm between requests
+
+Endpoints:
+- POST /convert/{from}/{to}: convert the metadata in the request body, responds with the
+  converted metadata in the target's format
+- POST /validate/{format}: validate the metadata in the request body
+- POST /batch/{from}/{to}: convert JSON lines, responds with one JSON object per line
+  holding either the converted "output" or an "error" for each record
+- GET /health: liveness check
+- GET /metrics: request counts and timings as JSON
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from codemeticulous.batch import init_worker, resolve_workers
+from codemeticulous.convert import STANDARDS, convert
+from codemeticulous.files import dump_data
+from codemeticulous.limits import RecordLimits, RecordTimeout
+from codemeticulous.pipeline import parse_payload
+
+DEFAULT_MAX_REQUEST_SIZE = 16 * 1024 * 1024
+# number of batch records sent to a worker at a time
+BATCH_CHUNKSIZE = 16
+
+
+def convert_payload(
+    source_format: str,
+    target_format: str,
+    payload: str,
+    limits: Optional[RecordLimits] = None,
+) -> tuple[bool, str]:
+    """convert a serialized record, returning (ok, converted data or error message).
+    RecordTimeout is raised rather than returned, so that the worker can be replaced
+    """
+    limits = limits or RecordLimits()
+    try:
+        with limits.deadline():
+            data = parse_payload((payload, STANDARDS[source_format]["format"]), limits)
+            converted = convert(source_format, target_format, data)
+            return True, dump_data(converted, STANDARDS[target_format]["format"])
+    except RecordTimeout:
+        raise
+    except Exception as e:
+        return False, str(e)
+
+
+def validate_payload(
+    format_name: str, payload: str, limits: Optional[RecordLimits] = None
+) -> tuple[bool, str]:
+    """see convert_payload"""
+    limits = limits or RecordLimits()
+    try:
+        with limits.deadline():
+            data = parse_payload((payload, STANDARDS[format_name]["format"]), limits)
+            STANDARDS[format_name]["model"](**data)
+            return True, ""
+    except RecordTimeout:
+        raise
+    except Exception as e:
+        return False, str(e)
+
+
+def convert_lines(
+    source_format: str,
+    target_format: str,
+    lines: list[tuple[int, str]],
+    limits: Optional[RecordLimits] = None,
+) -> list[tuple[bool, str, bool]]:
+    """convert numbered JSON lines, returning (ok, JSON line with the outcome, whether
+    it timed out) for each
+    """
+    limits = limits or RecordLimits()
+    results = []
+    for index, line in lines:
+        try:
+            with limits.deadline():
+                data = parse_payload((line, "json"), limits)
+                converted = convert(source_format, target_format, data)
+                result = {"index": index, "output": json.loads(converted.json())}
+        except Exception as e:
+            result = {"index": index, "error": str(e), "error_type": type(e).__name__}
+        results.append(
+            (
+                "error" not in result,
+                json.dumps(result),
+                result.get("error_type") == "RecordTimeout",
+            )
+        )
+    return results
+
+
+class Metrics:
+    """thread-safe request counters for the /metrics endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}
+        self.responses = {}
+        self.records = {"converted": 0, "failed": 0}
+        self.in_flight = 0
+        self.seconds_total = 0.0
+        self.seconds_max = 0.0
+
+    def start(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.in_flight += 1
+
+    def finish(self, status: int, seconds: float):
+        with self._lock:
+            self.responses[str(status)] = self.responses.get(str(status), 0) + 1
+            self.in_flight -= 1
+            self.seconds_total += seconds
+            self.seconds_max = max(self.seconds_max, seconds)
+
+    def count_records(self, converted: int = 0, failed: int = 0):
+        with self._lock:
+            self.records["converted"] += converted
+            self.records["failed"] += failed
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            handled = sum(self.responses.values())
+            return {
+                "uptime_seconds": round(time.time() - self.started, 3),
+                "requests": dict(self.requests),
+                "responses": dict(self.responses),
+                "records": dict(self.records),
+                "in_flight": self.in_flight,
+                "latency_seconds": {
+                    "mean": round(self.seconds_total / handled, 6) if handled else 0,
+                    "max": round(self.seconds_max, 6),
+                },
+            }
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """threaded HTTP server that hands conversion work off to an executor
+
+    If executor_factory is given, it is used to replace the executor when one of its
+    workers times out (see codemeticulous.limits)
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        executor: Executor,
+        max_request_size: int = DEFAULT_MAX_REQUEST_SIZE,
+        quiet: bool = False,
+        limits: Optional[RecordLimits] = None,
+        executor_factory: Optional[Callable[[], Executor]] = None,
+    ):
+        super().__init__(address, ConversionRequestHandler)
+        self.executor = executor
+        self.executor_factory = executor_factory
+        self.max_request_size = max_request_size
+        self.quiet = quiet
+        self.limits = limits or RecordLimits()
+        self.metrics = Metrics()
+        self._executor_lock = threading.Lock()
+
+    def recycle_executor(self, executor: Executor):
+        """replace executor, whose worker timed out, by a new one. The old one is shut
+        down once the work it was given is done
+        """
+        with self._executor_lock:
+            if self.executor_factory is None or self.executor is not executor:
+                return
+            self.executor = self.executor_factory()
+        executor.shutdown(wait=False)
+
+    def submit(self, fn, *args) -> tuple[Executor, Future]:
+        """submit fn to the current executor, returns the executor along with the future
+        so that it can be recycled if fn times out. Another thread may recycle the
+        executor between reading and submitting to it, the work then goes to its
+        replacement
+        """
+        while True:
+            executor = self.executor
+            try:
+                return executor, executor.submit(fn, *args)
+            except RuntimeError:
+                # cannot schedule new futures after shutdown
+                if self.executor is executor:
+                    raise
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    server: ConversionServer
+    server_version = "codemeticulous"
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if parts == ["health"]:
+            self._handle("health", self._send_json, HTTPStatus.OK, {"status": "ok"})
+        elif parts == ["metrics"]:
+            self._handle(
+                "metrics", self._send_json, HTTPStatus.OK, self.server.metrics.as_dict()
+            )
+        else:
+            self._handle("unknown", self._send_error, HTTPStatus.NOT_FOUND, "Not found")
+
+    def do_POST(self):
+        parts = self._path_parts()
+        if len(parts) == 3 and parts[0] == "convert":
+            self._handle("convert", self._convert, parts[1], parts[2])
+        elif len(parts) == 2 and parts[0] == "validate":
+            self._handle("validate", self._validate, parts[1])
+        elif len(parts) == 3 and parts[0] == "batch":
+            self._handle("batch", self._batch, parts[1], parts[2])
+        else:
+            self._handle("unknown", self._send_error, HTTPStatus.NOT_FOUND, "Not found")
+
+    def _handle(self, endpoint: str, handler, *args):
+        metrics = self.server.metrics
+        metrics.start(endpoint)
+        start = time.perf_counter()
+        self._status = HTTPStatus.INTERNAL_SERVER_ERROR
+        try:
+            handler(*args)
+        except Exception as e:
+            self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+        finally:
+            metrics.finish(self._status, time.perf_counter() - start)
+
+    def _convert(self, source_format: str, target_format: str):
+        if not self._check_formats(source_format, target_format):
+            return
+        payload = self._read_body()
+        if payload is None:
+            return
+        ok, output = self._submit(
+            convert_payload, source_format, target_format, payload, self.server.limits
+        )
+        self.server.metrics.count_records(converted=int(ok), failed=int(not ok))
+        if not ok:
+            self._send_error(HTTPStatus.UNPROCESSABLE_ENTITY, output)
+            return
+        content_type = (
+            "application/json"
+            if STANDARDS[target_format]["format"] == "json"
+            else "application/yaml"
+        )
+        self._send(HTTPStatus.OK, output, content_type)
+
+    def _validate(self, format_name: str):
+        if not self._check_formats(format_name):
+            return
+        payload = self._read_body()
+        if payload is None:
+            return
+        ok, error = self._submit(
+            validate_payload, format_name, payload, self.server.limits
+        )
+        if ok:
+            self._send_json(HTTPStatus.OK, {"valid": True})
+        else:
+            self._send_json(
+                HTTPStatus.UNPROCESSABLE_ENTITY, {"valid": False, "error": error}
+            )
+
+    def _batch(self, source_format: str, target_format: str):
+        if not self._check_formats(source_format, target_format):
+            return
+        payload = self._read_body()
+        if payload is None:
+            return
+        lines = [
+            (index, line)
+            for index, line in enumerate(
+                line for line in payload.splitlines() if line.strip()
+            )
+        ]
+        chunks = [
+            lines[i : i + BATCH_CHUNKSIZE]
+            for i in range(0, len(lines), BATCH_CHUNKSIZE)
+        ]
+        submitted = [
+            self.server.submit(
+                convert_lines, source_format, target_format, chunk, self.server.limits
+            )
+            for chunk in chunks
+        ]
+        results = []
+        for executor, future in submitted:
+            chunk_results = future.result()
+            if any(timed_out for _, _, timed_out in chunk_results):
+                self.server.recycle_executor(executor)
+            results.extend(chunk_results)
+        failed = sum(not ok for ok, _, _ in results)
+        self.server.metrics.count_records(
+            converted=len(results) - failed, failed=failed
+        )
+        body = "".join(line + "\n" for _, line, _ in results)
+        self._send(HTTPStatus.OK, body, "application/x-ndjson")
+
+    def _submit(self, fn, *args) -> tuple[bool, str]:
+        """run fn on the executor, a timeout is returned as a failure"""
+        executor, future = self.server.submit(fn, *args)
+        try:
+            return future.result()
+        except RecordTimeout as e:
+            self.server.recycle_executor(executor)
+            return False, str(e)
+
+    def _check_formats(self, *formats) -> bool:
+        for format_name in formats:
+            if format_name not in STANDARDS:
+                self._send_error(
+                    HTTPStatus.NOT_FOUND,
+                    f"Unknown format: {format_name}. Expected one of "
+                    f"{', '.join(STANDARDS)}",
+                )
+                return False
+        return True
+
+    def _read_body(self) -> Optional[str]:
+        """read the request body, or send an error response and return None"""
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self._send_error(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+            return None
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # read(-1) would read until the client closes the connection
+            self.close_connection = True
+            self._send_error(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+            return None
+        if length > self.server.max_request_size:
+            self.close_connection = True
+            self._send_error(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                f"Request body is larger than {self.server.max_request_size} bytes",
+            )
+            return None
+        try:
+            return self.rfile.read(length).decode("utf-8")
+        except UnicodeDecodeError as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, f"Invalid UTF-8: {e}")
+            return None
+
+    def _path_parts(self) -> list[str]:
+        path = self.path.split("?", 1)[0]
+        return [part for part in path.split("/") if part]
+
+    def _send_error(self, status: int, message: str):
+        self._send_json(status, {"error": message})
+
+    def _send_json(self, status: int, data: dict):
+        self._send(status, json.dumps(data), "application/json")
+
+    def _send(self, status: int, body: str, content_type: str):
+        self._status = status
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def start_pool(workers: int) -> ProcessPoolExecutor:
+    """a pool of worker processes, all started and warmed up"""
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+    for future in [executor.submit(init_worker) for _ in range(workers)]:
+        future.result()
+    return executor
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    workers: Optional[int] = None,
+    max_request_size: int = DEFAULT_MAX_REQUEST_SIZE,
+    executor: Optional[Executor] = None,
+    quiet: bool = False,
+    limits: Optional[RecordLimits] = None,
+) -> ConversionServer:
+    """create a conversion server. Work is done on executor, or a pool of warm worker
+    processes if None, which is replaced when a worker times out. The caller is
+    responsible for shutting down a given executor. limits apply to each record (see
+    codemeticulous.limits), timeouts only to worker processes
+    """
+    executor_factory = None
+    if executor is None:
+        executor_factory = partial(start_pool, resolve_workers(workers))
+        # start all workers now rather than on the first requests
+        executor = executor_factory()
+    return ConversionServer(
+        (host, port),
+        executor,
+        max_request_size,
+        quiet,
+        limits=limits,
+        executor_factory=executor_factory,
+    )
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    workers: Optional[int] = None,
+    max_request_size: int = DEFAULT_MAX_REQUEST_SIZE,
+    quiet: bool = False,
+    limits: Optional[RecordLimits] = None,
+):
+    """run a conversion server until interrupted"""
+    server = make_server(
+        host, port, workers, max_request_size, quiet=quiet, limits=limits
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.executor.shutdown(cancel_futures=True)
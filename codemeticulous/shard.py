@@ -0,0 +1,53 @@
+"""
+Deterministic partitioning of a batch into disjoint shards, so that independent jobs (e.g.
+the tasks of a cluster array job) can each process a stable slice of the same inputs
+without coordinating
+"""
+
+import hashlib
+from typing import Any, NamedTuple
+
+# keys that identify a record in a stream, in order of preference
+RECORD_ID_KEYS = ("@id", "id", "identifier", "doi")
+
+
+class Shard(NamedTuple):
+    """shard number index (counting from 0) of count shards"""
+
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, spec: str) -> "Shard":
+        """parse a shard given as "i/N", e.g. "0/4" is the first of four shards"""
+        try:
+            index, count = (int(part) for part in spec.split("/"))
+        except ValueError:
+            raise ValueError(f"Invalid shard: {spec}. Expected i/N, e.g. 0/4")
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(
+                f"Invalid shard: {spec}. i must be between 0 and N - 1 and N at least 1"
+            )
+        return cls(index, count)
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def contains(self, key: str) -> bool:
+        """whether the item identified by key belongs to this shard. The same key always
+        maps to the same shard, on any host and with any python version
+        """
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.count == self.index
+
+
+def record_key(record: Any, index: int) -> str:
+    """the key used to shard a record in a stream: its identifier if it has one,
+    otherwise its position in the stream
+    """
+    if isinstance(record, dict):
+        for key in RECORD_ID_KEYS:
+            value = record.get(key)
+            if isinstance(value, str) and value:
+                return value
+    return f"#{index}"
@@ -0,0 +1,269 @@
+"""
+Hand-off of records to worker processes through shared memory
+
+convert_many pickles every input record on its way to a worker and every converted
+model on its way back, which for small records costs about as much as converting them.
+convert_payloads instead takes records as raw (JSON or YAML) bytes and returns the
+serialized outputs as bytes. Both are written into a ring of fixed size slots in a block
+of shared memory that every worker is attached to, so only slot numbers and lengths go
+through the pool's queues. Payloads or outputs that don't fit in a slot are passed along
+with the task as usual.
+"""
+
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterable, Iterator, Optional
+
+import yaml
+
+from codemeticulous.batch import (
+    DEFAULT_CHUNKSIZE,
+    RecordError,
+    RecordResult,
+    chunked,
+    init_worker,
+    resolve_workers,
+    run_chunks,
+    timed_out,
+)
+from codemeticulous.convert import STANDARDS, convert_to_many
+from codemeticulous.failures import failure_stage
+from codemeticulous.files import dump_data
+from codemeticulous.limits import RecordLimits
+
+DEFAULT_SLOT_SIZE = 256 * 1024
+
+
+def _attach(name: str) -> SharedMemory:
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 registers every attached block with the resource tracker, which
+        # would unlink it when the worker exits while the pool is still using it
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedRing:
+    """a block of shared memory cut into slots of slot_size bytes. The ring is created
+    unless the name of an existing one is given, and is unlinked when its creator closes
+    it
+    """
+
+    def __init__(self, slots: int, slot_size: int, name: Optional[str] = None):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.owner = name is None
+        if self.owner:
+            self.shm = SharedMemory(create=True, size=slots * slot_size)
+        else:
+            self.shm = _attach(name)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, slot: int, data: bytes) -> bool:
+        """copy data into a slot, False if it doesn't fit"""
+        if len(data) > self.slot_size:
+            return False
+        offset = slot * self.slot_size
+        self.shm.buf[offset : offset + len(data)] = data
+        return True
+
+    def read(self, slot: int, length: int) -> bytes:
+        offset = slot * self.slot_size
+        return bytes(self.shm.buf[offset : offset + length])
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def convert_bytes(
+    source_format: str,
+    input_format: str,
+    formats: dict[str, str],
+    custom_fields: dict,
+    limits: Optional[RecordLimits],
+    index: int,
+    payload: bytes,
+) -> RecordResult:
+    """convert a record given as bytes, the outputs of the result map each target format
+    to its serialized output, encoded as utf-8
+    """
+    limits = limits or RecordLimits()
+    start = time.perf_counter()
+    try:
+        with limits.deadline():
+            with failure_stage("load"):
+                limits.check_payload(payload)
+                if input_format == "yaml":
+                    record = yaml.safe_load(payload)
+                else:
+                    record = json.loads(payload)
+                limits.check_record(record)
+            outputs = convert_to_many(
+                source_format, list(formats), record, **custom_fields
+            )
+            outputs = {
+                target_format: dump_data(outputs[target_format], format).encode("utf-8")
+                for target_format, format in formats.items()
+            }
+    except Exception as e:
+        result = RecordResult(index, error=RecordError.from_exception(e))
+    else:
+        result = RecordResult(index, outputs=outputs)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+# the ring of a worker process, see _init_ring_worker
+_ring: Optional[SharedRing] = None
+
+
+def _init_ring_worker(name: str, slots: int, slot_size: int):
+    global _ring
+    init_worker()
+    _ring = SharedRing(slots, slot_size, name=name)
+
+
+def _convert_slots(convert, tasks):
+    # runs in a worker. Outputs are written over the input in the same slot, what is
+    # sent back is (index, lengths of the outputs, outputs that didn't fit, error, seconds)
+    results = []
+    for index, slot, length, payload in tasks:
+        if payload is None:
+            payload = _ring.read(slot, length)
+        result = convert(index, payload)
+        if not result.ok:
+            results.append((index, None, None, result.error, result.seconds))
+            continue
+        data = b"".join(result.outputs.values())
+        if _ring.write(slot, data):
+            lengths = [len(output) for output in result.outputs.values()]
+            results.append((index, lengths, None, None, result.seconds))
+        else:
+            results.append((index, None, result.outputs, None, result.seconds))
+    return results
+
+
+def convert_payloads(
+    source_format: str,
+    target_formats: str | list[str],
+    payloads: Iterable[bytes],
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    slot_size: int = DEFAULT_SLOT_SIZE,
+    input_format: Optional[str] = None,
+    output_format: Optional[str] = None,
+    limits: Optional[RecordLimits] = None,
+    **custom_fields,
+) -> Iterator[RecordResult]:
+    """
+    Convert many records given as bytes, passing them to a pool of worker processes and
+    back through shared memory.
+
+    Args:
+    - payloads: iterable of records as bytes (or str), e.g. the lines of an NDJSON file
+    - input_format: "json" or "yaml", defaults to the format of the source standard
+    - output_format: "json" or "yaml", defaults to the format of each target standard
+    - slot_size: size of each slot of the ring in bytes. There are 2 * workers *
+      chunksize slots
+    - source_format, target_formats, workers, ordered, chunksize, limits, custom_fields:
+      see batch.convert_many
+
+    The outputs of each RecordResult map each target format to its serialized output,
+    encoded as utf-8
+    """
+    if isinstance(target_formats, str):
+        target_formats = [target_formats]
+    formats = {
+        target_format: output_format or STANDARDS[target_format]["format"]
+        for target_format in target_formats
+    }
+    convert = partial(
+        convert_bytes,
+        source_format,
+        input_format or STANDARDS[source_format]["format"],
+        formats,
+        custom_fields,
+        limits,
+    )
+    payloads = (
+        payload.encode("utf-8") if isinstance(payload, str) else payload
+        for payload in payloads
+    )
+    workers = resolve_workers(workers)
+    if workers == 1:
+        for index, payload in enumerate(payloads):
+            yield convert(index, payload)
+        return
+
+    # each chunk in flight has a group of chunksize slots to itself, run_chunks keeps up
+    # to 2 chunks per worker in flight
+    ring = SharedRing(workers * 2 * chunksize, slot_size)
+    free_groups = deque(range(workers * 2))
+
+    def submit(pool, fn, chunk):
+        group = free_groups.popleft()
+        tasks = []
+        for offset, (index, payload) in enumerate(chunk):
+            slot = group * chunksize + offset
+            if ring.write(slot, payload):
+                tasks.append((index, slot, len(payload), None))
+            else:
+                tasks.append((index, slot, len(payload), payload))
+        future = pool.submit(fn, tasks)
+        future.group = group
+        return future
+
+    def collect(future):
+        results = []
+        try:
+            # results come back in the order of the chunk, i.e. of the slots in the group
+            for offset, outcome in enumerate(future.result()):
+                index, lengths, outputs, error, seconds = outcome
+                if lengths is not None:
+                    data = ring.read(future.group * chunksize + offset, sum(lengths))
+                    outputs, start = {}, 0
+                    for target_format, length in zip(formats, lengths):
+                        outputs[target_format] = data[start : start + length]
+                        start += length
+                results.append(RecordResult(index, outputs, error, seconds))
+        finally:
+            free_groups.append(future.group)
+        return results
+
+    try:
+        yield from run_chunks(
+            partial(_convert_slots, convert),
+            chunked(payloads, chunksize),
+            workers,
+            ordered=ordered,
+            recycle=timed_out if limits and limits.timeout else None,
+            make_pool=partial(
+                ProcessPoolExecutor,
+                max_workers=workers,
+                initializer=_init_ring_worker,
+                initargs=(ring.name, ring.slots, slot_size),
+            ),
+            submit=submit,
+            collect=collect,
+        )
+    finally:
+        ring.close()
@@ -0,0 +1,310 @@
+"""
+A batch job shared between several workers (possibly on different hosts) through nothing
+but a directory on a shared filesystem
+
+The spool directory is laid out as:
+
+- incoming/: files waiting to be converted. Producers should write files elsewhere (or
+  under a name starting with ".") and rename them in, so that workers never see a
+  partially written file
+- claimed/<worker id>/: files a worker is converting. A worker claims a file by renaming
+  it from incoming/, which only one worker can do successfully, and keeps the
+  claimed/<worker id>/.heartbeat file's modification time fresh while it runs
+- output/: converted files, named with a template (see InputFile.output_path)
+- done/: inputs that were converted successfully, as a marker of completion
+- failed/: inputs that could not be converted, each next to a <name>.error file holding
+  the error
+
+Claims of a worker whose heartbeat is older than the lease are considered abandoned (the
+worker crashed or its host went down) and are moved back into incoming/ by any other
+worker. Heartbeats are compared against the modification time of the worker's own
+heartbeat rather than the local clock, so hosts don't need synchronized clocks.
+"""
+
+import os
+import socket
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from codemeticulous.batch import RecordError, convert_file, init_worker
+from codemeticulous.convert import STANDARDS
+from codemeticulous.files import InputFile
+
+DEFAULT_LEASE = 300
+DEFAULT_POLL_INTERVAL = 5
+DEFAULT_SPOOL_NAME_TEMPLATE = "{path}/{filename}"
+HEARTBEAT = ".heartbeat"
+SPOOL_DIRS = ("incoming", "claimed", "output", "done", "failed")
+
+
+@dataclass
+class WorkerStats:
+    converted: int = 0
+    failed: int = 0
+    recovered: int = 0
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SpoolWorker:
+    """claims and converts files from a spool directory, see the module docstring
+
+    on_result is called with (name, error) after each file, where error is a RecordError
+    or None if the file was converted
+    """
+
+    def __init__(
+        self,
+        spool_dir: str,
+        source_format: str,
+        target_formats: list[str],
+        worker_id: Optional[str] = None,
+        lease: float = DEFAULT_LEASE,
+        name_template: str = DEFAULT_SPOOL_NAME_TEMPLATE,
+        on_result: Optional[Callable[[str, Optional[RecordError]], None]] = None,
+        **custom_fields,
+    ):
+        self.spool_dir = spool_dir
+        self.source_format = source_format
+        self.target_formats = list(target_formats)
+        self.worker_id = worker_id or default_worker_id()
+        if os.sep in self.worker_id or self.worker_id.startswith("."):
+            raise ValueError(f"Invalid worker id: {self.worker_id}")
+        self.lease = lease
+        self.name_template = name_template
+        self.on_result = on_result
+        self.custom_fields = custom_fields
+        self.stats = WorkerStats()
+        self.claim_dir = self._path("claimed", self.worker_id)
+        self._heartbeat_path = os.path.join(self.claim_dir, HEARTBEAT)
+        self._stopped = threading.Event()
+        self._heartbeat_thread = None
+
+    def _path(self, *parts) -> str:
+        return os.path.join(self.spool_dir, *parts)
+
+    def run(self, poll_interval: float = DEFAULT_POLL_INTERVAL, exit_when_empty=False):
+        """convert files as they arrive in incoming/ until stopped, or until there is
+        nothing left to do if exit_when_empty is set. Files this worker has claimed but
+        not finished are put back into incoming/ when it stops
+        """
+        self.start()
+        try:
+            while not self._stopped.is_set():
+                self.recover_stale_claims()
+                name = self.claim_next()
+                if name is not None:
+                    self.process(name)
+                elif exit_when_empty and not self.pending_claims():
+                    break
+                else:
+                    self._stopped.wait(poll_interval)
+        finally:
+            self.close()
+        return self.stats
+
+    def start(self):
+        for name in SPOOL_DIRS:
+            os.makedirs(self._path(name), exist_ok=True)
+        os.makedirs(self.claim_dir, exist_ok=True)
+        # files left behind by an earlier run with the same worker id
+        self.release_claims(self.claim_dir)
+        self.heartbeat()
+        init_worker()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat_loop, name="spool-heartbeat", daemon=True
+        )
+        self._heartbeat_thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def close(self):
+        self._stopped.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        self.release_claims(self.claim_dir)
+        _remove_claim_dir(self.claim_dir)
+
+    def heartbeat(self) -> float:
+        """refresh this worker's lease and return the current time of the filesystem"""
+        # recreated if another worker wrongly took this one for dead and removed it
+        os.makedirs(self.claim_dir, exist_ok=True)
+        with open(self._heartbeat_path, "a"):
+            pass
+        os.utime(self._heartbeat_path)
+        return os.stat(self._heartbeat_path).st_mtime
+
+    def _heartbeat_loop(self):
+        # conversions can take longer than the lease, so the heartbeat is kept from a
+        # separate thread rather than between files
+        while not self._stopped.wait(self.lease / 4):
+            try:
+                self.heartbeat()
+            except OSError:
+                pass
+
+    def claim_next(self) -> Optional[str]:
+        """claim the next file waiting in incoming/, returns its name or None"""
+        try:
+            names = sorted(os.listdir(self._path("incoming")))
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if name.startswith("."):
+                continue
+            try:
+                os.rename(
+                    self._path("incoming", name), os.path.join(self.claim_dir, name)
+                )
+            except FileNotFoundError:
+                # claimed by another worker first
+                continue
+            return name
+        return None
+
+    def process(self, name: str) -> Optional[RecordError]:
+        """convert a claimed file, then move it into done/ or failed/"""
+        claimed_path = os.path.join(self.claim_dir, name)
+        input_file = InputFile(claimed_path, name)
+        output_paths = {
+            target_format: input_file.output_path(
+                self._path("output"),
+                self.name_template,
+                target_format,
+                STANDARDS[target_format]["extension"],
+                STANDARDS[target_format]["filename"],
+            )
+            for target_format in self.target_formats
+        }
+        try:
+            convert_file(
+                self.source_format, claimed_path, output_paths, **self.custom_fields
+            )
+        except Exception as e:
+            error = RecordError.from_exception(e)
+        else:
+            error = None
+        try:
+            if error is None:
+                os.replace(claimed_path, self._path("done", name))
+            else:
+                os.replace(claimed_path, self._path("failed", name))
+        except FileNotFoundError:
+            # the lease expired and another worker put the file back into incoming/,
+            # where it will be converted again
+            return error
+        if error is None:
+            self.stats.converted += 1
+        else:
+            with open(self._path("failed", f"{name}.error"), "w") as error_file:
+                error_file.write(f"{error}\n")
+            self.stats.failed += 1
+        if self.on_result is not None:
+            self.on_result(name, error)
+        return error
+
+    def pending_claims(self) -> bool:
+        """whether any worker, including stale ones, holds claims that may come back"""
+        for worker_id in _listdir(self._path("claimed")):
+            claim_dir = self._path("claimed", worker_id)
+            if claim_dir != self.claim_dir and _claimed_files(claim_dir):
+                return True
+        return False
+
+    def recover_stale_claims(self) -> int:
+        """put the claims of workers whose lease has expired back into incoming/"""
+        now = self.heartbeat()
+        recovered = 0
+        for worker_id in _listdir(self._path("claimed")):
+            claim_dir = self._path("claimed", worker_id)
+            if claim_dir == self.claim_dir:
+                continue
+            try:
+                last_seen = os.stat(os.path.join(claim_dir, HEARTBEAT)).st_mtime
+            except FileNotFoundError:
+                try:
+                    last_seen = os.stat(claim_dir).st_mtime
+                except FileNotFoundError:
+                    continue
+            if now - last_seen > self.lease:
+                recovered += self.release_claims(claim_dir)
+                _remove_claim_dir(claim_dir)
+        self.stats.recovered += recovered
+        return recovered
+
+    def release_claims(self, claim_dir: str) -> int:
+        released = 0
+        for name in _claimed_files(claim_dir):
+            claim = os.path.join(claim_dir, name)
+            # link rather than rename, which would replace a file of the same name
+            # spooled again in the meantime
+            try:
+                os.link(claim, self._path("incoming", name))
+            except FileNotFoundError:
+                # recovered by another worker first
+                continue
+            except FileExistsError:
+                # left claimed, a later recovery releases it once the name is free
+                continue
+            try:
+                os.unlink(claim)
+            except FileNotFoundError:
+                pass
+            released += 1
+        return released
+
+
+def _listdir(path: str) -> list[str]:
+    try:
+        return sorted(os.listdir(path))
+    except FileNotFoundError:
+        return []
+
+
+def _claimed_files(claim_dir: str) -> list[str]:
+    return [name for name in _listdir(claim_dir) if not name.startswith(".")]
+
+
+def _remove_claim_dir(claim_dir: str):
+    try:
+        os.unlink(os.path.join(claim_dir, HEARTBEAT))
+    except FileNotFoundError:
+        pass
+    try:
+        os.rmdir(claim_dir)
+    except OSError:
+        # not empty, a file was claimed into it in the meantime
+        pass
+
+
+def run_worker(
+    spool_dir: str,
+    source_format: str,
+    target_formats: list[str],
+    worker_id: Optional[str] = None,
+    lease: float = DEFAULT_LEASE,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    exit_when_empty: bool = False,
+    name_template: str = DEFAULT_SPOOL_NAME_TEMPLATE,
+    on_result: Optional[Callable[[str, Optional[RecordError]], None]] = None,
+    **custom_fields,
+) -> WorkerStats:
+    """run a SpoolWorker until interrupted, or until the spool is empty if
+    exit_when_empty is set
+    """
+    worker = SpoolWorker(
+        spool_dir,
+        source_format,
+        target_formats,
+        worker_id=worker_id,
+        lease=lease,
+        name_template=name_template,
+        on_result=on_result,
+        **custom_fields,
+    )
+    return worker.run(poll_interval=poll_interval, exit_when_empty=exit_when_empty)
@@ -0,0 +1,271 @@
+"""
+Keeping the metadata files of a repository in step with the file they are generated from
+
+A sync config is a YAML file (.codemeticulous.yml by default) mapping each source file to
+the targets generated from it, with paths relative to the config:
+
+    sources:
+      codemeta.json:
+        to:
+          cff: CITATION.cff
+          datacite: datacite.json
+
+The standard of a source is given by "from", and defaults to the one whose conventional
+file name matches it (e.g. codemeta.json). Targets are only written when their serialized
+bytes change, through a temporary file renamed over them, so a sync that changes nothing
+touches nothing. A state file next to the config (.codemeticulous-sync.json) records a
+hash of each source and its settings, and sources whose hash hasn't changed since the
+last sync are skipped without being converted, as long as their targets still exist.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from importlib.metadata import PackageNotFoundError, version
+from typing import NamedTuple, Optional
+
+import yaml
+
+from codemeticulous.convert import STANDARDS, convert_to_many
+from codemeticulous.files import dump_data, load_file_autodetect, read_input
+
+DEFAULT_CONFIG = ".codemeticulous.yml"
+STATE_FILE = ".codemeticulous-sync.json"
+STATE_VERSION = 1
+
+
+class SyncConfigError(ValueError):
+    """a sync config that can't be read or is invalid"""
+
+
+class SyncSource(NamedTuple):
+    path: str
+    format: str
+    # target format -> path
+    targets: dict[str, str]
+
+
+class SyncConfig(NamedTuple):
+    path: str
+    sources: list[SyncSource]
+    state_path: str
+
+
+class SyncResult(NamedTuple):
+    """outcome of syncing a source: skipped is True if it was unchanged since the last
+    sync, written and unchanged list the target paths that were (not) rewritten
+    """
+
+    source: SyncSource
+    skipped: bool = False
+    written: tuple = ()
+    unchanged: tuple = ()
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _codemeticulous_version() -> str:
+    try:
+        return version("codemeticulous")
+    except PackageNotFoundError:
+        return ""
+
+
+def format_for_filename(path: str) -> Optional[str]:
+    """the standard whose conventional file name path has, if any"""
+    name = os.path.basename(path)
+    for format_name, standard in STANDARDS.items():
+        if standard["filename"] == name:
+            return format_name
+    return None
+
+
+def load_config(config_path: str) -> SyncConfig:
+    """read a sync config, SyncConfigError if it is missing or invalid"""
+    try:
+        with open(config_path, "r", encoding="utf-8") as file:
+            data = yaml.safe_load(file)
+    except (OSError, yaml.YAMLError) as e:
+        raise SyncConfigError(f"Failed to read sync config {config_path}: {e}")
+    if not isinstance(data, dict) or not isinstance(data.get("sources"), dict):
+        raise SyncConfigError(f"{config_path} has no sources mapping")
+    root = os.path.dirname(os.path.abspath(config_path))
+    sources = []
+    for source_path, settings in data["sources"].items():
+        settings = settings or {}
+        format_name = settings.get("from") or format_for_filename(source_path)
+        if format_name not in STANDARDS:
+            raise SyncConfigError(
+                f'{config_path}: unknown standard of {source_path}, set its "from" '
+                f"to one of {', '.join(STANDARDS)}"
+            )
+        targets = settings.get("to")
+        if not isinstance(targets, dict) or not targets:
+            raise SyncConfigError(
+                f"{config_path}: {source_path} has no targets, map each target standard "
+                'to a path under "to"'
+            )
+        for target_format in targets:
+            if target_format not in STANDARDS:
+                raise SyncConfigError(
+                    f"{config_path}: unknown target standard {target_format} of "
+                    f"{source_path}, expected one of {', '.join(STANDARDS)}"
+                )
+        sources.append(
+            SyncSource(
+                os.path.join(root, source_path),
+                format_name,
+                {
+                    target_format: os.path.join(root, target_path)
+                    for target_format, target_path in targets.items()
+                },
+            )
+        )
+    state_path = os.path.join(root, data.get("state", STATE_FILE))
+    return SyncConfig(os.path.abspath(config_path), sources, state_path)
+
+
+def source_hash(source: SyncSource, content: bytes) -> str:
+    """hash of the content of a source and everything else its targets depend on"""
+    digest = hashlib.sha256(content)
+    settings = [source.format, source.targets, _codemeticulous_version()]
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_state(state_path: str) -> dict[str, str]:
+    """the source hashes of the last sync, keyed by source path. A missing or unreadable
+    state file only means every source is synced again
+    """
+    try:
+        with open(state_path, "r", encoding="utf-8") as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return {}
+    return state.get("sources", {})
+
+
+def write_atomic(path: str, data: bytes):
+    """replace the file at path with data through a temporary file in the same directory,
+    so readers see either the old or the new content, even after a crash. The mode of an
+    existing file is kept
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = _default_mode()
+    file = tempfile.NamedTemporaryFile(
+        dir=directory, prefix=f".{os.path.basename(path)}.", delete=False
+    )
+    try:
+        with file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(file.name, mode)
+        os.replace(file.name, path)
+    except BaseException:
+        try:
+            os.remove(file.name)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+
+def _default_mode() -> int:
+    """the mode open() creates files with, NamedTemporaryFile makes them private"""
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _fsync_directory(directory: str):
+    # so that the rename itself survives a crash, not supported on every platform
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_if_changed(path: str, data: bytes) -> bool:
+    """write data to path unless it already holds exactly data, returns whether it was
+    written
+    """
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as file:
+                if file.read() == data:
+                    return False
+    except FileNotFoundError:
+        pass
+    write_atomic(path, data)
+    return True
+
+
+def save_state(state_path: str, hashes: dict[str, str]):
+    state = {"version": STATE_VERSION, "sources": dict(sorted(hashes.items()))}
+    write_if_changed(state_path, (json.dumps(state, indent=2) + "\n").encode("utf-8"))
+
+
+def sync_source(
+    source: SyncSource, previous_hash: Optional[str] = None, force: bool = False
+) -> tuple[SyncResult, Optional[str]]:
+    """convert a source and write each of its targets whose bytes changed. Returns the
+    result and the hash of the source, to be compared with the next sync's
+    """
+    try:
+        content = read_input(source.path)
+        digest = source_hash(source, content)
+        if (
+            not force
+            and digest == previous_hash
+            and all(os.path.exists(path) for path in source.targets.values())
+        ):
+            return SyncResult(source, skipped=True), digest
+        record = load_file_autodetect(source.path, content)
+        outputs = convert_to_many(source.format, list(source.targets), record)
+        written, unchanged = [], []
+        for target_format, target_path in source.targets.items():
+            text = dump_data(outputs[target_format], STANDARDS[target_format]["format"])
+            if write_if_changed(target_path, text.encode("utf-8")):
+                written.append(target_path)
+            else:
+                unchanged.append(target_path)
+    except Exception as e:
+        return SyncResult(source, error=e), None
+    return (
+        SyncResult(source, written=tuple(written), unchanged=tuple(unchanged)),
+        digest,
+    )
+
+
+def sync(config: SyncConfig, force: bool = False) -> list[SyncResult]:
+    """sync every source of a config and record their hashes in its state file. Failed
+    sources are synced again next time
+    """
+    previous = load_state(config.state_path)
+    hashes = {}
+    results = []
+    for source in config.sources:
+        key = os.path.relpath(source.path, os.path.dirname(config.path))
+        result, digest = sync_source(source, previous.get(key), force)
+        if digest is not None:
+            hashes[key] = digest
+        results.append(result)
+    save_state(config.state_path, hashes)
+    return results
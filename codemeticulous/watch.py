@@ -0,0 +1,240 @@
+"""
+Watching source files and regenerating their targets as soon as they change, in one
+long-running process so that the models are only loaded once
+
+Changes are noticed through inotify on Linux (through ctypes, watching the directories
+of the sources so that editors that save by renaming a new file over the old one are
+caught too), and by polling the modification time, size and inode of each source
+elsewhere. Bursts of changes (e.g. an editor writing a file in several steps) are
+debounced: a source is converted once no change was seen for the debounce interval.
+Only the sources that changed are converted, with sync.sync_source, so targets whose
+bytes don't change are not rewritten.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from codemeticulous.batch import init_worker
+from codemeticulous.convert import STANDARDS
+from codemeticulous.sync import SyncResult, SyncSource, format_for_filename, sync_source
+
+DEFAULT_DEBOUNCE = 0.2
+DEFAULT_POLL_INTERVAL = 0.5
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def sources_for(
+    paths: Iterable[str], target_formats: list[str], source_format: Optional[str] = None
+) -> list[SyncSource]:
+    """the sources to watch for source files, each with its targets written next to it
+    under the conventional file name of their standard (e.g. CITATION.cff)
+    """
+    sources = []
+    for path in paths:
+        path = os.path.abspath(path)
+        format_name = source_format or format_for_filename(path)
+        if format_name is None:
+            raise ValueError(
+                f"Unknown standard of {path}, give it with --from or use the "
+                "conventional file name of its standard"
+            )
+        targets = {}
+        for target_format in target_formats:
+            target_path = os.path.join(
+                os.path.dirname(path), STANDARDS[target_format]["filename"]
+            )
+            if target_path == path:
+                raise ValueError(f"{path} can't be its own {target_format} target")
+            targets[target_format] = target_path
+        sources.append(SyncSource(path, format_name, targets))
+    return sources
+
+
+def _stat_key(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class PollWatcher:
+    """notices changes to files by comparing their stat every interval seconds"""
+
+    def __init__(self, paths: Iterable[str], interval: float = DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+        self._stats = {path: _stat_key(path) for path in paths}
+
+    def changes(self, timeout: float) -> set[str]:
+        """the paths that changed, waiting up to timeout seconds for one to"""
+        deadline = time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path, key in self._stats.items():
+                new_key = _stat_key(path)
+                if new_key != key:
+                    self._stats[path] = new_key
+                    changed.add(path)
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """notices changes to files through inotify events on their directories"""
+
+    def __init__(self, paths: Iterable[str]):
+        self.paths = set(paths)
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        try:
+            for directory in {os.path.dirname(path) for path in self.paths}:
+                wd = self._libc.inotify_add_watch(
+                    self._fd, os.fsencode(directory), WATCH_MASK
+                )
+                if wd < 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, os.strerror(errno), directory)
+                self._dirs[wd] = directory
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    def changes(self, timeout: float) -> set[str]:
+        """the paths that changed, waiting up to timeout seconds for one to"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[
+                    offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length
+                ]
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # events were dropped, any of the files may have changed
+                    changed.update(self.paths)
+                elif wd in self._dirs:
+                    path = os.path.join(self._dirs[wd], os.fsdecode(name.rstrip(b"\0")))
+                    if path in self.paths:
+                        changed.add(path)
+
+    def close(self):
+        os.close(self._fd)
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+def open_watcher(paths: Iterable[str], poll_interval: Optional[float] = None):
+    """an InotifyWatcher where inotify is available, a PollWatcher otherwise or if a
+    poll_interval is given
+    """
+    paths = list(paths)
+    if poll_interval is None and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError, TypeError):
+            pass
+    return PollWatcher(paths, poll_interval or DEFAULT_POLL_INTERVAL)
+
+
+class SourceWatcher:
+    """syncs sources once, then again each time one of them changes, until stopped.
+
+    on_sync is called with the SyncResult of each source that was synced
+    """
+
+    def __init__(
+        self,
+        sources: list[SyncSource],
+        debounce: float = DEFAULT_DEBOUNCE,
+        poll_interval: Optional[float] = None,
+        on_sync: Optional[Callable[[SyncResult], None]] = None,
+    ):
+        self.sources = {source.path: source for source in sources}
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.on_sync = on_sync
+        # number of times a source was converted
+        self.runs = 0
+        self._hashes = {}
+        self._stopped = threading.Event()
+
+    def sync(self, paths: Iterable[str]):
+        """sync the sources at paths, skipping those whose content didn't change"""
+        for path in paths:
+            source = self.sources[path]
+            result, digest = sync_source(source, self._hashes.get(path))
+            self._hashes[path] = digest
+            if not result.skipped:
+                self.runs += 1
+            if self.on_sync is not None:
+                self.on_sync(result)
+
+    def run(self):
+        """sync every source, then watch them until stopped"""
+        init_worker()
+        watcher = open_watcher(self.sources, self.poll_interval)
+        try:
+            self.sync(self.sources)
+            while not self._stopped.is_set():
+                changed = watcher.changes(DEFAULT_POLL_INTERVAL)
+                if not changed:
+                    continue
+                # wait for the changes to settle
+                while True:
+                    more = watcher.changes(self.debounce)
+                    if not more:
+                        break
+                    changed |= more
+                self.sync(path for path in self.sources if path in changed)
+        finally:
+            watcher.close()
+
+    def stop(self):
+        self._stopped.set()
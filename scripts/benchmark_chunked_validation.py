@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+benchmark validating a codemeta record with a very long author list, serially and split
+into chunks over a growing number of worker processes or threads
+
+usage: python scripts/benchmark_chunked_validation.py [--authors N] [--chunk-size N]
+       [--max-workers N] [--executor process|thread]
+
+the pool is started before timing, as it would be reused when validating many records
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from codemeticulous.batch import EXECUTORS, make_executor
+from codemeticulous.chunked import DEFAULT_CHUNK_SIZE, validate_chunked
+from codemeticulous.codemeta.models import CodeMetaV3
+
+
+def synthetic_record(authors: int) -> dict:
+    return {
+        "name": "synthetic collaboration",
+        "author": [
+            {
+                "@type": "Person",
+                "givenName": f"Given{i}",
+                "familyName": f"Family{i}",
+                "email": f"person{i}@example.org",
+                "affiliation": {"@type": "Organization", "name": f"Lab {i % 100}"},
+            }
+            for i in range(authors)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--authors", type=int, default=50000)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--executor", choices=EXECUTORS, default="process")
+    args = parser.parse_args()
+
+    record = synthetic_record(args.authors)
+    print(
+        f"{args.authors} authors, chunks of {args.chunk_size}, {os.cpu_count()} cpus, "
+        f"{args.executor} executor, python {sys.version.split()[0]}"
+    )
+    print(f"{'workers':>8} {'seconds':>9} {'speed-up':>9}")
+    start = time.perf_counter()
+    expected = CodeMetaV3(**record)
+    baseline = time.perf_counter() - start
+    print(f"{'serial':>8} {baseline:>9.2f} {1:>8.2f}x")
+
+    worker_counts = [1]
+    while worker_counts[-1] < args.max_workers:
+        worker_counts.append(min(worker_counts[-1] * 2, args.max_workers))
+    for workers in worker_counts:
+        with make_executor(args.executor, workers) as pool:
+            # start the workers and load the models before timing
+            list(pool.map(abs, range(workers)))
+            start = time.perf_counter()
+            instance = validate_chunked(
+                CodeMetaV3,
+                record,
+                executor=pool,
+                chunk_size=args.chunk_size,
+                min_length=0,
+            )
+            elapsed = time.perf_counter() - start
+        if instance != expected:
+            print("chunked validation differs from serial validation", file=sys.stderr)
+            return 1
+        print(f"{workers:>8} {elapsed:>9.2f} {baseline / elapsed:>8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+benchmark convert_many throughput as the number of worker processes or threads grows
+
+usage: python scripts/benchmark_convert_many.py [--records N] [--target cff] [--max-workers N]
+       [--executor process|thread] [--transport pickle|shm]
+
+--transport shm sends the records to worker processes as JSON and gets the outputs back
+serialized, through shared memory (see codemeticulous.shm)
+
+threads only run in parallel on a free-threaded build of python (python3.13t)
+"""
+
+import argparse
+import json
+import os
+import sys
+import sysconfig
+import time
+from itertools import cycle, islice
+from pathlib import Path
+
+from codemeticulous.batch import EXECUTORS, convert_many
+from codemeticulous.shm import convert_payloads
+
+DATA_DIR = Path(__file__).parent.parent / "tests" / "data" / "codemeta"
+
+
+def load_corpus(n: int) -> list[dict]:
+    files = sorted(DATA_DIR.glob("valid/*.json")) + sorted(
+        f for f in DATA_DIR.glob("clean/*.json") if ".expected" not in f.name
+    )
+    records = [json.loads(f.read_text()) for f in files]
+    # codemeta records without authors can't be converted to every target, but still
+    # go through validation and to_canonical, which is where most of the time goes
+    return list(islice(cycle(records), n))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--target", default="cff")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=16)
+    parser.add_argument("--executor", choices=EXECUTORS, default="process")
+    parser.add_argument("--transport", choices=("pickle", "shm"), default="pickle")
+    args = parser.parse_args()
+    if args.transport == "shm" and args.executor != "process":
+        parser.error("--transport shm requires the process executor")
+
+    records = load_corpus(args.records)
+    payloads = [json.dumps(record).encode("utf-8") for record in records]
+    free_threaded = bool(sysconfig.get_config_var("Py_GIL_DISABLED"))
+    gil = "enabled" if getattr(sys, "_is_gil_enabled", lambda: True)() else "disabled"
+    print(
+        f"{args.records} records, codemeta -> {args.target}, {os.cpu_count()} cpus, "
+        f"{args.executor} executor, {args.transport} transport, "
+        f"python {sys.version.split()[0]}"
+        f"{'t' if free_threaded else ''} with the GIL {gil}"
+    )
+    print(f"{'workers':>8} {'seconds':>9} {'records/s':>10} {'speed-up':>9}")
+    worker_counts = [1]
+    while worker_counts[-1] < args.max_workers:
+        worker_counts.append(min(worker_counts[-1] * 2, args.max_workers))
+
+    baseline = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        if args.transport == "shm":
+            results = convert_payloads(
+                "codemeta",
+                args.target,
+                payloads,
+                workers=workers,
+                chunksize=args.chunksize,
+            )
+        else:
+            results = convert_many(
+                "codemeta",
+                args.target,
+                records,
+                workers=workers,
+                chunksize=args.chunksize,
+                executor=args.executor,
+            )
+        for _ in results:
+            pass
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(
+            f"{workers:>8} {elapsed:>9.2f} {args.records / elapsed:>10.1f}"
+            f" {baseline / elapsed:>8.2f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
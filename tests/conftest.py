@@ -1,11 +1,40 @@
 import pytest
 import json
+import shutil
 import yaml
 from pathlib import Path
 from typing import Any, Literal
 
 from codemeticulous.convert import STANDARDS
 
+CODEMETA_DIR = Path(__file__).parent / "data" / "codemeta"
+# codemeta test files that convert to every other standard
+CONVERTIBLE = ["valid/codemetar.json", "clean/context.json", "clean/creator.json"]
+VALID = json.loads((CODEMETA_DIR / "valid/codemetar.json").read_text())
+
+
+def load_records() -> list[dict]:
+    return [json.loads((CODEMETA_DIR / name).read_text()) for name in CONVERTIBLE]
+
+
+def make_corpus(root: Path, names: list[str]) -> list[Path]:
+    """copy each of the codemeta test files names to root/project{i}/codemeta.json"""
+    paths = []
+    for i, name in enumerate(names):
+        path = root / f"project{i}" / "codemeta.json"
+        path.parent.mkdir(parents=True)
+        shutil.copy(CODEMETA_DIR / name, path)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def corpus(tmp_path) -> Path:
+    """a directory tree with one codemeta.json per project"""
+    root = tmp_path / "corpus"
+    make_corpus(root, CONVERTIBLE)
+    return root
+
 
 @pytest.fixture(scope="session")
 def test_data_dir() -> Path:
@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from codemeticulous.aio import aconvert, aconvert_many
+from codemeticulous.convert import convert
+
+from .conftest import load_records
+
+
+def test_aconvert():
+    record = load_records()[1]
+    converted = asyncio.run(aconvert("codemeta", "cff", record))
+    assert converted.json() == convert("codemeta", "cff", record).json()
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_aconvert_many(ordered):
+    records = load_records() + [{"description": "missing a name"}]
+
+    async def records_source():
+        for record in records:
+            yield record
+
+    async def run():
+        with ThreadPoolExecutor(2) as executor:
+            return [
+                result
+                async for result in aconvert_many(
+                    "codemeta",
+                    "cff",
+                    records_source(),
+                    executor=executor,
+                    limit=2,
+                    ordered=ordered,
+                )
+            ]
+
+    results = asyncio.run(run())
+    if ordered:
+        assert [r.index for r in results] == [0, 1, 2, 3]
+    results.sort(key=lambda r: r.index)
+    assert [r.ok for r in results] == [True, True, True, False]
+
+
+def test_aconvert_many_cancellation():
+    records = load_records() * 10
+
+    async def run():
+        with ThreadPoolExecutor(1) as executor:
+            results = aconvert_many(
+                "codemeta", "cff", records, executor=executor, limit=4
+            )
+            first = await anext(results)
+            await results.aclose()
+            return first
+
+    assert asyncio.run(run()).index == 0
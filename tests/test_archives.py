@@ -0,0 +1,177 @@
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous import archives
+from codemeticulous.archives import iter_members, read_members, split_member_path
+from codemeticulous.batch import convert_files
+from codemeticulous.cli import cli
+from codemeticulous.files import expand_inputs, load_file_autodetect, read_input
+from codemeticulous.limits import LimitExceeded, RecordLimits
+
+from .conftest import CODEMETA_DIR
+
+VALID = (CODEMETA_DIR / "valid/codemetar.json").read_bytes()
+
+
+def release_members(name):
+    return {
+        f"{name}/codemeta.json": VALID,
+        f"{name}/README.md": b"# readme",
+        f"{name}/docs/codemeta.json": VALID,
+        "../escape/codemeta.json": VALID,
+    }
+
+
+def write_tar(path, members, mode):
+    with tarfile.open(path, mode) as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, "w") as zip_file:
+        for name, data in members.items():
+            zip_file.writestr(name, data)
+
+
+@pytest.fixture
+def releases(tmp_path):
+    root = tmp_path / "releases"
+    root.mkdir()
+    write_tar(root / "a-1.0.tar.gz", release_members("a-1.0"), "w:gz")
+    write_tar(root / "b-1.0.tar.xz", release_members("b-1.0"), "w:xz")
+    write_tar(root / "c-1.0.tar", release_members("c-1.0"), "w")
+    write_zip(root / "d-1.0.zip", release_members("d-1.0"))
+    (root / "e").mkdir()
+    (root / "e" / "codemeta.json").write_bytes(VALID)
+    return root
+
+
+@pytest.mark.parametrize("archive", ["a-1.0.tar.gz", "b-1.0.tar.xz", "d-1.0.zip"])
+def test_read_members(releases, archive):
+    path = str(releases / archive)
+    release = archive.split(".tar")[0].split(".zip")[0]
+    assert list(iter_members(path, "codemeta.json")) == [
+        f"{release}/codemeta.json",
+        f"{release}/docs/codemeta.json",
+    ]
+    member = f"{path}!{release}/codemeta.json"
+    assert split_member_path(member) == (path, f"{release}/codemeta.json")
+    assert read_input(member) == VALID
+    assert load_file_autodetect(member) == json.loads(VALID)
+    with pytest.raises(LimitExceeded):
+        read_input(member, RecordLimits(max_bytes=10))
+    with pytest.raises(OSError):
+        read_input(f"{path}!{release}/missing.json")
+
+
+def test_expand_inputs(releases):
+    inputs = list(expand_inputs([str(releases)], "codemeta.json"))
+    assert [input_file.relpath for input_file in inputs] == ["e/codemeta.json"]
+
+    inputs = list(expand_inputs([str(releases)], "codemeta.json", archives=True))
+    assert [input_file.relpath for input_file in inputs] == [
+        "a-1.0/a-1.0/codemeta.json",
+        "a-1.0/a-1.0/docs/codemeta.json",
+        "b-1.0/b-1.0/codemeta.json",
+        "b-1.0/b-1.0/docs/codemeta.json",
+        "c-1.0/c-1.0/codemeta.json",
+        "c-1.0/c-1.0/docs/codemeta.json",
+        "d-1.0/d-1.0/codemeta.json",
+        "d-1.0/d-1.0/docs/codemeta.json",
+        "e/codemeta.json",
+    ]
+    # archives given explicitly are always searched
+    inputs = list(expand_inputs([str(releases / "c-1.0.tar")], "docs/codemeta.json"))
+    assert [input_file.path for input_file in inputs] == [
+        f"{releases / 'c-1.0.tar'}!c-1.0/docs/codemeta.json"
+    ]
+
+
+def test_members_are_read_while_searching(releases, tmp_path, monkeypatch):
+    path = str(releases / "a-1.0.tar.gz")
+    assert list(read_members(path, "codemeta.json")) == [
+        ("a-1.0/codemeta.json", VALID),
+        ("a-1.0/docs/codemeta.json", VALID),
+    ]
+    assert [
+        data for _, data in read_members(path, "*.md", RecordLimits(max_bytes=5))
+    ] == [None]
+
+    # the archives aren't opened again to read each member
+    opened = []
+
+    def open_tar(*args):
+        opened.append(args)
+        return tar_open(*args)
+
+    monkeypatch.setattr(archives.tarfile, "open", open_tar)
+    out = tmp_path / "out"
+    for extra in ([], ["--read-ahead", "4"]):
+        opened.clear()
+        result = CliRunner().invoke(
+            cli,
+            ["convert", "-f", "codemeta", "-t", "cff", "-d", str(out), "-j", "1"]
+            + extra
+            + [str(releases / "a-1.0.tar.gz"), str(releases / "b-1.0.tar.xz")],
+        )
+        assert result.exit_code == 0, result.output
+        assert len(opened) == 2
+    assert len(list(out.rglob("*.cff"))) == 4
+
+    # members over the limit are left to be refused when they are converted
+    (member,) = expand_inputs([path], "README.md", limits=RecordLimits(max_bytes=5))
+    assert member.content is None
+    with pytest.raises(LimitExceeded):
+        read_input(member.path, RecordLimits(max_bytes=5))
+
+
+tar_open = tarfile.open
+
+
+def test_convert_files_from_archives(releases, tmp_path):
+    inputs = expand_inputs([str(releases)], "codemeta.json", archives=True)
+    jobs = [
+        (input_file.path, {"cff": str(tmp_path / "out" / f"{i}.cff")})
+        for i, input_file in enumerate(inputs)
+    ]
+    results = list(convert_files("codemeta", jobs, workers=1))
+    assert all(result.ok for result in results)
+    # nothing was extracted next to the archives
+    assert sorted(path.name for path in releases.iterdir()) == [
+        "a-1.0.tar.gz",
+        "b-1.0.tar.xz",
+        "c-1.0.tar",
+        "d-1.0.zip",
+        "e",
+    ]
+
+
+def test_cli_archives(releases, tmp_path):
+    out = tmp_path / "out"
+    result = CliRunner().invoke(
+        cli,
+        ["convert", "-f", "codemeta", "-t", "cff", "-d", str(out), "--archives"]
+        + [str(releases)],
+    )
+    assert result.exit_code == 0, result.output
+    assert (out / "a-1.0" / "a-1.0" / "codemeta.cff").exists()
+    assert len(list(out.rglob("*.cff"))) == 9
+
+    result = CliRunner().invoke(
+        cli, ["validate", "-f", "codemeta", str(releases / "d-1.0.zip")]
+    )
+    assert result.exit_code == 0, result.output
+    assert "2 of 2 files are valid" in result.output
+
+    result = CliRunner().invoke(
+        cli, ["convert", "-f", "codemeta", "-t", "cff", str(releases / "d-1.0.zip")]
+    )
+    assert result.exit_code == 2
@@ -0,0 +1,94 @@
+import copy
+import json
+
+import pytest
+
+from codemeticulous.batch import convert_many
+from codemeticulous.convert import convert
+
+from .conftest import CODEMETA_DIR, load_records
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_convert_many_matches_convert(workers):
+    records = load_records() * 3
+    results = list(
+        convert_many("codemeta", "cff", records, workers=workers, chunksize=2)
+    )
+    assert [r.index for r in results] == list(range(len(records)))
+    for record, result in zip(records, results):
+        assert result.ok
+        assert result.outputs["cff"].json() == convert("codemeta", "cff", record).json()
+
+
+def test_convert_many_returns_errors():
+    records = load_records()
+    records.insert(1, {"description": "missing a name"})
+    results = list(
+        convert_many("codemeta", ["cff", "codemeta"], records, workers=2, chunksize=1)
+    )
+    assert [r.ok for r in results] == [True, False, True, True]
+    assert results[1].outputs is None
+    assert results[1].error.error_type == "ValidationError"
+    assert set(results[0].outputs) == {"cff", "codemeta"}
+
+
+def test_convert_many_unordered():
+    records = load_records() * 4
+    results = list(
+        convert_many("codemeta", "cff", records, workers=2, ordered=False, chunksize=1)
+    )
+    assert sorted(r.index for r in results) == list(range(len(records)))
+    assert all(r.ok for r in results)
+
+
+def test_convert_many_invalid_workers():
+    with pytest.raises(ValueError):
+        convert_many("codemeta", "cff", [], workers=0)
+
+
+def test_convert_many_threads_share_inputs():
+    # every thread converts the same dict objects, including ones that exercise each of
+    # the root validators, which must not modify them
+    records = [
+        json.loads(path.read_text())
+        for path in sorted(CODEMETA_DIR.glob("clean/*.json"))
+        if ".expected" not in path.name
+    ]
+    records.append(
+        {
+            "name": "roles",
+            "@context": {"schema": "http://schema.org/"},
+            "schema:author": [
+                {
+                    "@type": "Role",
+                    "schema:author": "https://orcid.org/1",
+                    "roleName": "dev",
+                },
+                {"@type": "Person", "givenName": "Ada", "familyName": "Lovelace"},
+            ],
+            "citation": [{"@type": "ScholarlyArticle", "name": "A paper"}],
+            "softwareRequirements": [{"@type": "SoftwareApplication", "name": "lib"}],
+        }
+    )
+    originals = copy.deepcopy(records)
+    expected = [convert("codemeta", "codemeta", r).json() for r in records]
+
+    results = list(
+        convert_many(
+            "codemeta",
+            "codemeta",
+            records * 50,
+            workers=8,
+            chunksize=1,
+            executor="thread",
+        )
+    )
+    assert all(r.ok for r in results)
+    assert [r.outputs["codemeta"].json() for r in results] == expected * 50
+    assert records == originals
+
+
+def test_convert_many_invalid_executor():
+    with pytest.raises(ValueError):
+        list(convert_many("codemeta", "cff", load_records(), executor="fiber"))
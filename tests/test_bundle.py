@@ -0,0 +1,118 @@
+import json
+import tarfile
+import zipfile
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous.batch import convert_files
+from codemeticulous.bundle import NDJSONBundle, TarBundle, ZipBundle, open_bundle
+from codemeticulous.cli import cli
+from codemeticulous.files import open_file
+
+from .conftest import VALID
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    root = tmp_path / "in"
+    for i in range(3):
+        (root / f"pkg{i}").mkdir(parents=True)
+        record = dict(VALID, name=f"project {i}")
+        (root / f"pkg{i}" / "codemeta.json").write_text(json.dumps(record))
+    (root / "broken").mkdir()
+    (root / "broken" / "codemeta.json").write_text("{not json")
+    return root
+
+
+def test_open_bundle(tmp_path):
+    for name, kind in [
+        ("out.tar.gz", TarBundle),
+        ("out.zip", ZipBundle),
+        ("out.jsonl.xz", NDJSONBundle),
+    ]:
+        bundle = open_bundle(str(tmp_path / name))
+        assert isinstance(bundle, kind)
+        bundle.abort()
+    assert list(tmp_path.iterdir()) == []
+    with pytest.raises(ValueError, match="Unsupported bundle"):
+        open_bundle(str(tmp_path / "out.json"))
+
+
+def test_convert_files_into_bundle(inputs, tmp_path):
+    jobs = [
+        (str(path), {"cff": f"{path.parent.name}/CITATION.cff"})
+        for path in sorted(inputs.glob("*/codemeta.json"))
+    ]
+    path = tmp_path / "citations.tar"
+    with open_bundle(str(path)) as bundle:
+        results = list(convert_files("codemeta", jobs, workers=1, bundle=bundle))
+        assert not path.exists()
+    assert [result.ok for result in results] == [False, True, True, True]
+    assert results[1].outputs == {"cff": "pkg0/CITATION.cff"}
+    with tarfile.open(path) as tar:
+        assert tar.getnames() == [f"pkg{i}/CITATION.cff" for i in range(3)]
+        text = tar.extractfile("pkg1/CITATION.cff").read().decode()
+    assert "cff-version" in text and "project 1" in text
+
+
+def test_failed_bundle_is_discarded(tmp_path):
+    path = tmp_path / "citations.zip"
+    with pytest.raises(RuntimeError):
+        with open_bundle(str(path)) as bundle:
+            bundle.add("CITATION.cff", "cff", "cff-version: 1.2.0\n")
+            raise RuntimeError
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("name", ["out.tar.gz", "out.zip", "out.ndjson.gz"])
+def test_cli_bundle_is_deterministic(inputs, tmp_path, name):
+    contents = []
+    for run in range(2):
+        path = tmp_path / str(run) / name
+        result = CliRunner().invoke(
+            cli,
+            ["convert", "-f", "codemeta", "-t", "cff", "-t", "codemeta"]
+            + ["--bundle", str(path), str(inputs)],
+        )
+        assert result.exit_code == 1
+        assert f"Converted 3 of 4 files into {path}" in result.output
+        contents.append(path.read_bytes())
+    assert contents[0] == contents[1]
+
+
+def test_cli_bundle_contents(inputs, tmp_path):
+    args = ["convert", "-f", "codemeta", "-t", "cff", "-t", "codemeta"]
+    path = tmp_path / "out.zip"
+    CliRunner().invoke(cli, args + ["--bundle", str(path), str(inputs)])
+    with zipfile.ZipFile(path) as zip_file:
+        assert sorted(zip_file.namelist()) == sorted(
+            f"pkg{i}/{filename}"
+            for i in range(3)
+            for filename in ("codemeta.cff", "codemeta.json")
+        )
+
+    path = tmp_path / "out.jsonl.bz2"
+    CliRunner().invoke(cli, args + ["--bundle", str(path), str(inputs)])
+    with open_file(str(path)) as file:
+        lines = [json.loads(line) for line in file]
+    assert len(lines) == 6
+    assert {line["format"] for line in lines} == {"cff", "codemeta"}
+    cff = [line for line in lines if line["id"] == "pkg2/codemeta.cff"]
+    assert cff[0]["record"]["title"] == "project 2"
+
+
+def test_cli_bundle_usage(inputs, tmp_path):
+    args = ["convert", "-f", "codemeta", "-t", "cff", str(inputs)]
+    for extra in (
+        ["-d", str(tmp_path / "out")],
+        ["--journal", str(tmp_path / "journal")],
+        ["--compress", "gzip"],
+    ):
+        result = CliRunner().invoke(
+            cli, args + ["--bundle", str(tmp_path / "out.zip")] + extra
+        )
+        assert result.exit_code == 2, extra
+    result = CliRunner().invoke(cli, args + ["--bundle", str(tmp_path / "out.7z")])
+    assert result.exit_code == 2
+    assert "Unsupported bundle" in result.output
@@ -0,0 +1,96 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from click.testing import CliRunner
+from pydantic.v1 import ValidationError
+
+from codemeticulous.chunked import DEFAULT_MIN_LENGTH, validate_chunked
+from codemeticulous.cli import cli
+from codemeticulous.codemeta.models import CodeMeta, CodeMetaV3
+
+
+def large_record(authors: int = 300) -> dict:
+    people = [
+        {"@type": "Person", "givenName": f"Given{i}", "familyName": f"Family{i}"}
+        for i in range(authors)
+    ]
+    people[5] = {"@type": "Role", "roleName": "maintainer", "author": {"@id": "#p1"}}
+    people[7] = {"@type": "Organization", "name": "Example Lab"}
+    return {
+        "@context": {"schema": "http://schema.org/"},
+        "schema:name": "big collaboration",
+        "creator": people,
+        "citation": [
+            {"@type": "ScholarlyArticle", "name": f"paper {i}"} for i in range(150)
+        ]
+        + ["https://example.org/paper"],
+        "contIntegration": "https://ci.example.org",
+    }
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        yield pool
+
+
+def test_chunked_validation_matches_serial(pool):
+    record = large_record()
+    expected = CodeMetaV3(**record)
+    instance = validate_chunked(
+        CodeMetaV3, record, executor=pool, chunk_size=32, min_length=100
+    )
+    assert type(instance) is CodeMetaV3
+    assert instance == expected
+    assert instance.json() == expected.json()
+    assert instance.__fields_set__ == expected.__fields_set__
+    assert [type(author) for author in instance.author] == [
+        type(author) for author in expected.author
+    ]
+    # the input isn't modified
+    assert record == large_record()
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda record: record["creator"].__setitem__(250, 5),
+        lambda record: record.pop("schema:name"),
+        lambda record: record.__setitem__("author", record["creator"]),
+    ],
+)
+def test_chunked_validation_errors_match_serial(pool, change):
+    record = large_record()
+    change(record)
+    with pytest.raises(ValidationError) as serial:
+        CodeMetaV3(**record)
+    with pytest.raises(ValidationError) as chunked:
+        validate_chunked(
+            CodeMetaV3, record, executor=pool, chunk_size=32, min_length=100
+        )
+    assert str(chunked.value) == str(serial.value)
+
+
+def test_chunked_validation_in_processes():
+    record = large_record(DEFAULT_MIN_LENGTH + 500)
+    expected = CodeMeta.parse_obj(record)
+    instance = validate_chunked(CodeMeta, record, executor="process", workers=2)
+    assert type(instance) is CodeMeta
+    assert instance == expected
+    assert instance.json() == expected.json()
+    assert instance.__fields_set__ == expected.__fields_set__
+
+
+def test_cli_split_lists(tmp_path):
+    path = tmp_path / "codemeta.json"
+    path.write_text(json.dumps(large_record(10)))
+    serial = CliRunner().invoke(
+        cli, ["convert", "-f", "codemeta", "-t", "cff", str(path)]
+    )
+    result = CliRunner().invoke(
+        cli,
+        ["convert", "-f", "codemeta", "-t", "cff", "--split-lists", "1", str(path)],
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output == serial.output
@@ -0,0 +1,176 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+from click.testing import CliRunner
+
+from codemeticulous.cli import cli
+
+from .conftest import CODEMETA_DIR, CONVERTIBLE
+
+
+def test_convert_single_file_to_stdout():
+    result = CliRunner().invoke(
+        cli,
+        ["convert", "-f", "codemeta", "-t", "cff", str(CODEMETA_DIR / CONVERTIBLE[0])],
+    )
+    assert result.exit_code == 0
+    assert yaml.safe_load(result.output)["cff-version"] == "1.2.0"
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_convert_directory(corpus, tmp_path, jobs):
+    out = tmp_path / "out"
+    result = CliRunner().invoke(
+        cli,
+        [
+            "convert",
+            "-f",
+            "codemeta",
+            "-t",
+            "cff",
+            "-d",
+            str(out),
+            "-j",
+            jobs,
+            str(corpus),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    outputs = sorted(p.relative_to(out).as_posix() for p in out.rglob("*.cff"))
+    assert outputs == [f"project{i}/codemeta.cff" for i in range(len(CONVERTIBLE))]
+
+
+def test_convert_glob_and_file_list(corpus, tmp_path, monkeypatch):
+    monkeypatch.chdir(corpus)
+    (tmp_path / "files.txt").write_text("# projects\nproject0/codemeta.json\n\n")
+    out = tmp_path / "out"
+    result = CliRunner().invoke(
+        cli,
+        [
+            "convert",
+            "-f",
+            "codemeta",
+            "-t",
+            "codemeta",
+            "-d",
+            str(out),
+            "--name-template",
+            "{target}/{path}{ext}",
+            f"@{tmp_path / 'files.txt'}",
+            "project[12]/*.json",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert (out / "codemeta" / "project0" / "codemeta.json").exists()
+    assert (out / "codemeta" / "project2" / "codemeta.json").exists()
+
+
+def test_convert_file_list_of_absolute_paths(corpus, tmp_path):
+    paths = [str(path.resolve()) for path in sorted(corpus.glob("*/codemeta.json"))]
+    (tmp_path / "files.txt").write_text("\n".join(paths) + "\n")
+    out = tmp_path / "out"
+    result = CliRunner().invoke(
+        cli,
+        ["convert", "-f", "codemeta", "-t", "cff", "-d", str(out)]
+        + [f"@{tmp_path / 'files.txt'}"],
+    )
+    assert result.exit_code == 0, result.output
+    # the directories of the inputs are kept, without their leading /
+    for path in paths:
+        assert (out / Path(path).relative_to("/").with_suffix(".cff")).exists()
+
+
+def test_convert_reports_failures(corpus, tmp_path):
+    (corpus / "project0" / "codemeta.json").write_text("{not json")
+    result = CliRunner().invoke(
+        cli,
+        [
+            "convert",
+            "-f",
+            "codemeta",
+            "-t",
+            "cff",
+            "-d",
+            str(tmp_path / "out"),
+            str(corpus),
+        ],
+    )
+    assert result.exit_code == 1
+    assert "Failed to convert" in result.output
+    assert "Converted 2 of 3 files" in result.output
+
+
+def test_convert_multiple_inputs_requires_output_dir(corpus):
+    result = CliRunner().invoke(
+        cli, ["convert", "-f", "codemeta", "-t", "cff", str(corpus)]
+    )
+    assert result.exit_code == 2
+    assert "--output-dir" in result.output
+
+
+def test_convert_single_file_to_many_formats(tmp_path):
+    cff, codemeta = tmp_path / "CITATION.cff", tmp_path / "codemeta.json"
+    result = CliRunner().invoke(
+        cli,
+        [
+            "convert",
+            "-f",
+            "codemeta",
+            "-t",
+            "cff",
+            "-t",
+            "codemeta",
+            "-o",
+            str(cff),
+            "-o",
+            str(codemeta),
+            str(CODEMETA_DIR / CONVERTIBLE[0]),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert yaml.safe_load(cff.read_text())["cff-version"] == "1.2.0"
+    assert json.loads(codemeta.read_text())["name"]
+
+
+def test_convert_many_formats_requires_outputs():
+    result = CliRunner().invoke(
+        cli,
+        [
+            "convert",
+            "-f",
+            "codemeta",
+            "-t",
+            "cff",
+            "-t",
+            "codemeta",
+            str(CODEMETA_DIR / CONVERTIBLE[0]),
+        ],
+    )
+    assert result.exit_code == 2
+    assert "--output" in result.output
+
+
+def test_convert_directory_to_many_formats(corpus, tmp_path):
+    out = tmp_path / "out"
+    result = CliRunner().invoke(
+        cli,
+        [
+            "convert",
+            "-f",
+            "codemeta",
+            "-t",
+            "cff",
+            "-t",
+            "codemeta",
+            "-d",
+            str(out),
+            "--name-template",
+            "{path}.{target}{ext}",
+            str(corpus),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert (out / "project0" / "codemeta.cff.cff").exists()
+    assert (out / "project0" / "codemeta.codemeta.json").exists()
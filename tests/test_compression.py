@@ -0,0 +1,97 @@
+import gzip
+import json
+import lzma
+import zipfile
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous.cli import cli
+from codemeticulous.files import (
+    CODECS,
+    format_extension,
+    iter_file_records,
+    load_file_autodetect,
+    open_file,
+    read_input,
+)
+from codemeticulous.limits import LimitExceeded, RecordLimits
+
+from .conftest import VALID
+
+EXTENSIONS = {"gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+
+def test_format_extension():
+    assert format_extension("codemeta.json.gz") == ".json"
+    assert format_extension("CITATION.cff.XZ") == ".cff"
+    assert format_extension("corpus.ndjson") == ".ndjson"
+
+
+@pytest.mark.parametrize("codec", list(CODECS))
+def test_open_file_round_trip(tmp_path, codec):
+    path = str(tmp_path / f"codemeta.json{EXTENSIONS[codec]}")
+    with open_file(path, "w") as file:
+        file.write(json.dumps(VALID))
+    assert Path(path).read_bytes() != json.dumps(VALID).encode()
+    assert load_file_autodetect(path) == VALID
+    with pytest.raises(LimitExceeded, match="once decompressed"):
+        read_input(path, RecordLimits(max_bytes=100))
+
+
+def test_iter_file_records_streams(tmp_path):
+    path = tmp_path / "corpus.ndjson.xz"
+    with lzma.open(path, "wt") as file:
+        for i in range(3):
+            file.write(json.dumps(dict(VALID, name=f"record {i}")) + "\n")
+    records = iter_file_records(str(path))
+    assert next(records)["name"] == "record 0"
+    assert [record["name"] for record in records] == ["record 1", "record 2"]
+
+
+def test_compressed_archive_member(tmp_path):
+    archive = tmp_path / "release.zip"
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr(
+            "pkg/codemeta.json.gz", gzip.compress(json.dumps(VALID).encode())
+        )
+    assert load_file_autodetect(f"{archive}!pkg/codemeta.json.gz") == VALID
+
+
+def test_cli_compressed_stream(tmp_path):
+    corpus = tmp_path / "corpus.ndjson.gz"
+    with gzip.open(corpus, "wt") as file:
+        file.write(json.dumps(VALID) + "\n" + json.dumps(VALID) + "\n")
+    args = ["convert", "--ndjson", "-f", "codemeta", "-t", "cff", str(corpus)]
+
+    output = tmp_path / "citations.ndjson.bz2"
+    result = CliRunner().invoke(cli, args + ["-o", str(output)])
+    assert result.exit_code == 0, result.output
+    with open_file(str(output)) as file:
+        lines = file.read().splitlines()
+    assert len(lines) == 2
+
+    result = CliRunner().invoke(cli, args + ["--compress", "gzip"])
+    assert result.exit_code == 0, result.output
+    assert gzip.decompress(result.stdout_bytes).decode().splitlines() == lines
+
+
+def test_cli_compress_output_dir(tmp_path):
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "codemeta.json").write_text(json.dumps(VALID))
+    out = tmp_path / "out"
+    result = CliRunner().invoke(
+        cli,
+        ["convert", "-f", "codemeta", "-t", "cff", "-d", str(out), "--compress", "xz"]
+        + [str(tmp_path / "in")],
+    )
+    assert result.exit_code == 0, result.output
+    assert b"cff-version" in lzma.decompress((out / "codemeta.cff.xz").read_bytes())
+
+    result = CliRunner().invoke(
+        cli,
+        ["convert", "-f", "codemeta", "-t", "cff", "--compress", "xz"]
+        + [str(tmp_path / "in" / "codemeta.json")],
+    )
+    assert result.exit_code == 2
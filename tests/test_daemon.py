@@ -0,0 +1,99 @@
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from codemeticulous.daemon import (
+    connect,
+    default_socket_path,
+    identity,
+    private_socket_dir,
+    run_client,
+    send_request,
+    stop_daemon,
+)
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "send_fds"), reason="requires unix domain sockets"
+)
+
+from .conftest import CODEMETA_DIR
+
+
+def run(args, socket_path, daemon, input=None):
+    env = dict(
+        os.environ,
+        CODEMETICULOUS_DAEMON="1" if daemon else "0",
+        CODEMETICULOUS_SOCKET=str(socket_path),
+    )
+    return subprocess.run(
+        [sys.executable, "-c", "from codemeticulous.daemon import main; main()", *args],
+        env=env,
+        input=input,
+        capture_output=True,
+        cwd=CODEMETA_DIR,
+    )
+
+
+@pytest.fixture(scope="module")
+def socket_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("daemon") / "d.sock"
+    yield path
+    stop_daemon(str(path))
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["convert", "-f", "codemeta", "-t", "cff", "valid/codemetar.json"],
+        ["validate", "-f", "codemeta", "invalid/noname.json"],
+        ["convert", "-f", "codemeta", "-t", "nope", "valid/codemetar.json"],
+    ],
+)
+def test_daemon_output_matches_in_process(socket_path, args):
+    expected = run(args, socket_path, daemon=False)
+    forwarded = run(args, socket_path, daemon=True)
+    assert socket_path.exists()
+    assert forwarded.stdout == expected.stdout
+    assert forwarded.stderr == expected.stderr
+    assert forwarded.returncode == expected.returncode
+
+
+def test_daemon_forwards_stdin(socket_path):
+    args = ["convert", "--ndjson", "-f", "codemeta", "-t", "cff", "-"]
+    record = (CODEMETA_DIR / "clean" / "context.json").read_bytes().replace(b"\n", b"")
+    expected = run(args, socket_path, daemon=False, input=record)
+    forwarded = run(args, socket_path, daemon=True, input=record)
+    assert forwarded.stdout == expected.stdout
+    assert forwarded.stdout
+
+
+def test_daemon_of_another_install_is_replaced(socket_path):
+    args = ["validate", "-f", "codemeta", "valid/codemetar.json"]
+    assert run(args, socket_path, daemon=True).returncode == 0
+    sock = connect(str(socket_path))
+    request = {"argv": args, "identity": dict(identity(), version="0.0.0")}
+    response = send_request(sock, request)
+    assert response == {"mismatch": True}
+    # the old daemon stopped listening, and the next client starts its own
+    assert connect(str(socket_path)) is None
+    forwarded = run(args, socket_path, daemon=True)
+    assert forwarded.returncode == 0
+    assert forwarded.stdout == run(args, socket_path, daemon=False).stdout
+
+
+def test_socket_directory_must_be_private(tmp_path, monkeypatch):
+    monkeypatch.delenv("CODEMETICULOUS_SOCKET", raising=False)
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    path = default_socket_path()
+    assert os.path.dirname(path) == f"/tmp/codemeticulous-{os.getuid()}"
+
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    assert not private_socket_dir(str(shared / "d.sock"))
+    assert run_client(["codemeticulous", "--help"], str(shared / "d.sock")) is None
+    assert private_socket_dir(str(tmp_path / "private" / "d.sock"))
+    assert (tmp_path / "private").stat().st_mode & 0o777 == 0o700
@@ -0,0 +1,127 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous.batch import convert_many
+from codemeticulous.cli import cli
+from codemeticulous.convert import convert
+from codemeticulous.failures import error_class, error_stage
+
+from .conftest import CODEMETA_DIR
+
+VALID = json.loads((CODEMETA_DIR / "valid/chime.json").read_text())
+
+
+@pytest.mark.parametrize(
+    "target, record, stage, expected_class",
+    [
+        ("cff", {"description": "no name"}, "validate", "name:value_error.missing"),
+        ("datacite", {"name": "x"}, "from_canonical", "creators:list_type"),
+    ],
+)
+def test_errors_are_classified(target, record, stage, expected_class):
+    with pytest.raises(ValueError) as excinfo:
+        convert("codemeta", target, record)
+    assert error_stage(excinfo.value) == stage
+    assert error_class(excinfo.value).startswith("ValidationError[")
+    assert expected_class in error_class(excinfo.value)
+
+
+def test_error_class_ignores_list_indices():
+    classes = set()
+    for index in range(2):
+        record = {"name": "x", "author": [{"@type": "Person"}] * index + [5]}
+        with pytest.raises(ValueError) as excinfo:
+            convert("codemeta", "codemeta", record)
+        classes.add(error_class(excinfo.value))
+    assert len(classes) == 1
+
+
+def test_record_errors_keep_stage():
+    results = list(convert_many("codemeta", "cff", [{"description": "x"}], workers=1))
+    error = results[0].error
+    assert error.stage == "validate"
+    assert error.fields[0]["path"] == "name"
+    assert error.error_class == "ValidationError[name:value_error.missing]"
+
+
+def test_convert_stream_dead_letter(tmp_path):
+    stream = tmp_path / "records.ndjson"
+    stream.write_text(
+        "\n".join(
+            [
+                json.dumps(VALID),
+                json.dumps({"description": "no name"}),
+                "{not json",
+                json.dumps({"name": "no authors"}),
+            ]
+        )
+        + "\n"
+    )
+    dead_letter = tmp_path / "dead.ndjson"
+    result = CliRunner().invoke(
+        cli,
+        [
+            "convert",
+            "--ndjson",
+            "-f",
+            "codemeta",
+            "-t",
+            "datacite",
+            "--dead-letter",
+            str(dead_letter),
+            str(stream),
+        ],
+    )
+    assert result.exit_code == 1
+    entries = [json.loads(line) for line in dead_letter.read_text().splitlines()]
+    assert [e["input"] for e in entries] == ["record 1", "record 2", "record 3"]
+    assert [e["stage"] for e in entries] == ["validate", "load", "from_canonical"]
+    assert entries[0]["payload"] == {"description": "no name"}
+    assert entries[0]["fields"][0]["path"] == "name"
+    assert entries[1]["payload"] == "{not json\n"
+    assert entries[2]["payload"] == {"name": "no authors"}
+    assert entries[2]["error_class"].startswith("ValidationError[")
+
+
+def test_convert_files_dead_letter(tmp_path):
+    corpus = tmp_path / "corpus"
+    for name, source in [
+        ("good", "valid/codemetar.json"),
+        ("bad", "invalid/noname.json"),
+    ]:
+        (corpus / name).mkdir(parents=True)
+        shutil.copy(CODEMETA_DIR / source, corpus / name / "codemeta.json")
+    (corpus / "broken").mkdir()
+    (corpus / "broken" / "codemeta.json").write_text("{")
+    dead_letter = tmp_path / "dead.ndjson"
+    result = CliRunner().invoke(
+        cli,
+        [
+            "convert",
+            "-f",
+            "codemeta",
+            "-t",
+            "cff",
+            "-d",
+            str(tmp_path / "out"),
+            "--dead-letter",
+            str(dead_letter),
+            str(corpus),
+        ],
+    )
+    assert result.exit_code == 1
+    entries = {
+        Path(e["input"]).parent.name: e
+        for e in map(json.loads, dead_letter.read_text().splitlines())
+    }
+    assert set(entries) == {"bad", "broken"}
+    assert entries["bad"]["stage"] == "validate"
+    assert entries["bad"]["payload"] == json.loads(
+        (CODEMETA_DIR / "invalid/noname.json").read_text()
+    )
+    assert entries["broken"]["stage"] == "load"
+    assert entries["broken"]["payload"] == "{"
@@ -0,0 +1,125 @@
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous.cli import cli
+from codemeticulous.files import RecordLoadError
+from codemeticulous.index import (
+    CorpusIndex,
+    StaleIndexError,
+    build_index,
+    read_range,
+    read_records,
+)
+from codemeticulous.shard import Shard
+
+from .conftest import VALID
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    records = [
+        dict(VALID, name=f"project {i}", identifier=f"10.1234/{i}") for i in range(20)
+    ]
+    records[3] = dict(VALID, name="no identifier")
+    del records[3]["identifier"]
+    lines = [json.dumps(record) for record in records]
+    lines.insert(5, "")
+    lines.insert(8, "{not json")
+    path = tmp_path / "corpus.ndjson"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_build_index(corpus):
+    assert build_index(corpus) == 21
+    index = CorpusIndex.load(corpus)
+    assert len(index) == 21
+    assert "10.1234/7" in index and "#3" in index and "#7" in index
+
+    records = list(read_records(corpus, ["10.1234/12", "#3", "10.1234/1", "nope"]))
+    assert [entry.key for entry, _ in records] == ["10.1234/1", "#3", "10.1234/12"]
+    assert records[0][1]["name"] == "project 1"
+    assert records[1][1]["name"] == "no identifier"
+    ((_, broken),) = read_records(corpus, ["#7"])
+    assert isinstance(broken, RecordLoadError)
+    assert index.lookup(["nope", "10.1234/2"])[1] == ["nope"]
+
+
+def test_stale_index(corpus, tmp_path):
+    with pytest.raises(StaleIndexError):
+        CorpusIndex.load(corpus)
+    build_index(corpus)
+    with open(corpus, "a") as file:
+        file.write(json.dumps(VALID) + "\n")
+    with pytest.raises(StaleIndexError, match="out of date"):
+        CorpusIndex.load(corpus)
+
+
+@pytest.mark.parametrize("parts", [1, 2, 3, 7, 64])
+def test_byte_ranges_cover_every_record_once(corpus, parts):
+    offsets = [
+        offset
+        for part in range(parts)
+        for offset, _ in read_range(corpus, Shard(part, parts))
+    ]
+    assert len(offsets) == 21
+    assert offsets == sorted(set(offsets))
+    assert os.path.getsize(corpus) > offsets[-1]
+
+
+def test_cli_index_and_ids(corpus, tmp_path):
+    ids = tmp_path / "retry.txt"
+    ids.write_text("10.1234/4\n#3\n10.1234/999\n")
+    args = ["convert", "--ndjson", "-f", "codemeta", "-t", "cff"]
+    result = CliRunner().invoke(cli, args + ["--ids", str(ids), corpus])
+    assert result.exit_code == 2
+    assert "index" in result.output
+
+    result = CliRunner().invoke(cli, ["index", corpus])
+    assert result.exit_code == 0, result.output
+    assert "Indexed 21 records" in result.output
+
+    result = CliRunner().invoke(cli, args + ["--ids", str(ids), corpus])
+    assert result.exit_code == 0, result.output
+    assert len(result.stdout.splitlines()) == 2
+    assert "1 of the --ids are not in any index, e.g. 10.1234/999" in result.stderr
+
+    result = CliRunner().invoke(
+        cli, ["validate", "--ndjson", "-f", "codemeta", "--ids", str(ids), corpus]
+    )
+    assert "2 of 2 records are valid" in result.output
+
+
+def test_cli_ids_and_shard(corpus, tmp_path):
+    assert CliRunner().invoke(cli, ["index", corpus]).exit_code == 0
+    ids = tmp_path / "retry.txt"
+    ids.write_text("#3\n10.1234/0\n10.1234/1\n10.1234/10\n")
+    args = ["convert", "--ndjson", "-f", "codemeta", "-t", "cff"]
+
+    def titles(*extra):
+        result = CliRunner().invoke(cli, args + list(extra) + [corpus])
+        return {json.loads(line)["title"] for line in result.stdout.splitlines()}
+
+    selected = titles("--ids", str(ids))
+    assert "no identifier" in selected and len(selected) == 4
+    for parts in (2, 3):
+        for part in range(parts):
+            shard = f"{part}/{parts}"
+            assert titles("--ids", str(ids), "--shard", shard) == (
+                titles("--shard", shard) & selected
+            )
+
+
+def test_cli_byte_range(corpus):
+    valid = 0
+    for part in range(3):
+        result = CliRunner().invoke(
+            cli,
+            ["validate", "--ndjson", "-f", "codemeta"]
+            + ["--byte-range", f"{part}/3", corpus],
+        )
+        valid += int(result.stdout.split(" of ")[0])
+    assert valid == 20
@@ -0,0 +1,120 @@
+import json
+import os
+import zipfile
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous.cli import cli
+from codemeticulous.journal import ENTRY_SIZE, MAGIC, Journal
+
+from .conftest import CODEMETA_DIR
+
+
+def test_journal_survives_truncation(tmp_path):
+    path = tmp_path / "journal"
+    with Journal(str(path), scope="test") as journal:
+        keys = [journal.key(f"input{i}", b"content") for i in range(3)]
+        for key in keys:
+            journal.add(key)
+        assert keys[0] not in journal
+    assert path.stat().st_size == len(MAGIC) + 3 * ENTRY_SIZE
+
+    # a crash in the middle of writing the last entry
+    with open(path, "r+b") as file:
+        file.truncate(len(MAGIC) + 2 * ENTRY_SIZE + 5)
+    with Journal(str(path), scope="test") as journal:
+        assert keys[0] in journal and keys[1] in journal
+        assert keys[2] not in journal
+        journal.add(keys[2])
+    with Journal(str(path), scope="test") as journal:
+        assert all(key in journal for key in keys)
+        # changed content or another scope is not a match
+        assert journal.key("input0", b"changed") not in journal
+    with Journal(str(path), scope="other") as journal:
+        assert journal.key("input0", b"content") not in journal
+
+
+def test_file_keys_come_from_stat(tmp_path):
+    path = tmp_path / "codemeta.json"
+    path.write_text("{}")
+    os.utime(path, ns=(0, 10**9))
+    with Journal(str(tmp_path / "journal")) as journal:
+        key = journal.key_for_file(str(path))
+        # same size and modification time, the content isn't read
+        path.write_text("[]")
+        os.utime(path, ns=(0, 10**9))
+        assert journal.key_for_file(str(path)) == key
+        os.utime(path, ns=(0, 2 * 10**9))
+        assert journal.key_for_file(str(path)) != key
+        assert journal.key_for_file(str(tmp_path / "missing.json")) is None
+
+        archive = tmp_path / "release.zip"
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            zip_file.writestr("a/codemeta.json", "{}")
+            zip_file.writestr("b/codemeta.json", "{}")
+        keys = {journal.key_for_file(f"{archive}!{m}/codemeta.json") for m in "ab"}
+        assert len(keys) == 2 and None not in keys
+
+
+def test_journal_rejects_other_files(tmp_path):
+    path = tmp_path / "not-a-journal"
+    path.write_text("hello")
+    with pytest.raises(ValueError):
+        Journal(str(path))
+
+
+def test_convert_resumes_from_journal(corpus, tmp_path):
+    out = tmp_path / "out"
+    journal = tmp_path / "convert.journal"
+    args = ["convert", "-f", "codemeta", "-t", "cff", "-d", str(out)]
+    args += ["--journal", str(journal), str(corpus)]
+    runner = CliRunner()
+
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "Converted 3 of 3 files" in result.output
+
+    # an input that changed is converted again, the others are skipped
+    project = corpus / "project0" / "codemeta.json"
+    data = json.loads(project.read_text())
+    data["name"] = "renamed"
+    project.write_text(json.dumps(data))
+    (out / "project1" / "codemeta.cff").unlink()
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "Converted 1 of 1 files" in result.output
+    assert "skipped 2 completed in an earlier run" in result.output
+    assert not (out / "project1" / "codemeta.cff").exists()
+    assert "renamed" in (out / "project0" / "codemeta.cff").read_text()
+
+
+def test_validate_stream_resumes_from_journal(tmp_path):
+    records = [{"name": f"project {i}"} for i in range(5)] + [{"description": "x"}]
+    stream = tmp_path / "records.ndjson"
+    stream.write_text("".join(json.dumps(r) + "\n" for r in records))
+    journal = tmp_path / "validate.journal"
+    args = ["validate", "--ndjson", "-f", "codemeta", "--journal", str(journal)]
+    runner = CliRunner()
+
+    result = runner.invoke(cli, args + [str(stream)])
+    assert result.exit_code == 1
+    assert "5 of 6 records are valid" in result.output
+    # invalid records aren't journaled, so they are checked again
+    result = runner.invoke(cli, args + [str(stream)])
+    assert result.exit_code == 1
+    assert "0 of 1 records are valid" in result.output
+    assert "Skipped 5 validated in an earlier run." in result.output
+
+
+def test_journal_dated_yaml_records(tmp_path):
+    # CITATION.cff files have dates, which YAML loads as datetime.date
+    stream = tmp_path / "records.yaml"
+    stream.write_text((CODEMETA_DIR.parent / "cff/valid/bso-toolbox.cff").read_text())
+    journal = tmp_path / "validate.journal"
+    args = ["validate", "--ndjson", "-f", "cff", "--journal", str(journal)]
+    result = CliRunner().invoke(cli, args + [str(stream)])
+    assert result.exit_code == 0, result.output
+    result = CliRunner().invoke(cli, args + [str(stream)])
+    assert result.exit_code == 0, result.output
+    assert "Skipped 1 validated in an earlier run." in result.output
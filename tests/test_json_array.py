@@ -0,0 +1,94 @@
+import io
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous.batch import convert_many
+from codemeticulous.cli import cli
+from codemeticulous.files import RecordLoadError, iter_file_records, iter_json_array
+from codemeticulous.limits import LimitExceeded, RecordLimits
+
+from .conftest import VALID
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64, 1 << 16])
+def test_iter_json_array(chunk_size):
+    records = [VALID, {"name": 'é\\"x', "version": 12345678}, [], 1.5e10, None]
+    text = " \n" + json.dumps(records, indent=2) + "\n"
+    assert list(iter_json_array(io.StringIO(text), chunk_size)) == records
+    assert list(iter_json_array(io.StringIO(" [ ] "), chunk_size)) == []
+
+
+def test_iter_json_array_chunk_boundaries():
+    records = [1.5, {"a": 1}, -2.5e-3, 1e10, 0, 12345678901234567890, True, None, "é"]
+    for text in (json.dumps(records), json.dumps(records, separators=(",", ":"))):
+        for chunk_size in range(1, len(text) + 1):
+            stream = io.StringIO(text)
+            assert list(iter_json_array(stream, chunk_size)) == records, chunk_size
+
+
+def test_iter_json_array_reads_lazily():
+    text = json.dumps([VALID] * 1000)
+    stream = io.StringIO(text)
+    records = iter_json_array(stream, chunk_size=1024)
+    assert next(records) == VALID
+    assert next(records) == VALID
+    assert stream.tell() < 4 * len(json.dumps(VALID)) + 1024
+
+
+def test_iter_json_array_errors():
+    records = list(iter_json_array(io.StringIO('[{"a": 1}, {"a": tru}, {}]'), 4))
+    assert records[0] == {"a": 1}
+    assert isinstance(records[1], RecordLoadError) and len(records) == 2
+    records = list(iter_json_array(io.StringIO('[{"a": 1} {"b": 2}]'), 4))
+    assert "expected , or ]" in str(records[1])
+    records = list(iter_json_array(io.StringIO('[{"a": 1}, {"b": 2'), 4))
+    assert isinstance(records[1], RecordLoadError)
+
+    big = json.dumps([{"a": 1}, {"b": "x" * 1000}, {"c": 3}])
+    records = list(iter_json_array(io.StringIO(big), 16, RecordLimits(max_bytes=100)))
+    assert records[0] == {"a": 1}
+    assert isinstance(records[1], LimitExceeded) and len(records) == 2
+
+
+def test_json_array_files(tmp_path):
+    path = tmp_path / "dump.json"
+    path.write_text(json.dumps([VALID, {"description": "no name"}, VALID]))
+    assert list(iter_file_records(str(path))) == [
+        VALID,
+        {"description": "no name"},
+        VALID,
+    ]
+    # the JSON lines reader still reads lines
+    lines = tmp_path / "corpus.ndjson"
+    lines.write_text("\n" + json.dumps(VALID) + "\n" + json.dumps(VALID) + "\n")
+    assert list(iter_file_records(str(lines))) == [VALID, VALID]
+
+    results = list(convert_many("codemeta", "cff", iter_file_records(str(path)), 1))
+    assert [result.ok for result in results] == [True, False, True]
+
+
+def test_cli_json_array(tmp_path):
+    path = tmp_path / "dump.json"
+    path.write_text(json.dumps([VALID, {"description": "no name"}, VALID]))
+    result = CliRunner().invoke(
+        cli, ["convert", "--ndjson", "-f", "codemeta", "-t", "cff", str(path)]
+    )
+    assert result.exit_code == 1
+    assert "Failed to convert record 1" in result.stderr
+    assert len(result.stdout.splitlines()) == 2
+
+    path.write_text(json.dumps([VALID, {"name": "x" * 10000}, VALID]))
+    result = CliRunner().invoke(
+        cli,
+        ["convert", "--ndjson", "-f", "codemeta", "-t", "cff", str(path)]
+        + ["--limit", "max-bytes=5000"],
+    )
+    assert result.stderr.startswith("Failed to convert record 1: Record is 10012 bytes")
+    assert len(result.stdout.splitlines()) == 2
+
+    result = CliRunner().invoke(
+        cli, ["validate", "--ndjson", "-f", "codemeta", str(path)]
+    )
+    assert "3 of 3 records are valid" in result.output
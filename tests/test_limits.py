@@ -0,0 +1,166 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous import batch
+from codemeticulous.batch import RecordResult, convert_many, run_chunks
+from codemeticulous.cli import cli
+from codemeticulous.extract import extract_doi_from_identifier
+from codemeticulous.limits import LimitExceeded, RecordLimits, RecordTimeout, time_limit
+from codemeticulous.server import make_server
+
+from .conftest import VALID
+
+# takes the DOI pattern quadratic time to rule out
+SLOW_IDENTIFIER = "10.1234/" * 20000 + "!"
+
+
+def nested(depth):
+    record = {"name": "x"}
+    for _ in range(depth - 1):
+        record = {"name": "x", "isPartOf": record}
+    return record
+
+
+def test_parse_limits():
+    limits = RecordLimits.parse(["max-depth=3", "max_bytes=100", "timeout=0.5"])
+    assert limits == RecordLimits(max_bytes=100, max_depth=3, timeout=0.5)
+    assert limits and not RecordLimits()
+    for spec in ["depth=3", "max-depth=x", "timeout=0"]:
+        with pytest.raises(ValueError):
+            RecordLimits.parse([spec])
+
+
+def test_check_record():
+    limits = RecordLimits(max_depth=3, max_list_length=2)
+    limits.check_record(nested(3))
+    limits.check_record({"author": [{"name": "a"}, {"name": "b"}]})
+    with pytest.raises(LimitExceeded) as excinfo:
+        limits.check_record(nested(4))
+    assert excinfo.value.limit == "max_depth"
+    with pytest.raises(LimitExceeded) as excinfo:
+        limits.check_record({"keywords": ["a", "b", "c"]})
+    assert excinfo.value.limit == "max_list_length"
+
+    RecordLimits(max_bytes=4).check_payload("abcd")
+    with pytest.raises(LimitExceeded):
+        RecordLimits(max_bytes=4).check_payload("abcdé")
+
+
+def test_time_limit_interrupts_regex():
+    with pytest.raises(RecordTimeout):
+        with time_limit(0.2):
+            extract_doi_from_identifier(SLOW_IDENTIFIER)
+
+
+def test_convert_many_limits():
+    records = [VALID, nested(20), dict(VALID, identifier=SLOW_IDENTIFIER), VALID]
+    # load the models first, so that the time limit is only spent converting
+    list(convert_many("codemeta", "cff", [VALID], workers=1))
+    limits = RecordLimits(max_depth=10, timeout=2)
+    results = list(convert_many("codemeta", "cff", records, workers=1, limits=limits))
+    assert [result.ok for result in results] == [True, False, False, True]
+    assert results[1].error.error_type == "LimitExceeded"
+    assert results[1].error.stage == "load"
+    assert results[2].error.error_type == "RecordTimeout"
+    assert results[2].error.stage == "from_canonical"
+    assert results[2].seconds < 5
+
+
+def test_run_chunks_recycles_pool(monkeypatch):
+    pools = []
+    make_executor = batch.make_executor
+
+    def counting_make_executor(executor, workers):
+        pools.append(make_executor(executor, workers))
+        return pools[-1]
+
+    monkeypatch.setattr(batch, "make_executor", counting_make_executor)
+
+    def fn(chunk):
+        return [RecordResult(index, outputs=item) for index, item in chunk]
+
+    results = run_chunks(
+        fn,
+        batch.chunked(range(20), 2),
+        workers=2,
+        executor="thread",
+        recycle=lambda results: any(result.outputs == 7 for result in results),
+    )
+    assert [result.outputs for result in results] == list(range(20))
+    assert len(pools) == 2
+
+
+def test_server_limits():
+    executor = ThreadPoolExecutor(1)
+    server = make_server(
+        port=0, executor=executor, quiet=True, limits=RecordLimits(max_depth=10)
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/convert/codemeta/cff"
+    try:
+        with pytest.raises(HTTPError) as excinfo:
+            urlopen(Request(url, data=json.dumps(nested(20)).encode()))
+        assert excinfo.value.code == 422
+        assert "levels deep" in json.loads(excinfo.value.read())["error"]
+        with urlopen(Request(url, data=json.dumps(VALID).encode())) as response:
+            assert response.status == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+        executor.shutdown()
+
+
+def test_cli_limits(tmp_path):
+    stream = tmp_path / "records.ndjson"
+    records = [VALID, dict(VALID, keywords=["k"] * 50), VALID]
+    stream.write_text("".join(json.dumps(r) + "\n" for r in records))
+    args = ["convert", "--ndjson", "-f", "codemeta", "-t", "cff"]
+    result = CliRunner().invoke(
+        cli, args + ["--limit", "max-list-length=20", str(stream)]
+    )
+    assert result.exit_code == 1
+    assert "Failed to convert record 1: Record has a list of 50 items" in result.stderr
+    assert len(result.stdout.splitlines()) == 2
+
+    result = CliRunner().invoke(cli, args + ["--limit", "depth=3", str(stream)])
+    assert result.exit_code == 2
+    assert "Unknown limit" in result.output
+
+
+def test_cli_validate_limits(tmp_path):
+    records = [VALID, dict(VALID, keywords=["k"] * 50), VALID]
+    stream = tmp_path / "records.ndjson"
+    stream.write_text("".join(json.dumps(r) + "\n" for r in records))
+    result = CliRunner().invoke(
+        cli,
+        ["validate", "--ndjson", "-f", "codemeta", "--limit", "max-list-length=20"]
+        + [str(stream)],
+    )
+    assert result.exit_code == 1
+    assert "Record 1 is invalid: Record has a list of 50 items" in result.stderr
+    assert "2 of 3 records are valid" in result.stdout
+
+    for i, record in enumerate(records):
+        (tmp_path / f"project{i}").mkdir()
+        (tmp_path / f"project{i}" / "codemeta.json").write_text(json.dumps(record))
+    result = CliRunner().invoke(
+        cli,
+        ["validate", "-f", "codemeta", "--limit", "max-list-length=20"]
+        + [str(tmp_path / "project1" / "codemeta.json")],
+    )
+    assert result.exit_code == 1
+    assert "0 of 1 files are valid" in result.stdout
+    result = CliRunner().invoke(
+        cli,
+        ["validate", "-f", "codemeta", "--limit", f"max-bytes={len(json.dumps(VALID))}"]
+        + [str(tmp_path)],
+    )
+    assert result.exit_code == 1
+    assert "2 of 3 files are valid" in result.stdout
@@ -0,0 +1,146 @@
+import json
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous.cli import cli
+from codemeticulous.files import InputFile
+from codemeticulous.pipeline import (
+    ExecutorSpec,
+    FileSink,
+    FileSource,
+    FilterStage,
+    Item,
+    NDJSONSink,
+    NDJSONSource,
+    Pipeline,
+    Stage,
+    build_conversion_pipeline,
+)
+
+from .conftest import CODEMETA_DIR, CONVERTIBLE, make_corpus
+
+
+def double(value):
+    return value * 2
+
+
+def fail_on_three(value):
+    if value == 3:
+        raise ValueError("three")
+    return value
+
+
+def items(values):
+    return [Item(index, f"item {index}", value) for index, value in enumerate(values)]
+
+
+@pytest.mark.parametrize("kind", ["inline", "thread", "process"])
+def test_pipeline_keeps_order(kind):
+    stages = [
+        Stage("check", fail_on_three, ExecutorSpec(kind, 2)),
+        Stage("double", double, ExecutorSpec(kind)),
+    ]
+    results = list(Pipeline(items(range(20)), stages, queue_size=4).run())
+    assert [item.index for item in results] == list(range(20))
+    assert results[3].error.stage == "check"
+    assert results[3].value == 3
+    assert [item.value for item in results if item.ok] == [
+        2 * v for v in range(20) if v != 3
+    ]
+
+
+def test_filters_drop_items():
+    stages = [FilterStage("even", lambda item: item.value % 2 == 0)]
+    results = list(Pipeline(items(range(6)), stages).run())
+    assert [item.value for item in results] == [0, 2, 4]
+
+
+def test_pipeline_is_bounded():
+    consumed = []
+    gate = threading.Event()
+
+    def source():
+        for item in items(range(100)):
+            consumed.append(item.index)
+            yield item
+
+    def wait(value):
+        gate.wait()
+        return value
+
+    run = Pipeline(source(), [Stage("wait", wait)], queue_size=2).run()
+    next_item = threading.Thread(target=lambda: next(run))
+    next_item.start()
+    next_item.join(0.5)
+    # the source is held back while the stage is blocked
+    assert len(consumed) < 10
+    gate.set()
+    next_item.join()
+    assert len(list(run)) == 99
+
+
+def test_source_errors_abort_the_pipeline():
+    def source():
+        yield from items(range(3))
+        raise OSError("disk on fire")
+
+    with pytest.raises(OSError, match="disk on fire"):
+        list(Pipeline(source(), [Stage("double", double)]).run())
+
+
+def test_conversion_pipeline_with_files(tmp_path):
+    input_files = [
+        InputFile(str(path), f"project{i}/codemeta.json")
+        for i, path in enumerate(make_corpus(tmp_path / "in", CONVERTIBLE))
+    ]
+    (tmp_path / "in" / "broken.json").write_text("{")
+    input_files.append(InputFile(str(tmp_path / "in" / "broken.json"), "broken.json"))
+
+    pipeline = build_conversion_pipeline(
+        "codemeta",
+        ["cff"],
+        FileSource(input_files),
+        FileSink(str(tmp_path / "out"), "{path}{ext}"),
+        executors={"validate": ExecutorSpec("thread", 2)},
+    )
+    results = list(pipeline.run())
+    assert [item.ok for item in results] == [True, True, True, False]
+    assert results[3].error.stage == "load"
+    for i in range(3):
+        assert results[i].meta["output_paths"]["cff"] == str(
+            tmp_path / "out" / f"project{i}" / "codemeta.cff"
+        )
+        assert (tmp_path / "out" / f"project{i}" / "codemeta.cff").exists()
+
+
+def test_ndjson_source_and_sink(tmp_path, capsys):
+    stream = tmp_path / "records.ndjson"
+    records = [json.loads((CODEMETA_DIR / name).read_text()) for name in CONVERTIBLE]
+    stream.write_text("".join(json.dumps(r) + "\n" for r in records))
+    pipeline = build_conversion_pipeline(
+        "codemeta", ["codemeta"], NDJSONSource([str(stream)]), NDJSONSink()
+    )
+    assert all(item.ok for item in pipeline.run())
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3
+    assert json.loads(lines[0])["name"] == records[0]["name"]
+
+
+def test_convert_stream_stage_executors(tmp_path):
+    stream = tmp_path / "records.ndjson"
+    records = [json.loads((CODEMETA_DIR / name).read_text()) for name in CONVERTIBLE]
+    records.insert(1, {"description": "no name"})
+    stream.write_text("".join(json.dumps(r) + "\n" for r in records))
+    args = ["convert", "--ndjson", "-f", "codemeta", "-t", "cff"]
+    args += ["--stage-executor", "validate=process:2"]
+    args += ["--stage-executor", "serialize=thread:2", str(stream)]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 1
+    assert "Failed to convert record 1" in result.stderr
+    assert len(result.stdout.splitlines()) == 3
+
+    result = CliRunner().invoke(cli, args[:-1] + ["--stage-executor", "x=thread"])
+    assert result.exit_code == 2
+    assert "Unknown stage" in result.output
@@ -0,0 +1,110 @@
+import json
+import threading
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous import files
+from codemeticulous.batch import convert_files
+from codemeticulous.cli import cli
+from codemeticulous.files import InputFile, load_file_autodetect, read_ahead
+from codemeticulous.pipeline import FileSource
+
+from .conftest import CONVERTIBLE, make_corpus
+
+
+@pytest.fixture
+def corpus_files(tmp_path):
+    return [str(path) for path in make_corpus(tmp_path / "in", CONVERTIBLE * 3)]
+
+
+def test_read_ahead_in_order(corpus_files):
+    missing = str(Path(corpus_files[0]).parent / "missing.json")
+    items = corpus_files[:4] + [missing] + corpus_files[4:]
+    results = list(read_ahead(items, depth=3))
+    assert [(index, item) for index, item, _ in results] == list(enumerate(items))
+    assert isinstance(results[4][2], FileNotFoundError)
+    for _, path, content in results[:4]:
+        assert content == Path(path).read_bytes()
+
+
+def test_read_ahead_keeps_reads_in_flight(corpus_files, monkeypatch):
+    # the first read only completes once the other two have been yielded, so they have
+    # to be read while it is in flight and come first in completion order
+    others_done = threading.Event()
+    read_bytes = files.read_input
+
+    def slow_first_read(path):
+        if path == corpus_files[0]:
+            assert others_done.wait(5)
+        return read_bytes(path)
+
+    monkeypatch.setattr(files, "read_input", slow_first_read)
+    indices = []
+    for index, _, _ in read_ahead(corpus_files[:3], depth=3, ordered=False):
+        indices.append(index)
+        if len(indices) == 2:
+            others_done.set()
+    assert sorted(indices[:2]) == [1, 2] and indices[2] == 0
+
+    with pytest.raises(ValueError):
+        list(read_ahead(corpus_files, depth=0))
+
+
+def test_load_file_autodetect_content(corpus_files):
+    content = Path(corpus_files[0]).read_bytes()
+    assert load_file_autodetect("other.json", content) == json.loads(content)
+    with pytest.raises(files.RecordLoadError, match="No such file"):
+        load_file_autodetect("other.json", FileNotFoundError("No such file"))
+
+
+def test_convert_files_read_ahead(corpus_files, tmp_path):
+    jobs = [
+        (path, {"cff": str(tmp_path / "out" / f"{i}.cff")})
+        for i, path in enumerate(corpus_files)
+    ]
+    jobs.append(
+        (str(tmp_path / "missing.json"), {"cff": str(tmp_path / "out" / "x.cff")})
+    )
+    results = list(convert_files("codemeta", jobs, workers=1, read_ahead=4))
+    assert [result.index for result in results] == list(range(len(jobs)))
+    assert [result.ok for result in results] == [True] * len(corpus_files) + [False]
+    assert results[-1].error.stage == "load"
+    for result in results[:-1]:
+        assert Path(result.outputs["cff"]).exists()
+    unordered = list(
+        convert_files("codemeta", jobs, workers=1, ordered=False, read_ahead=4)
+    )
+    assert sorted(result.index for result in unordered) == list(range(len(jobs)))
+
+
+def test_file_source_read_ahead(corpus_files):
+    input_files = [
+        InputFile(path, f"{i}/codemeta") for i, path in enumerate(corpus_files)
+    ]
+    items = list(FileSource(input_files, read_ahead=4))
+    assert [item.index for item in items] == list(range(len(corpus_files)))
+    assert [item.record for item in items] == [
+        Path(path).read_text() for path in corpus_files
+    ]
+
+
+def test_cli_read_ahead(corpus_files, tmp_path):
+    inputs = str(tmp_path / "in")
+    result = CliRunner().invoke(
+        cli, ["validate", "-f", "codemeta", "--read-ahead", "4", inputs]
+    )
+    assert result.exit_code == 0, result.output
+    assert (
+        f"{len(corpus_files)} of {len(corpus_files)} files are valid" in result.output
+    )
+
+    out = tmp_path / "out"
+    args = ["convert", "-f", "codemeta", "-t", "cff", "--read-ahead", "4"]
+    result = CliRunner().invoke(cli, args + ["-d", str(out), inputs])
+    assert result.exit_code == 0, result.output
+    assert len(list(out.rglob("*.cff"))) == len(corpus_files)
+
+    result = CliRunner().invoke(cli, args + ["--ndjson", inputs])
+    assert result.exit_code == 2
@@ -0,0 +1,116 @@
+import json
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+import yaml
+
+from codemeticulous.convert import convert
+from codemeticulous.server import ConversionServer, make_server
+
+from .conftest import CODEMETA_DIR
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    executor = ThreadPoolExecutor(2)
+    server = make_server(
+        port=0, executor=executor, max_request_size=64 * 1024, quiet=True
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    executor.shutdown()
+
+
+def request(url, data=None):
+    try:
+        with urlopen(Request(url, data=data)) as response:
+            return response.status, response.read().decode()
+    except HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def test_convert(server_url):
+    payload = (CODEMETA_DIR / "valid" / "codemetar.json").read_bytes()
+    status, body = request(f"{server_url}/convert/codemeta/cff", payload)
+    assert status == 200
+    expected = convert("codemeta", "cff", json.loads(payload))
+    assert yaml.safe_load(body) == yaml.safe_load(expected.yaml())
+
+
+def test_validate(server_url):
+    status, body = request(f"{server_url}/validate/codemeta", b'{"name": "x"}')
+    assert (status, json.loads(body)) == (200, {"valid": True})
+    status, body = request(f"{server_url}/validate/codemeta", b"{}")
+    assert status == 422
+    assert json.loads(body)["valid"] is False
+
+
+def test_batch(server_url):
+    lines = [
+        (CODEMETA_DIR / "clean" / "context.json").read_text().replace("\n", ""),
+        "{not json",
+    ]
+    status, body = request(
+        f"{server_url}/batch/codemeta/cff", "\n".join(lines).encode()
+    )
+    assert status == 200
+    results = [json.loads(line) for line in body.splitlines()]
+    assert results[0]["output"]["cff-version"] == "1.2.0"
+    assert results[1]["index"] == 1 and "error" in results[1]
+
+
+def test_errors_and_metrics(server_url):
+    assert request(f"{server_url}/convert/codemeta/nope", b"{}")[0] == 404
+    assert request(f"{server_url}/validate/cff", b"x" * 65 * 1024)[0] == 413
+    assert request(f"{server_url}/health") == (200, '{"status": "ok"}')
+    status, body = request(f"{server_url}/metrics")
+    metrics = json.loads(body)
+    assert metrics["requests"]["convert"] >= 1
+    assert metrics["responses"]["413"] == 1
+
+
+def test_negative_content_length(server_url):
+    host, port = server_url.rsplit("/", 1)[1].split(":")
+    with socket.create_connection((host, int(port)), timeout=10) as sock:
+        sock.sendall(
+            b"POST /validate/cff HTTP/1.1\r\nHost: x\r\nContent-Length: -1\r\n\r\n"
+            + b"x" * 10000
+        )
+        # answered without waiting for the client to stop sending
+        response = b""
+        while b"Invalid Content-Length" not in response:
+            data = sock.recv(4096)
+            if not data:
+                break
+            response += data
+    response = response.decode()
+    assert response.split(" ", 2)[1] == "400"
+    assert "Invalid Content-Length" in response
+
+
+def test_submit_to_recycled_executor():
+    class RacingExecutor(ThreadPoolExecutor):
+        # another handler recycles the executor right before work is submitted to it
+        def submit(self, fn, *args):
+            server.recycle_executor(self)
+            return super().submit(fn, *args)
+
+    racing = RacingExecutor(1)
+    replacement = ThreadPoolExecutor(1)
+    server = ConversionServer(
+        ("127.0.0.1", 0), racing, quiet=True, executor_factory=lambda: replacement
+    )
+    try:
+        executor, future = server.submit(pow, 2, 3)
+        assert future.result() == 8
+        assert executor is replacement and server.executor is replacement
+    finally:
+        server.server_close()
+        replacement.shutdown()
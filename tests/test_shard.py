@@ -0,0 +1,166 @@
+import json
+import shutil
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous.cli import cli
+from codemeticulous.report import BatchReport, merge_reports
+from codemeticulous.shard import Shard, record_key
+
+from .conftest import CODEMETA_DIR, CONVERTIBLE, make_corpus
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / "corpus"
+    make_corpus(root, [CONVERTIBLE[i % 3] for i in range(8)])
+    shutil.copy(
+        CODEMETA_DIR / "invalid/noname.json", root / "project0" / "codemeta.json"
+    )
+    return root
+
+
+def test_shards_are_disjoint_and_complete():
+    keys = [f"projects/{i}/codemeta.json" for i in range(200)]
+    shards = [Shard(i, 4) for i in range(4)]
+    assignments = [[s for s in shards if s.contains(key)] for key in keys]
+    assert all(len(a) == 1 for a in assignments)
+    assert all(any(a == [s] for a in assignments) for s in shards)
+    # stable across runs, doesn't depend on python's randomized string hashing
+    assert assignments[0] == [Shard(0, 4)]
+    assert Shard(3, 4).contains("a")
+
+
+@pytest.mark.parametrize("spec", ["4/4", "-1/2", "1", "a/b", "0/0"])
+def test_invalid_shard(spec):
+    with pytest.raises(ValueError):
+        Shard.parse(spec)
+
+
+def test_record_key():
+    assert (
+        record_key({"@id": "https://doi.org/x", "name": "a"}, 3) == "https://doi.org/x"
+    )
+    assert record_key({"identifier": "x"}, 3) == "x"
+    assert record_key({"name": "a"}, 3) == "#3"
+    assert record_key(ValueError("bad line"), 3) == "#3"
+
+
+def test_merge_reports_percentiles():
+    fast = BatchReport(command="convert", shard="0/2")
+    slow = BatchReport(command="convert", shard="1/2")
+    for _ in range(90):
+        fast.add("a", 0.01)
+    for _ in range(10):
+        slow.add("b", 1.0, error=ValueError("boom"))
+    merged = merge_reports([fast, slow])
+    data = merged.to_dict()
+    assert (data["total"], data["succeeded"], data["failed"]) == (100, 90, 10)
+    assert data["failed_shards"] == ["1/2"]
+    assert data["missing_shards"] == []
+    assert 0.01 <= data["timing"]["p50_seconds"] < 0.012
+    assert data["timing"]["p99_seconds"] == 1.0
+    # a merged report can be read back and merged again
+    again = merge_reports([BatchReport.from_dict(json.loads(json.dumps(data)))])
+    assert again.to_dict()["timing"]["histogram"] == data["timing"]["histogram"]
+    assert again.to_dict()["failed_shards"] == ["1/2"]
+
+
+def test_sharded_convert_and_merge_reports(corpus, tmp_path):
+    out = tmp_path / "out"
+    runner = CliRunner()
+    exit_codes = []
+    for i in range(3):
+        result = runner.invoke(
+            cli,
+            [
+                "convert",
+                "-f",
+                "codemeta",
+                "-t",
+                "cff",
+                "-d",
+                str(out),
+                "--shard",
+                f"{i}/3",
+                "--report",
+                str(tmp_path / f"report{i}.json"),
+                str(corpus),
+            ],
+        )
+        exit_codes.append(result.exit_code)
+    # only the shard with the invalid project fails
+    assert sorted(exit_codes) == [0, 0, 1]
+    outputs = sorted(p.parent.name for p in out.rglob("*.cff"))
+    assert outputs == [f"project{i}" for i in range(1, 8)]
+
+    result = runner.invoke(
+        cli,
+        ["merge-reports"] + [str(tmp_path / f"report{i}.json") for i in range(2)],
+    )
+    assert result.exit_code == 0
+    assert "Missing shards: 2/3" in result.output
+
+    merged_path = tmp_path / "merged.json"
+    result = runner.invoke(
+        cli,
+        ["merge-reports", "-o", str(merged_path)]
+        + [str(tmp_path / f"report{i}.json") for i in range(3)],
+    )
+    assert result.exit_code == 0, result.output
+    merged = json.loads(merged_path.read_text())
+    assert (merged["total"], merged["failed"]) == (8, 1)
+    assert merged["failures"][0]["input"].endswith("project0/codemeta.json")
+    assert merged["failed_shards"] == [str(exit_codes.index(1)) + "/3"]
+    assert merged["timing"]["count"] == 8
+
+
+def test_sharded_validate_stream(tmp_path):
+    records = [
+        {"name": f"project {i}", "@id": f"https://example.org/{i}"} for i in range(20)
+    ]
+    stream = tmp_path / "records.ndjson"
+    stream.write_text("".join(json.dumps(r) + "\n" for r in records))
+    totals = 0
+    for i in range(2):
+        report_path = tmp_path / f"report{i}.json"
+        result = CliRunner().invoke(
+            cli,
+            [
+                "validate",
+                "--ndjson",
+                "-f",
+                "codemeta",
+                "--shard",
+                f"{i}/2",
+                "--report",
+                str(report_path),
+                str(stream),
+            ],
+        )
+        assert result.exit_code == 0, result.output
+        totals += json.loads(report_path.read_text())["total"]
+    assert totals == len(records)
+
+
+def test_validate_directory(corpus):
+    result = CliRunner().invoke(cli, ["validate", "-f", "codemeta", str(corpus)])
+    assert result.exit_code == 1
+    assert "7 of 8 files are valid codemeta files." in result.output
+
+
+def test_sharded_file_list_of_absolute_paths(tmp_path):
+    paths = [str(path) for path in make_corpus(tmp_path, CONVERTIBLE[:1] * 30)]
+    file_list = tmp_path / "inputs.txt"
+    file_list.write_text("\n".join(paths) + "\n")
+    counts = []
+    for i in range(3):
+        result = CliRunner().invoke(
+            cli,
+            ["validate", "-f", "codemeta", "--shard", f"{i}/3", f"@{file_list}"],
+        )
+        counts.append(int(result.output.split(" of ")[0].split()[-1]))
+    # files that share a name are still spread over the shards
+    assert sum(counts) == 30
+    assert all(counts)
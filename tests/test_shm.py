@@ -0,0 +1,62 @@
+import json
+
+from codemeticulous.convert import convert_to_many
+from codemeticulous.limits import RecordLimits
+from codemeticulous.shm import SharedRing, convert_payloads
+
+from .conftest import CODEMETA_DIR, CONVERTIBLE
+
+
+def test_ring_slots():
+    with SharedRing(4, 16) as ring:
+        assert ring.write(1, b"hello")
+        assert not ring.write(2, b"x" * 17)
+        other = SharedRing(4, 16, name=ring.name)
+        assert other.read(1, 5) == b"hello"
+        other.write(3, b"from a worker")
+        other.close()
+        assert ring.read(3, 13) == b"from a worker"
+
+
+def test_convert_payloads_matches_convert():
+    payloads = [(CODEMETA_DIR / name).read_text() for name in CONVERTIBLE]
+    # an invalid record, one that fails to load, and one larger than a slot
+    payloads += [json.dumps({"description": "no name"}), "{not json"]
+    big = json.loads((CODEMETA_DIR / "valid/codemetar.json").read_text())
+    big["description"] = "x" * 5000
+    payloads.append(json.dumps(big))
+
+    results = list(
+        convert_payloads(
+            "codemeta",
+            ["codemeta", "cff"],
+            payloads,
+            workers=2,
+            chunksize=2,
+            slot_size=4096,
+        )
+    )
+    assert [result.index for result in results] == list(range(len(payloads)))
+    assert [result.ok for result in results] == [True, True, True, False, False, True]
+    assert results[3].error.stage == "validate"
+    assert results[4].error.stage == "load"
+    for payload, result in zip(payloads, results):
+        if result.ok:
+            expected = convert_to_many(
+                "codemeta", ["codemeta", "cff"], json.loads(payload)
+            )
+            assert result.outputs["codemeta"] == expected["codemeta"].json().encode()
+            assert result.outputs["cff"] == expected["cff"].yaml().encode()
+
+
+def test_convert_payloads_limits():
+    payloads = [(CODEMETA_DIR / name).read_text() for name in CONVERTIBLE]
+    limits = RecordLimits(max_bytes=min(len(payload) for payload in payloads))
+    results = list(
+        convert_payloads("codemeta", "cff", payloads, workers=2, limits=limits)
+    )
+    over = [len(payload) > limits.max_bytes for payload in payloads]
+    assert [not result.ok for result in results] == over
+    assert {result.error.error_type for result in results if not result.ok} == {
+        "LimitExceeded"
+    }
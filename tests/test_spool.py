@@ -0,0 +1,155 @@
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import yaml
+from click.testing import CliRunner
+
+from codemeticulous.cli import cli
+from codemeticulous.spool import HEARTBEAT, SpoolWorker
+
+from .conftest import CODEMETA_DIR, CONVERTIBLE
+
+
+def fill_spool(spool: Path, invalid: bool = False) -> list[str]:
+    incoming = spool / "incoming"
+    incoming.mkdir(parents=True)
+    names = []
+    for i, name in enumerate(CONVERTIBLE):
+        shutil.copy(CODEMETA_DIR / name, incoming / f"project{i}.json")
+        names.append(f"project{i}.json")
+    if invalid:
+        shutil.copy(CODEMETA_DIR / "invalid/noname.json", incoming / "noname.json")
+        names.append("noname.json")
+    # being written by a producer, not ready yet
+    (incoming / ".partial.json").write_text("{")
+    return names
+
+
+def test_worker_converts_spool(tmp_path):
+    spool = tmp_path / "spool"
+    names = fill_spool(spool, invalid=True)
+    result = CliRunner().invoke(
+        cli,
+        [
+            "worker",
+            "-f",
+            "codemeta",
+            "-t",
+            "cff",
+            "--spool",
+            str(spool),
+            "--worker-id",
+            "w1",
+            "--exit-when-empty",
+        ],
+    )
+    assert result.exit_code == 1, result.output
+    assert "Converted 3 of 4 files" in result.output
+    assert sorted(os.listdir(spool / "done")) == sorted(names[:3])
+    assert sorted(os.listdir(spool / "failed")) == ["noname.json", "noname.json.error"]
+    assert "ValidationError" in (spool / "failed" / "noname.json.error").read_text()
+    assert os.listdir(spool / "incoming") == [".partial.json"]
+    assert os.listdir(spool / "claimed") == []
+    for i in range(3):
+        output = yaml.safe_load(
+            (spool / "output" / f"project{i}" / "CITATION.cff").read_text()
+        )
+        assert output["cff-version"] == "1.2.0"
+
+
+def test_workers_share_spool(tmp_path):
+    spool = tmp_path / "spool"
+    names = fill_spool(spool)
+    seen = []
+    workers = [
+        SpoolWorker(
+            str(spool),
+            "codemeta",
+            ["codemeta"],
+            worker_id=f"w{i}",
+            on_result=lambda name, error: seen.append(name),
+        )
+        for i in range(3)
+    ]
+    threads = [
+        threading.Thread(target=w.run, kwargs={"exit_when_empty": True})
+        for w in workers
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # every file is converted exactly once
+    assert sorted(seen) == sorted(names)
+    assert sum(w.stats.converted for w in workers) == len(names)
+    assert sorted(os.listdir(spool / "done")) == sorted(names)
+
+
+def test_worker_recovers_stale_claims(tmp_path):
+    spool = tmp_path / "spool"
+    names = fill_spool(spool)
+    # a worker that died while holding a claim
+    dead = spool / "claimed" / "dead"
+    dead.mkdir(parents=True)
+    os.rename(spool / "incoming" / names[0], dead / names[0])
+    (dead / HEARTBEAT).touch()
+    os.utime(dead / HEARTBEAT, (0, 0))
+
+    worker = SpoolWorker(str(spool), "codemeta", ["cff"], worker_id="w1", lease=60)
+    stats = worker.run(poll_interval=0, exit_when_empty=True)
+    assert stats.recovered == 1
+    assert stats.converted == len(names)
+    assert not dead.exists()
+
+
+def test_release_keeps_respooled_file(tmp_path):
+    spool = tmp_path / "spool"
+    names = fill_spool(spool)
+    dead = spool / "claimed" / "dead"
+    dead.mkdir(parents=True)
+    os.rename(spool / "incoming" / names[0], dead / names[0])
+    (dead / HEARTBEAT).touch()
+    os.utime(dead / HEARTBEAT, (0, 0))
+    # a producer spooled a file of the same name again before the claim expired
+    shutil.copy(CODEMETA_DIR / CONVERTIBLE[1], spool / "incoming" / names[0])
+    claimed = (dead / names[0]).read_bytes()
+    respooled = (spool / "incoming" / names[0]).read_bytes()
+    assert claimed != respooled
+
+    worker = SpoolWorker(str(spool), "codemeta", ["cff"], worker_id="w1", lease=60)
+    worker.start()
+    try:
+        assert worker.recover_stale_claims() == 0
+    finally:
+        worker.close()
+    assert (spool / "incoming" / names[0]).read_bytes() == respooled
+    assert (dead / names[0]).read_bytes() == claimed
+
+    # the respooled file was taken, and the dead worker's lease expired again
+    os.unlink(spool / "incoming" / names[0])
+    os.utime(dead, (0, 0))
+    worker = SpoolWorker(str(spool), "codemeta", ["cff"], worker_id="w1", lease=60)
+    stats = worker.run(poll_interval=0, exit_when_empty=True)
+    assert stats.recovered == 1
+    assert stats.converted == len(names)
+    assert not dead.exists()
+
+
+def test_worker_keeps_live_claims(tmp_path):
+    spool = tmp_path / "spool"
+    names = fill_spool(spool)
+    live = spool / "claimed" / "live"
+    live.mkdir(parents=True)
+    os.rename(spool / "incoming" / names[0], live / names[0])
+    (live / HEARTBEAT).touch()
+
+    worker = SpoolWorker(str(spool), "codemeta", ["cff"], worker_id="w1", lease=60)
+    worker.start()
+    try:
+        assert worker.recover_stale_claims() == 0
+        assert worker.pending_claims()
+    finally:
+        worker.close()
+    assert (live / names[0]).exists()
@@ -0,0 +1,112 @@
+import importlib
+import io
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+from click.testing import CliRunner
+
+from codemeticulous.cli import cli
+from codemeticulous.convert import convert, iter_convert
+from codemeticulous.files import RecordLine, RecordLoadError, iter_records
+
+from .conftest import load_records
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def ndjson(records):
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+
+def test_iter_convert_matches_convert():
+    records = load_records()
+    converted = list(iter_convert("codemeta", "cff", iter(records)))
+    assert [c.json() for c in converted] == [
+        convert("codemeta", "cff", r).json() for r in records
+    ]
+
+
+def test_iter_convert_on_error():
+    records = load_records()
+    records.insert(1, {"description": "missing a name"})
+    errors = []
+    converted = list(
+        iter_convert("codemeta", "cff", records, on_error=lambda i, e: errors.append(i))
+    )
+    assert len(converted) == 3
+    assert errors == [1]
+    with pytest.raises(Exception):
+        list(iter_convert("codemeta", "cff", records))
+
+
+def test_iter_records_ndjson():
+    stream = io.StringIO('{"name": "a"}\n\n{bad\n{"name": "b"}\n')
+    records = list(iter_records(stream, "json"))
+    assert records[0] == {"name": "a"}
+    assert isinstance(records[1], RecordLoadError)
+    assert records[1].payload == "{bad\n"
+    assert records[2] == {"name": "b"}
+
+
+def test_iter_records_unparsed_lines():
+    stream = io.StringIO('{"name": "a"}\n\n{bad\n')
+    records = list(iter_records(stream, "json", parse_lines=False))
+    assert records == ['{"name": "a"}\n', "{bad\n"]
+    assert all(isinstance(record, RecordLine) for record in records)
+    # JSON arrays are still parsed as they are read
+    stream = io.StringIO('[{"name": "a"}, "b"]')
+    records = list(iter_records(stream, "json", parse_lines=False))
+    assert records == [{"name": "a"}, "b"]
+    assert not isinstance(records[1], RecordLine)
+
+
+def test_iter_records_yaml_documents():
+    documents = [
+        yaml.safe_load((DATA_DIR / "cff" / "valid" / name).read_text())
+        for name in ["minimal.cff", "short.cff"]
+    ]
+    stream = io.StringIO(yaml.safe_dump_all(documents))
+    assert list(iter_records(stream, "yaml")) == documents
+
+
+def test_cli_convert_ndjson_from_stdin():
+    records = load_records()
+    records.append({"description": "missing a name"})
+    result = CliRunner().invoke(
+        cli,
+        ["convert", "--ndjson", "-f", "codemeta", "-t", "cff", "-"],
+        input=ndjson(records),
+    )
+    assert result.exit_code == 1
+    lines = [line for line in result.stdout.splitlines() if line]
+    assert len(lines) == 3
+    assert json.loads(lines[0])["cff-version"] == "1.2.0"
+    assert "Failed to convert record 3" in result.stderr
+
+
+def test_cli_validate_ndjson(tmp_path):
+    corpus = tmp_path / "corpus.ndjson"
+    corpus.write_text(ndjson(load_records()))
+    result = CliRunner().invoke(
+        cli, ["validate", "--ndjson", "-f", "codemeta", str(corpus)]
+    )
+    assert result.exit_code == 0
+    assert "3 of 3 records are valid" in result.output
+
+
+def test_convert_to_many_canonicalizes_once(monkeypatch):
+    # codemeticulous.convert resolves to the function, so get the module itself
+    convert_module = importlib.import_module("codemeticulous.convert")
+    calls = []
+    to_canonical = convert_module.to_canonical
+    monkeypatch.setattr(
+        convert_module,
+        "to_canonical",
+        lambda *args: calls.append(args) or to_canonical(*args),
+    )
+    record = load_records()[0]
+    converted = convert_module.convert_to_many("codemeta", ["cff", "codemeta"], record)
+    assert len(calls) == 1
+    assert converted["cff"].json() == convert("codemeta", "cff", record).json()
@@ -0,0 +1,143 @@
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous.cli import cli
+from codemeticulous.sync import (
+    STATE_FILE,
+    SyncConfigError,
+    load_config,
+    sync,
+    write_atomic,
+    write_if_changed,
+)
+
+from .conftest import VALID
+
+CONFIG = """\
+sources:
+  codemeta.json:
+    to:
+      cff: CITATION.cff
+      codemeta: meta/codemeta.json
+"""
+
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / "codemeta.json").write_text(json.dumps(VALID))
+    (tmp_path / ".codemeticulous.yml").write_text(CONFIG)
+    return tmp_path
+
+
+def test_load_config(repo):
+    config = load_config(str(repo / ".codemeticulous.yml"))
+    (source,) = config.sources
+    assert source.format == "codemeta"
+    assert source.targets["cff"] == str(repo / "CITATION.cff")
+    assert config.state_path == str(repo / STATE_FILE)
+
+    (repo / "bad.yml").write_text("sources:\n  metadata.json:\n    to: {cff: x.cff}\n")
+    with pytest.raises(SyncConfigError, match='set its "from"'):
+        load_config(str(repo / "bad.yml"))
+    with pytest.raises(SyncConfigError, match="Failed to read"):
+        load_config(str(repo / "missing.yml"))
+
+
+def test_write_if_changed(tmp_path):
+    path = str(tmp_path / "file")
+    assert write_if_changed(path, b"abc")
+    os.chmod(path, 0o600)
+    mtime = os.stat(path).st_mtime_ns
+    assert not write_if_changed(path, b"abc")
+    assert os.stat(path).st_mtime_ns == mtime
+    assert write_if_changed(path, b"abd")
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert os.listdir(tmp_path) == ["file"]
+
+
+def test_write_atomic(tmp_path, monkeypatch):
+    path = tmp_path / "new" / "file"
+    umask = os.umask(0o022)
+    try:
+        write_atomic(str(path), b"abc")
+    finally:
+        os.umask(umask)
+    assert path.read_bytes() == b"abc"
+    # created like open() creates files, not private like temporary files
+    assert path.stat().st_mode & 0o777 == 0o644
+
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd) or fsync(fd))
+    write_atomic(str(path), b"abd")
+    assert path.read_bytes() == b"abd"
+    # the file, then the directory it was renamed in
+    assert len(synced) == 2
+
+    monkeypatch.setattr(os, "replace", lambda *args: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        write_atomic(str(path), b"abe")
+    assert path.read_bytes() == b"abd"
+    assert os.listdir(path.parent) == ["file"]
+
+
+def test_sync_skips_unchanged(repo):
+    config = load_config(str(repo / ".codemeticulous.yml"))
+    (result,) = sync(config)
+    assert result.ok and len(result.written) == 2
+    cff = repo / "CITATION.cff"
+    assert "cff-version" in cff.read_text()
+    assert json.loads((repo / STATE_FILE).read_text())["sources"]["codemeta.json"]
+
+    (result,) = sync(config)
+    assert result.skipped and not result.written
+
+    # same output bytes, nothing is rewritten
+    (repo / "codemeta.json").write_text(json.dumps(VALID, indent=2))
+    mtime = cff.stat().st_mtime_ns
+    (result,) = sync(config)
+    assert not result.skipped and not result.written and len(result.unchanged) == 2
+    assert cff.stat().st_mtime_ns == mtime
+
+    (repo / "codemeta.json").write_text(json.dumps(dict(VALID, name="renamed")))
+    (result,) = sync(config)
+    assert result.written == (str(cff), str(repo / "meta/codemeta.json"))
+
+    # a deleted target is regenerated
+    cff.unlink()
+    (result,) = sync(config)
+    assert result.written == (str(cff),)
+
+
+def test_sync_failure_is_retried(repo):
+    config = load_config(str(repo / ".codemeticulous.yml"))
+    (repo / "codemeta.json").write_text("{not json")
+    (result,) = sync(config)
+    assert not result.ok
+    assert json.loads((repo / STATE_FILE).read_text())["sources"] == {}
+    assert not (repo / "CITATION.cff").exists()
+
+
+def test_cli_sync(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    result = CliRunner().invoke(cli, ["sync"])
+    assert result.exit_code == 0, result.output
+    assert "Updated" in result.output and "CITATION.cff" in result.output
+
+    result = CliRunner().invoke(cli, ["sync", "-v"])
+    assert result.exit_code == 0, result.output
+    assert "unchanged since last sync" in result.output
+
+    result = CliRunner().invoke(cli, ["sync", "--force", "-v"])
+    assert "is up to date" in result.output and "Updated" not in result.output
+
+    (repo / "codemeta.json").write_text("{not json")
+    result = CliRunner().invoke(cli, ["sync", str(repo / ".codemeticulous.yml")])
+    assert result.exit_code == 1
+    assert "Failed to sync" in result.output
+
+    result = CliRunner().invoke(cli, ["sync", "missing.yml"])
+    assert result.exit_code == 2
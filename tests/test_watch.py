@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from codemeticulous.cli import cli
+from codemeticulous.watch import (
+    InotifyWatcher,
+    PollWatcher,
+    SourceWatcher,
+    open_watcher,
+    sources_for,
+)
+
+from .conftest import VALID
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def watchers(paths):
+    yield PollWatcher(paths, interval=0.01)
+    watcher = open_watcher(paths)
+    if isinstance(watcher, InotifyWatcher):
+        yield watcher
+
+
+def test_watchers_see_changes(tmp_path):
+    path = tmp_path / "codemeta.json"
+    path.write_text("{}")
+    for watcher in watchers([str(path)]):
+        try:
+            assert watcher.changes(0.05) == set()
+            (tmp_path / "other.json").write_text("{}")
+            assert watcher.changes(0.05) == set()
+            path.write_text('{"name": "x"}')
+            assert watcher.changes(1) == {str(path)}
+            # saved by renaming a new file over it
+            (tmp_path / "new.json").write_text('{"name": "y"}')
+            os.replace(tmp_path / "new.json", path)
+            assert str(path) in watcher.changes(1)
+        finally:
+            watcher.close()
+
+
+def test_sources_for(tmp_path):
+    (source,) = sources_for([str(tmp_path / "codemeta.json")], ["cff"])
+    assert source.format == "codemeta"
+    assert source.targets == {"cff": str(tmp_path / "CITATION.cff")}
+    with pytest.raises(ValueError, match="--from"):
+        sources_for([str(tmp_path / "metadata.json")], ["cff"])
+    with pytest.raises(ValueError, match="its own"):
+        sources_for([str(tmp_path / "codemeta.json")], ["codemeta"])
+
+
+@pytest.mark.parametrize("poll_interval", [0.02, None])
+def test_source_watcher(tmp_path, poll_interval):
+    repos = [tmp_path / "a", tmp_path / "b"]
+    for repo in repos:
+        repo.mkdir()
+        (repo / "codemeta.json").write_text(json.dumps(VALID))
+    results = []
+    watcher = SourceWatcher(
+        sources_for([str(repo / "codemeta.json") for repo in repos], ["cff"]),
+        debounce=0.1,
+        poll_interval=poll_interval,
+        on_sync=results.append,
+    )
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    try:
+        wait_for(lambda: watcher.runs == 2)
+        cff = repos[0] / "CITATION.cff"
+        assert "cff-version" in cff.read_text()
+
+        # a burst of saves is converted once, and only the source that changed is
+        for i in range(5):
+            (repos[0] / "codemeta.json").write_text(
+                json.dumps(dict(VALID, name=f"renamed {i}"))
+            )
+            time.sleep(0.01)
+        wait_for(lambda: "renamed 4" in cff.read_text())
+        time.sleep(0.3)
+        assert watcher.runs == 3
+        assert results[-1].source.path == str(repos[0] / "codemeta.json")
+
+        # touching a source without changing it doesn't convert it
+        os.utime(repos[1] / "codemeta.json")
+        wait_for(lambda: len(results) == 4)
+        assert results[-1].skipped and watcher.runs == 3
+    finally:
+        watcher.stop()
+        thread.join()
+
+
+def test_cli_watch_usage(tmp_path):
+    result = CliRunner().invoke(cli, ["watch", str(tmp_path / "codemeta.json")])
+    assert result.exit_code == 2
+    result = CliRunner().invoke(
+        cli, ["watch", "--config", str(tmp_path / "missing.yml")]
+    )
+    assert result.exit_code == 2
+    result = CliRunner().invoke(
+        cli, ["watch", "-t", "cff", str(tmp_path / "metadata.json")]
+    )
+    assert result.exit_code == 2 and "--from" in result.output
@@ -0,0 +1,74 @@
+import io
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from codemeticulous import mixins
+from codemeticulous.cli import cli
+from codemeticulous.convert import convert_to_many
+
+from .conftest import STANDARDS, VALID, discover_test_files
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def pytest_generate_tests(metafunc):
+    if "valid_test_case" in metafunc.fixturenames:
+        test_cases = []
+        test_ids = []
+        for model_name in STANDARDS.keys():
+            for file_path in discover_test_files(DATA_DIR, model_name, "valid"):
+                test_cases.append((model_name, file_path))
+                test_ids.append(f"{model_name}/valid/{file_path.name}")
+        metafunc.parametrize("valid_test_case", test_cases, ids=test_ids)
+
+
+def test_write_matches_dump(valid_test_case, load_model_data, monkeypatch):
+    model_name, file_path = valid_test_case
+    model_class, data, _ = load_model_data(model_name, file_path)
+    model_instance = model_class(**data)
+    # several chunks even for small records
+    monkeypatch.setattr(mixins, "WRITE_CHUNK_SIZE", 64)
+    for format in ("json", "yaml"):
+        file = io.StringIO()
+        getattr(model_instance, f"write_{format}")(file)
+        assert file.getvalue() == getattr(model_instance, format)()
+
+
+class CountingWriter(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+def test_write_json_in_chunks(monkeypatch):
+    record = dict(VALID, keywords=[f"keyword {i}" for i in range(5000)])
+    converted = convert_to_many("codemeta", ["codemeta"], record)["codemeta"]
+    monkeypatch.setattr(mixins, "WRITE_CHUNK_SIZE", 1024)
+    file = CountingWriter()
+    converted.write_json(file)
+    assert file.getvalue() == converted.json()
+    assert file.writes > len(converted.json()) // 1024 // 2
+
+
+def test_cli_writes_stdout_and_files(tmp_path):
+    input_file = DATA_DIR / "codemeta/valid/codemetar.json"
+    converted = convert_to_many("codemeta", ["cff"], VALID)["cff"]
+    result = CliRunner().invoke(
+        cli, ["convert", "-f", "codemeta", "-t", "cff", str(input_file)]
+    )
+    assert result.exit_code == 0, result.output
+    assert result.stdout == converted.yaml() + "\n"
+
+    output = tmp_path / "CITATION.cff"
+    result = CliRunner().invoke(
+        cli,
+        ["convert", "-f", "codemeta", "-t", "cff", "-o", str(output)]
+        + [str(input_file)],
+    )
+    assert result.exit_code == 0, result.output
+    assert output.read_text() == converted.yaml()